@@ -0,0 +1,386 @@
+"""
+DMX Audio Input
+Sound to light: PCM blocks from a WAV file, a pipe or a sound device, analysed with one FFT per
+block into band levels, onsets and beats that modulate channels
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
+
+from dmx_output import compile_lut
+
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 1024           # Samples per block and FFT; 23 ms at 44.1 kHz
+MAX_LATENCY = 0.1           # Seconds; older analysis is treated as silence instead of held
+LATENCY_HISTORY = 2048      # Frames kept for the latency percentiles
+
+DEFAULT_BANDS = {'bass': (20, 250), 'mid': (250, 2000), 'high': (2000, 16000)}
+PEAK_DECAY = 0.999          # Per block; automatic gain follows the loudest recent block down slowly
+RELEASE = 0.8               # Per block; levels rise at once and fall by this factor
+ONSET_HISTORY = 43          # Blocks in the adaptive onset threshold (about a second)
+ONSET_THRESHOLD = 1.5       # Flux above this multiple of the recent mean is an onset
+MIN_BEAT_GAP = 0.25         # Seconds between beats, 240 BPM at most
+PULSE_DECAY = 0.15          # Seconds for an onset/beat pulse to fall to about a third
+
+DEVICE_INPUT = 'device'
+PIPE_INPUT = '-'
+
+# Dimmer of the moving head follows the bass, like its own sound-active mode
+DEFAULT_MAPPINGS = [{'source': 'bass', 'channel': 6}]
+
+
+def pcm_to_float(data, sample_width, channels):
+    """Mono float32 samples in -1..1 from interleaved little-endian PCM"""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(values & 0x800000, values - 0x1000000, values).astype(np.float32) / 8388608.0
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class WAVReader:
+    """Blocks from a WAV file, optionally looped"""
+
+    realtime = True  # Paced by the clock, the file itself has no timing
+
+    def __init__(self, path, block_size=BLOCK_SIZE, loop=False):
+        self.path = path
+        self.block_size = block_size
+        self.loop = loop
+        with wave.open(path, 'rb') as f:
+            self.sample_rate = f.getframerate()
+
+    def blocks(self):
+        with wave.open(self.path, 'rb') as f:
+            width, channels = f.getsampwidth(), f.getnchannels()
+            while True:
+                data = f.readframes(self.block_size)
+                if len(data) < self.block_size * width * channels:
+                    if not self.loop:
+                        return
+                    f.rewind()
+                    continue
+                yield pcm_to_float(data, width, channels)
+
+
+class PipeReader:
+    """Blocks of raw signed 16-bit little-endian PCM from a stream, e.g. stdin"""
+
+    realtime = False  # Whoever writes the pipe sets the pace
+
+    def __init__(self, stream=None, sample_rate=SAMPLE_RATE, channels=1, block_size=BLOCK_SIZE):
+        self.stream = stream or sys.stdin.buffer
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+
+    def blocks(self):
+        size = self.block_size * 2 * self.channels
+        while True:
+            data = self.stream.read(size)
+            if not data or len(data) < size:
+                return
+            yield pcm_to_float(data, 2, self.channels)
+
+
+class AudioAnalyzer:
+    """Streaming analysis: band energies with automatic gain, spectral-flux onsets and beats"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=BLOCK_SIZE, bands=None):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.band_names = list(bands or DEFAULT_BANDS)
+        bands = bands or DEFAULT_BANDS
+        self.window = np.hanning(block_size).astype(np.float32)
+        freqs = np.fft.rfftfreq(block_size, 1.0 / sample_rate)
+        edges = []
+        for name in self.band_names:
+            low, high = bands[name]
+            start, end = np.searchsorted(freqs, (low, high))
+            edges.append((int(start), max(int(end), int(start) + 1)))
+        self.edges = edges
+        # Bass flux drives beats; the first band stands in when there is no 'bass' band
+        self.beat_band = edges[self.band_names.index('bass') if 'bass' in self.band_names else 0]
+
+        self.peaks = np.full(len(edges), 1e-9)
+        self.levels = np.zeros(len(edges))
+        self.peak_level = 1e-9
+        self.level = 0.0
+        self.previous = None
+        self.flux_history = deque(maxlen=ONSET_HISTORY)
+        self.beat_flux_history = deque(maxlen=ONSET_HISTORY)
+        self.onset_at = None
+        self.beat_at = None
+        self.beat_intervals = deque(maxlen=8)
+        self.bpm = 0.0
+        self.blocks = 0
+        self.latest = None  # (levels, onset time, beat time, block time), replaced whole so readers never see a mix
+
+    def process(self, samples, stamp):
+        """Analyse one block captured at stamp (the time its last sample arrived)"""
+        if len(samples) != self.block_size:
+            samples = np.resize(samples, self.block_size) if len(samples) else np.zeros(self.block_size)
+        magnitude = np.abs(np.fft.rfft(samples * self.window))
+        power = magnitude * magnitude
+
+        energies = np.array([power[start:end].mean() for start, end in self.edges])
+        self.peaks = np.maximum(energies, self.peaks * PEAK_DECAY)
+        self.levels = np.maximum(energies / self.peaks, self.levels * RELEASE)
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        self.peak_level = max(rms, self.peak_level * PEAK_DECAY)
+        self.level = max(rms / self.peak_level, self.level * RELEASE)
+
+        if self.previous is not None:
+            rise = np.maximum(magnitude - self.previous, 0.0)
+            if self._is_onset(float(rise.sum()), self.flux_history):
+                self.onset_at = stamp
+            start, end = self.beat_band
+            if self._is_onset(float(rise[start:end].sum()), self.beat_flux_history) and \
+                    (self.beat_at is None or stamp - self.beat_at >= MIN_BEAT_GAP):
+                if self.beat_at is not None:
+                    self.beat_intervals.append(stamp - self.beat_at)
+                    self.bpm = 60.0 / float(np.median(self.beat_intervals))
+                self.beat_at = stamp
+        self.previous = magnitude
+        self.blocks += 1
+
+        values = dict(zip(self.band_names, self.levels.tolist()))
+        values['level'] = self.level
+        self.latest = (values, self.onset_at, self.beat_at, stamp)
+
+    @staticmethod
+    def _is_onset(flux, history):
+        onset = len(history) == history.maxlen and flux > ONSET_THRESHOLD * (sum(history) / len(history)) + 1e-6
+        history.append(flux)
+        return onset
+
+    def values(self, now):
+        """(sources {name: 0-1}, block timestamp) with pulses decayed to now, None before the first block"""
+        latest = self.latest
+        if latest is None:
+            return None
+        values, onset_at, beat_at, stamp = latest
+        values = dict(values)
+        values['onset'] = 0.0 if onset_at is None else float(np.exp(-max(0.0, now - onset_at) / PULSE_DECAY))
+        values['beat'] = 0.0 if beat_at is None else float(np.exp(-max(0.0, now - beat_at) / PULSE_DECAY))
+        return values, stamp
+
+
+class AudioInput:
+    """Reads audio blocks on its own thread (or the sound device's) and analyses each one"""
+
+    def __init__(self, bands=None, block_size=BLOCK_SIZE, clock=time.monotonic, logger=None):
+        self.bands = bands
+        self.block_size = block_size
+        self.clock = clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.analyzer = None
+        self.source = None
+        self.running = False
+        self.thread = None
+        self.stream = None
+        self.dropped = 0
+
+    @staticmethod
+    def source_names():
+        return ([DEVICE_INPUT] if sounddevice is not None else []) + ['WAV file...']
+
+    def start(self, source, loop=False):
+        """Open 'device', '-' (raw PCM on stdin) or the path of a WAV file"""
+        self.stop()
+        if source == DEVICE_INPUT:
+            self._start_device()
+        else:
+            reader = PipeReader(block_size=self.block_size) if source == PIPE_INPUT else \
+                WAVReader(source, self.block_size, loop)
+            self.analyzer = AudioAnalyzer(reader.sample_rate, self.block_size, self.bands)
+            self.running = True
+            self.thread = threading.Thread(target=self._run, args=(reader,), name="audio-input", daemon=True)
+            self.thread.start()
+        self.source = source
+        self.logger.info(f"Audio input: {source} ({self.analyzer.sample_rate} Hz, "
+                         f"{self.block_size / self.analyzer.sample_rate * 1000:.1f} ms blocks)")
+
+    def _start_device(self):
+        if sounddevice is None:
+            raise RuntimeError("Sound device input needs the 'sounddevice' package")
+        sample_rate = int(sounddevice.query_devices(kind='input')['default_samplerate'])
+        self.analyzer = AudioAnalyzer(sample_rate, self.block_size, self.bands)
+
+        def callback(indata, frames, timing, status):
+            if status:
+                self.dropped += 1
+            self.analyzer.process(indata.mean(axis=1), self.clock())
+
+        self.stream = sounddevice.InputStream(samplerate=sample_rate, blocksize=self.block_size, channels=1,
+                                              dtype='float32', latency='low', callback=callback)
+        self.stream.start()
+        self.running = True
+
+    def _run(self, reader):
+        duration = self.block_size / reader.sample_rate
+        next_block = self.clock()
+        try:
+            for block in reader.blocks():
+                if not self.running:
+                    break
+                if reader.realtime:
+                    # A block is available once its last sample would have arrived
+                    next_block += duration
+                    delay = next_block - self.clock()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif delay < -duration:
+                        self.dropped += 1
+                        next_block = self.clock()
+                        continue
+                self.analyzer.process(block, self.clock())
+        except (OSError, ValueError, EOFError) as e:
+            self.logger.error(f"Audio input error: {e}")
+        self.running = False
+        self.logger.info(f"Audio input ended: {self.source}")
+
+    def stop(self):
+        self.running = False
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+
+    def values(self, now):
+        return self.analyzer.values(now) if self.analyzer is not None else None
+
+
+class AudioModulation:
+    """Maps analysis sources to channels once per output frame (scheduler source) and measures latency"""
+
+    def __init__(self, controllers, audio, mappings=None, patch=None, max_latency=MAX_LATENCY, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.audio = audio
+        self.max_latency = max_latency
+        self.logger = logger or logging.getLogger(__name__)
+        self.enabled = False
+        self.latencies = np.zeros(LATENCY_HISTORY)
+        self.latency_count = 0
+        self.stale_frames = 0
+        self.last_values = {}
+        self.set_mappings(DEFAULT_MAPPINGS if mappings is None else mappings, patch)
+
+    @classmethod
+    def from_config(cls, config, controllers, audio, patch=None, logger=None):
+        settings = config.get('audio', {})
+        return cls(controllers, audio, settings.get('mappings'), patch,
+                   settings.get('max_latency', MAX_LATENCY), logger)
+
+    def set_mappings(self, mappings, patch=None):
+        """Compile mappings to (source, (universe, channel), lookup table)"""
+        compiled = []
+        for entry in mappings:
+            try:
+                if 'attribute' in entry:
+                    fixture = patch.fixture(entry['fixture'])
+                    key = (fixture.universe, fixture.channel(entry['attribute']))
+                else:
+                    key = (int(entry.get('universe', 1)), int(entry['channel']))
+                lut = compile_lut(entry.get('curve', 'linear'), entry.get('min', 0), entry.get('max', 255),
+                                  entry.get('invert', False))
+            except (KeyError, ValueError, AttributeError) as e:
+                self.logger.warning(f"Skipping audio mapping {entry}: {e}")
+                continue
+            compiled.append((entry.get('source', 'level'), key, lut))
+        self.mappings = compiled
+
+    def on_frame(self, now):
+        """Write the mapped sources; analysis older than max_latency counts as silence"""
+        if not self.enabled:
+            return
+        result = self.audio.values(now)
+        if result is None:
+            return
+        values, stamp = result
+        latency = now - stamp
+        if latency > self.max_latency:
+            self.stale_frames += 1
+            values = {}
+        else:
+            self.latencies[self.latency_count % LATENCY_HISTORY] = latency
+            self.latency_count += 1
+
+        writes = {}
+        for source, (universe, channel), lut in self.mappings:
+            level = min(1.0, max(0.0, values.get(source, 0.0)))
+            writes.setdefault(universe, {})[channel] = int(lut[int(level * 255 + 0.5)])
+        for universe, channels in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None:
+                controller.set_channels(channels)
+        self.last_values = values
+
+    def latency_stats(self):
+        """(p50, p99, max) block-to-frame latency in ms over recent frames, None before any"""
+        count = min(self.latency_count, LATENCY_HISTORY)
+        if not count:
+            return None
+        latencies = self.latencies[:count] * 1000.0
+        return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)), float(latencies.max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse audio the way the sound-to-light input does")
+    parser.add_argument('source', help="WAV file, '-' for raw 16-bit mono PCM on stdin, or 'device'")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    parser.add_argument('--rate', type=int, default=40, help="Simulated output frame rate")
+    args = parser.parse_args()
+
+    audio = AudioInput(block_size=args.block_size)
+    modulation = AudioModulation({}, audio)
+    modulation.enabled = True
+    audio.start(args.source)
+    interval = 1.0 / args.rate
+    frames = 0
+    try:
+        while audio.running:
+            time.sleep(interval)
+            now = audio.clock()
+            modulation.on_frame(now)
+            frames += 1
+            if frames % args.rate == 0 and modulation.last_values:
+                values = modulation.last_values
+                print("  ".join(f"{name} {values.get(name, 0.0):4.2f}"
+                                for name in audio.analyzer.band_names + ['level', 'beat']) +
+                      f"  {audio.analyzer.bpm:5.1f} BPM")
+    except KeyboardInterrupt:
+        pass
+    audio.stop()
+    stats = modulation.latency_stats()
+    if stats is not None:
+        print(f"block to frame latency: p50 {stats[0]:.1f} ms, p99 {stats[1]:.1f} ms, max {stats[2]:.1f} ms; "
+              f"{audio.analyzer.blocks} blocks, {audio.dropped} dropped, {modulation.stale_frames} stale frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+DMX Cluster
+Several controller PCs sharing universes over UDP: the leader sends deltas, keyframes and its
+frame clock every frame, followers apply them phase-aligned, and a follower takes over when
+the leader goes quiet
+"""
+import argparse
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from dmx_recorder import (diff_runs, encode_runs, apply_runs, runs_size, RUN_COUNT, RUN_HEADER,
+                          KIND_KEYFRAME, KIND_DELTA, UNIVERSE_SIZE)
+
+CLUSTER_MAGIC = b'DMXC'
+CLUSTER_VERSION = 2
+# magic, version, kind, priority, incarnation (random per node start), sequence, frame, leader time
+PACKET_HEADER = struct.Struct('<4sBBBxIIQd')
+ENTRY_HEADER = struct.Struct('<HB')          # universe, keyframe or delta; a run list follows
+REQUEST_COUNT = struct.Struct('<H')          # universes asked for; universe numbers follow as '<H'
+
+PACKET_FRAME = 0        # Leader -> followers: the universes of one frame (possibly none: a clock tick)
+PACKET_REQUEST = 1      # Follower -> leader: send keyframes of these universes
+
+DEFAULT_CLUSTER_PORT = 6455
+MAX_DATAGRAM = 1400         # Stay under the Ethernet MTU; a frame that needs more is split
+KEYFRAME_FRAMES = 40        # Each universe is sent whole at least this often, staggered across frames
+PLAYOUT_DELAY = 0.005       # Seconds followers wait past the estimated arrival time, absorbs jitter
+OFFSET_WINDOW = 200         # Arrivals used for the clock offset (their minimum is the least-delayed one)
+FAILOVER_TIMEOUT = 0.5      # Seconds of silence before the first backup takes over
+FAILOVER_STEP = 0.25        # Extra wait per priority step, so backups take over one at a time
+REQUEST_INTERVAL = 0.1      # Minimum seconds between keyframe requests
+PHASE_GAIN = 0.2            # Fraction of the phase error corrected per frame
+PHASE_MARGIN = 0.001        # Followers render this long after the aligned data is due
+
+ROLE_LEADER = 'leader'
+ROLE_FOLLOWER = 'follower'
+
+
+def parse_address(text, default_port=DEFAULT_CLUSTER_PORT):
+    host, _, port = text.rpartition(':')
+    return (host, int(port)) if host else (text, default_port)
+
+
+def encode_frame_packets(priority, incarnation, sequence, frame_number, leader_time, entries):
+    """Pack (universe, kind, runs) entries into datagrams; returns (packets, next sequence)"""
+    packets = []
+    body = bytearray()
+    for universe, kind, runs in entries:
+        entry = ENTRY_HEADER.pack(universe, kind) + runs
+        if body and PACKET_HEADER.size + len(body) + len(entry) > MAX_DATAGRAM:
+            packets.append(PACKET_HEADER.pack(CLUSTER_MAGIC, CLUSTER_VERSION, PACKET_FRAME, priority, incarnation,
+                                              sequence & 0xFFFFFFFF, frame_number, leader_time) + body)
+            sequence += 1
+            body = bytearray()
+        body += entry
+    packets.append(PACKET_HEADER.pack(CLUSTER_MAGIC, CLUSTER_VERSION, PACKET_FRAME, priority, incarnation,
+                                      sequence & 0xFFFFFFFF, frame_number, leader_time) + body)
+    return packets, sequence + 1
+
+
+def decode_entries(payload, offset=PACKET_HEADER.size):
+    """[(universe, kind, payload, runs offset)] of a frame packet"""
+    entries = []
+    while offset < len(payload):
+        universe, kind = ENTRY_HEADER.unpack_from(payload, offset)
+        offset += ENTRY_HEADER.size
+        entries.append((universe, kind, payload, offset))
+        offset += runs_size(payload, offset)
+    return entries
+
+
+class ClusterNode:
+    """One controller of the cluster, hooked into its output scheduler"""
+
+    def __init__(self, name, nodes, controllers, scheduler, playout_delay=PLAYOUT_DELAY,
+                 failover_timeout=FAILOVER_TIMEOUT, logger=None):
+        if name not in nodes:
+            raise ValueError(f"Cluster node '{name}' is not in the node list")
+        self.name = name
+        self.nodes = nodes              # name -> ((host, port), priority)
+        self.address, self.priority = nodes[name]
+        self.peers = [address for other, (address, _) in nodes.items() if other != name]
+        self.controllers = controllers  # universe -> DMXController
+        self.scheduler = scheduler
+        self.clock = scheduler.clock
+        self.playout_delay = playout_delay
+        self.failover_timeout = failover_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.socket = None
+        self.thread = None
+        self.running = False
+
+        # The best priority starts as leader, everyone else follows
+        self.role = ROLE_LEADER if self.priority == min(p for _, p in nodes.values()) else ROLE_FOLLOWER
+        self.rank = sorted({p for _, p in nodes.values()}).index(self.priority)
+
+        # Leader state; a restarted node sends under a new incarnation, so followers reset its sequence
+        self.incarnation = random.getrandbits(32)
+        self.sequence = 0
+        self.sent = {}                  # universe -> last frame sent
+        self.requested = set()          # universes to send whole on the next frame
+        self.packets_sent = 0
+
+        # Follower state
+        self.leader = None              # (priority, address) of the node we follow
+        self.leader_incarnation = None
+        self.last_sequence = None
+        self.last_heard = None
+        self.pending = deque()          # (due, entries) in arrival order
+        self.offsets = deque(maxlen=OFFSET_WINDOW)
+        self.offset = None
+        self.last_leader_time = None
+        self.stale = set()              # universes that missed a delta, waiting for a keyframe
+        self.last_request = 0.0
+        self.lost = 0
+        self.keyframes = 0
+        self.phase_error = 0.0
+        self.failovers = 0
+
+    @classmethod
+    def from_config(cls, config, controllers, scheduler, logger=None):
+        settings = config['cluster']
+        nodes = {name: (parse_address(options['address']), int(options.get('priority', 0)))
+                 for name, options in settings['nodes'].items()}
+        return cls(settings['node'], nodes, controllers, scheduler, settings.get('playout_delay', PLAYOUT_DELAY),
+                   settings.get('failover_timeout', FAILOVER_TIMEOUT), logger)
+
+    def start(self):
+        """Bind this node's address and join the scheduler"""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Loopback addresses bind to loopback so several nodes can run on one machine
+        host = self.address[0] if self.address[0] in ('127.0.0.1', 'localhost') else ''
+        self.socket.bind((host, self.address[1]))
+        self.socket.settimeout(0.2)
+        self.running = True
+        self.last_heard = self.clock()
+        self.thread = threading.Thread(target=self._receive_loop, name="cluster-receive", daemon=True)
+        self.thread.start()
+        self.scheduler.add_source(self.on_frame)
+        self.scheduler.add_listener(self.on_sent)
+        self.logger.info(f"Cluster node '{self.name}' on {self.address[0]}:{self.address[1]} as {self.role}")
+
+    def stop(self):
+        self.running = False
+        self.scheduler.remove_source(self.on_frame)
+        self.scheduler.remove_listener(self.on_sent)
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    # Leader
+
+    def on_sent(self, now, frames):
+        """Send this frame's universes to the other nodes (scheduler listener)"""
+        if self.role != ROLE_LEADER or self.socket is None:
+            return
+        frame_number = self.scheduler.frame_number
+        with self.lock:
+            requested, self.requested = self.requested, set()
+        entries = []
+        # Universes before the output stage, like the recorder: every node applies its own curves and masters
+        for index, (universe, frame) in enumerate(sorted(self.scheduler.source_frames.items())):
+            last = self.sent.get(universe)
+            if last is None or universe in requested or (frame_number + index) % KEYFRAME_FRAMES == 0:
+                entries.append((universe, KIND_KEYFRAME, encode_runs([(0, bytes(frame))])))
+            elif frame != last:
+                entries.append((universe, KIND_DELTA, encode_runs(diff_runs(last, frame))))
+            else:
+                continue
+            self.sent[universe] = bytes(frame)
+        packets, self.sequence = encode_frame_packets(self.priority, self.incarnation, self.sequence,
+                                                      frame_number, now, entries)
+        for packet in packets:
+            for peer in self.peers:
+                try:
+                    self.socket.sendto(packet, peer)
+                except OSError:
+                    pass  # A peer that is down must not stop the others
+        self.packets_sent += len(packets)
+
+    # Receiving
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                packet, sender = self.socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self.running:
+                    continue  # ICMP port unreachable from a peer that is down, on some systems
+                return
+            if len(packet) < PACKET_HEADER.size:
+                continue
+            magic, version, kind, priority, incarnation, sequence, frame_number, leader_time = \
+                PACKET_HEADER.unpack_from(packet)
+            if magic != CLUSTER_MAGIC or version != CLUSTER_VERSION:
+                continue
+            try:
+                if kind == PACKET_FRAME:
+                    self._on_frame_packet(packet, sender, priority, incarnation, sequence, leader_time)
+                elif kind == PACKET_REQUEST and self.role == ROLE_LEADER:
+                    count, = REQUEST_COUNT.unpack_from(packet, PACKET_HEADER.size)
+                    universes = struct.unpack_from(f'<{count}H', packet, PACKET_HEADER.size + REQUEST_COUNT.size)
+                    with self.lock:
+                        self.requested.update(universes)
+            except struct.error as e:
+                self.logger.debug(f"Cluster: bad packet from {sender}: {e}")
+
+    def _on_frame_packet(self, packet, sender, priority, incarnation, sequence, leader_time):
+        now = self.clock()
+        leader = (priority, sender)
+        with self.lock:
+            if self.role == ROLE_LEADER:
+                if (priority, sender) < (self.priority, self.address):
+                    # A better leader is back: follow it
+                    self.role = ROLE_FOLLOWER
+                    self.logger.warning(f"Cluster: leader with priority {priority} at {sender[0]}:{sender[1]}, "
+                                        f"following it")
+                else:
+                    return
+            if leader != self.leader or incarnation != self.leader_incarnation:
+                if leader != self.leader:
+                    self.logger.info(f"Cluster: following {sender[0]}:{sender[1]} (priority {priority})")
+                else:
+                    self.logger.warning(f"Cluster: leader at {sender[0]}:{sender[1]} restarted, resyncing")
+                self.leader = leader
+                self.leader_incarnation = incarnation
+                self.last_sequence = None
+                self.offsets.clear()
+                self.pending.clear()
+                self.stale = set(self.controllers)
+            # Any packet from the leader shows it is alive, even one that is dropped below
+            self.last_heard = now
+            if self.last_sequence is not None:
+                gap = (sequence - self.last_sequence - 1) & 0xFFFFFFFF
+                if gap >= 0x80000000:
+                    return  # Late or duplicated: its deltas are older than what was applied
+                if gap:
+                    self.lost += gap
+                    self.stale = set(self.controllers)
+            self.last_sequence = sequence
+
+            # Least-delayed arrival over the window: leader clock -> local clock, including the network latency
+            self.offsets.append(now - leader_time)
+            self.offset = min(self.offsets)
+            self.last_leader_time = leader_time
+            self.pending.append((leader_time + self.offset + self.playout_delay, decode_entries(packet)))
+
+    # Follower
+
+    def on_frame(self, now):
+        """Apply the leader's frames that are due, keep the frame phase locked (scheduler source)"""
+        if self.role == ROLE_LEADER:
+            return
+        with self.lock:
+            if self.last_heard is not None and \
+                    now - self.last_heard > self.failover_timeout + self.rank * FAILOVER_STEP:
+                self._promote(now)
+                return
+            due = []
+            while self.pending and self.pending[0][0] <= now + PHASE_MARGIN:
+                due.append(self.pending.popleft()[1])
+            last_leader_time, offset = self.last_leader_time, self.offset
+
+        cleared = set()
+        for entries in due:
+            for universe, kind, payload, offset_in_packet in entries:
+                controller = self.controllers.get(universe)
+                if controller is None:
+                    continue
+                if kind == KIND_KEYFRAME:
+                    frame = bytearray(UNIVERSE_SIZE)
+                    apply_runs(frame, payload, offset_in_packet)
+                    controller.apply_frame(frame)
+                    self.keyframes += 1
+                    cleared.add(universe)
+                else:
+                    # Run by run, so only the changed channels are marked dirty in the controller
+                    count, = RUN_COUNT.unpack_from(payload, offset_in_packet)
+                    position = offset_in_packet + RUN_COUNT.size
+                    for _ in range(count):
+                        start, length = RUN_HEADER.unpack_from(payload, position)
+                        position += RUN_HEADER.size
+                        controller.set_range(start + 1, payload[position:position + length])
+                        position += length
+        with self.lock:
+            self.stale -= cleared
+            stale = sorted(self.stale)
+
+        if stale and now - self.last_request >= REQUEST_INTERVAL and self.leader is not None:
+            self._request_keyframes(stale)
+            self.last_request = now
+        if last_leader_time is not None:
+            self._align(now, last_leader_time + offset + self.playout_delay)
+
+    def _align(self, now, due):
+        # Shift the local frame deadlines so frames render just after the leader's frames are due
+        interval = self.scheduler.interval
+        error = (now - due - PHASE_MARGIN) % interval
+        if error > interval / 2:
+            error -= interval
+        self.phase_error = error
+        shift = -error * PHASE_GAIN
+        self.scheduler.phase_shift = max(-interval / 4, min(interval / 4, shift))
+
+    def _request_keyframes(self, universes):
+        packet = (PACKET_HEADER.pack(CLUSTER_MAGIC, CLUSTER_VERSION, PACKET_REQUEST, self.priority, self.incarnation,
+                                     0, 0, 0.0) +
+                  REQUEST_COUNT.pack(len(universes)) + struct.pack(f'<{len(universes)}H', *universes))
+        try:
+            self.socket.sendto(packet, self.leader[1])
+        except OSError:
+            pass
+
+    def _promote(self, now):
+        # Called with the lock held; the universes as last applied are what the new leader sends
+        self.role = ROLE_LEADER
+        self.failovers += 1
+        self.leader = None
+        self.pending.clear()
+        self.sent = {}
+        self.logger.error(f"Cluster: leader silent for {now - self.last_heard:.2f}s, "
+                          f"'{self.name}' takes over as leader")
+
+    def status(self, now):
+        """One-line description for the GUI and the command line"""
+        if self.role == ROLE_LEADER:
+            return f"Leader, {self.packets_sent} packets sent"
+        if self.last_sequence is None:
+            return "Follower, waiting for the leader"
+        return (f"Follower, heard {(now - self.last_heard) * 1000:.0f} ms ago, lost {self.lost}, "
+                f"phase {self.phase_error * 1000:+.1f} ms")
+
+
+def main():
+    from dmx_controller import DMXController, OutputScheduler
+
+    parser = argparse.ArgumentParser(description="Run a headless cluster node, e.g. several on localhost")
+    parser.add_argument('node', help="This node's name")
+    parser.add_argument('--nodes', required=True,
+                        help="name=host:port:priority,... for every node, lower priority leads")
+    parser.add_argument('--universes', type=int, default=1)
+    parser.add_argument('--chase', action='store_true', help="Run a chase on channel 1 while leading")
+    parser.add_argument('--device', type=int, help="Also output on this DMX device index")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    nodes = {}
+    for item in args.nodes.split(','):
+        name, _, spec = item.partition('=')
+        host, port, priority = spec.rsplit(':', 2)
+        nodes[name] = ((host, int(port)), int(priority))
+    controllers = {universe: DMXController() for universe in range(1, args.universes + 1)}
+    if args.device is not None:
+        controllers[1].connect(args.device)
+    scheduler = OutputScheduler(controllers)
+    node = ClusterNode(args.node, nodes, controllers, scheduler)
+    if args.chase:
+        scheduler.add_source(lambda now: node.role == ROLE_LEADER and
+                             controllers[1].set_channels({1: int(now * 100) % 256}))
+    node.start()
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(1.0)
+            print(f"{node.status(scheduler.clock())}  ch1={controllers[1].dmx_data[0]}")
+    except KeyboardInterrupt:
+        pass
+    node.stop()
+    scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,45 @@
 DMX Controller for UDMX Interface
 Controls a DMX device with 9 channels
 """
+import time
+STARTUP_BEGIN = time.perf_counter()  # Startup benchmark reference, taken before the heavy imports
+import argparse
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
 import threading
-import time
 import logging
 from datetime import datetime
 import os
+import sys
 import json
 import usb.core
 import usb.util
-import pygame
+import numpy as np
+
+from dmx_recorder import (ShowRecorder, ShowReader, ShowPlayer, new_recording_path,
+                          RECORDINGS_DIR, RECORDING_EXTENSION)
+from dmx_cues import CueList
+from dmx_output import OutputTransforms, MasterStage
+from dmx_patch import Patch
+from dmx_engine import OutputEngine
+from dmx_osc import OSCServer, DEFAULT_OSC_PORT
+from dmx_midi import MIDIInput, control_name
+from dmx_gamepad import GamepadManager
+from dmx_watchdog import Watchdog
+from dmx_audio import AudioInput, AudioModulation, DEFAULT_MAPPINGS
+from dmx_pixelmap import PixelMapSource
+from dmx_cluster import ClusterNode
+from dmx_web import WebServer, DEFAULT_WEB_PORT
+from dmx_journal import StateJournal
+from dmx_logstore import setup_logging, format_entry, parse_time, EVENT_TYPES
+from dmx_devices import DeviceIndex
+from dmx_script import ScriptEngine
+from dmx_visualizer import StageVisualizer, VISUALIZER_RATE
+from dmx_rdm import EnttecProPort, RDMController, RDMError, format_uid, parse_uid, patch_entries
+from dmx_trace import (Tracer, SamplingProfiler, StartupTimer, format_summary, SPAN_FRAME, SPAN_SOURCES, SPAN_SNAPSHOT,
+                       SPAN_TRANSFORMS, SPAN_MASTERS, SPAN_SEND, SPAN_TRANSFER, SPAN_LISTENERS, SPAN_WATCHDOG)
+from dmx_timecode import (ShowClock, CueTriggers, MTCSource, UDPTimecodeSource,
+                          DEFAULT_TIMECODE_PORT, STATE_LOCKED, STATE_FREEWHEEL)
 
 __version__ = "1.3.0"
 __author__ = "DMX Controller"
@@ -25,10 +53,32 @@ UDMX_DEVICES = [
     {'vendor': 0x03EB, 'product': 0x8888, 'name': 'DMXControl uDMX'},
 ]
 
+# Output frame rate (DMX refresh)
+FRAME_RATE = 40
+
+# Send the whole universe at least this often, even when only parts change
+FULL_REFRESH_FRAMES = FRAME_RATE
+
+# Most entries a log search shows
+LOG_SEARCH_LIMIT = 2000
+
+# Port list placeholders
+NO_DEVICES = "No UDMX devices found"
+SCANNING_DEVICES = "Scanning for devices..."
+
+# How often the resume step checks whether the first device scan has landed
+RESUME_POLL_MS = 50
+
+# How often the Tk thread pumps gamepad events where SDL must stay on the main thread (macOS)
+GAMEPAD_PUMP_MS = 5
+
+# Startup milestones that make up the startup benchmark
+STARTUP_MILESTONES = ('window', 'devices', 'gamepads', 'config')
+
 
 class DMXController:
     def __init__(self, logger=None):
-        self.dmx_data = [0] * 512  # DMX universe (512 channels)
+        self.dmx_data = bytearray(512)  # DMX universe (512 channels)
         self.usb_device = None
         self.running = False
         self.logger = logger or logging.getLogger(__name__)
@@ -36,30 +86,53 @@ class DMXController:
         self.error_count = 0
         self.last_send_time = 0
         self.device_info = None
+        self.serial_port = None  # Enttec Pro-compatible widget, the backend that can also do RDM
+        self.transforms = OutputTransforms()  # Curves and limits
+        self.masters = MasterStage()  # Grandmaster, blackout, submasters
+        self.tracer = Tracer()  # Shared with the scheduler, off unless profiling
+        
+        # Changed-range tracking so frames only transfer what changed
+        self.lock = threading.Lock()
+        self.dirty_ranges = []  # (start, end) channel indexes written since the last snapshot
+        self.frame_ranges = None  # Ranges of the frame being sent, None = whole universe
+        self.sent_stage_version = None
+        self.frames_since_full = 0
+        
+        # Out-of-process output: frames are published to the engine instead of USB
+        self.engine = None
+        self.engine_slot = 0
         
         self.logger.info("DMX Controller initialized")
         self.logger.debug(f"DMX Universe size: 512 channels")
     
     def find_udmx_devices(self):
-        """Find all connected UDMX devices"""
+        """Find all connected UDMX devices, followed by serial DMX widgets"""
         devices = []
-        for device_info in UDMX_DEVICES:
-            dev = usb.core.find(idVendor=device_info['vendor'], idProduct=device_info['product'])
-            if dev is not None:
-                devices.append({
-                    'device': dev,
-                    'name': device_info['name'],
-                    'vendor': device_info['vendor'],
-                    'product': device_info['product'],
-                    'description': f"{device_info['name']} (VID:{device_info['vendor']:04X} PID:{device_info['product']:04X})"
-                })
-                self.logger.debug(f"Found UDMX device: {device_info['name']}")
+        known = {(info['vendor'], info['product']): info for info in UDMX_DEVICES}
+        # One pass over the bus for every known interface, instead of one per interface
+        found = usb.core.find(find_all=True, custom_match=lambda dev: (dev.idVendor, dev.idProduct) in known)
+        found = sorted(found, key=lambda dev: (UDMX_DEVICES.index(known[(dev.idVendor, dev.idProduct)]),
+                                               dev.bus or 0, dev.address or 0))
+        for dev in found:
+            device_info = known[(dev.idVendor, dev.idProduct)]
+            devices.append({
+                'device': dev,
+                'name': device_info['name'],
+                'vendor': device_info['vendor'],
+                'product': device_info['product'],
+                'description': f"{device_info['name']} (VID:{device_info['vendor']:04X} PID:{device_info['product']:04X})"
+            })
+            self.logger.debug(f"Found UDMX device: {device_info['name']}")
+        for device_info in EnttecProPort.find_ports():
+            devices.append(device_info)
+            self.logger.debug(f"Found serial DMX widget: {device_info['description']}")
         return devices
         
-    def connect(self, device_index=0):
-        """Connect to UDMX device via USB"""
+    def connect(self, device_index=0, devices=None):
+        """Connect to UDMX device via USB (device_index into devices, scanned now if not given)"""
         try:
-            devices = self.find_udmx_devices()
+            if devices is None:
+                devices = self.find_udmx_devices()
             
             if not devices:
                 self.logger.error("No UDMX devices found")
@@ -69,28 +142,36 @@ class DMXController:
                 device_index = 0
             
             device_info = devices[device_index]
-            self.usb_device = device_info['device']
             self.device_info = device_info
             
             self.logger.info(f"Attempting to connect to {device_info['name']}")
             
-            # Try to detach kernel driver if active
-            try:
-                if self.usb_device.is_kernel_driver_active(0):
-                    self.logger.debug("Detaching kernel driver")
-                    self.usb_device.detach_kernel_driver(0)
-            except:
-                pass  # Not all systems need this
-            
-            # Set configuration
-            try:
-                self.usb_device.set_configuration()
-            except:
-                pass  # May already be configured
+            if 'port' in device_info:
+                # Serial widget: opening the port is all the setup it needs
+                port = EnttecProPort(device_info['port'], logger=self.logger)
+                port.open()
+                self.serial_port = port
+            else:
+                self.usb_device = device_info['device']
+                
+                # Try to detach kernel driver if active
+                try:
+                    if self.usb_device.is_kernel_driver_active(0):
+                        self.logger.debug("Detaching kernel driver")
+                        self.usb_device.detach_kernel_driver(0)
+                except:
+                    pass  # Not all systems need this
+                
+                # Set configuration
+                try:
+                    self.usb_device.set_configuration()
+                except:
+                    pass  # May already be configured
             
             self.running = True
             self.frame_count = 0
             self.error_count = 0
+            self.sent_stage_version = None  # First frame goes out whole
             
             self.logger.info(f"Successfully connected to {device_info['name']}")
             self.logger.debug(f"Device: VID:{device_info['vendor']:04X} PID:{device_info['product']:04X}")
@@ -101,6 +182,20 @@ class DMXController:
             self.logger.error(f"Connection error: {e}")
             return False
     
+    def attach_engine(self, engine, slot=0):
+        """Send frames through an output process instead of this process's USB handle"""
+        self.engine = engine
+        self.engine_slot = slot
+        self.running = True
+        self.logger.info(f"Output through engine process, universe slot {slot}")
+    
+    def detach_engine(self):
+        """Stop publishing frames to the output process"""
+        if self.engine is not None:
+            self.frame_count, self.error_count, _ = self.engine.stats()
+            self.engine = None
+            self.running = False
+    
     def disconnect(self):
         """Disconnect from UDMX device"""
         self.logger.info("Disconnecting from device")
@@ -114,58 +209,362 @@ class DMXController:
             except:
                 pass
             self.usb_device = None
+        if self.serial_port is not None:
+            try:
+                self.serial_port.close()
+                self.logger.info("Device disconnected successfully")
+            except OSError:
+                pass
+            self.serial_port = None
     
     def set_channel(self, channel, value):
         """Set a DMX channel value (1-512, value 0-255)"""
         if 1 <= channel <= 512 and 0 <= value <= 255:
-            old_value = self.dmx_data[channel - 1]
-            self.dmx_data[channel - 1] = int(value)
+            with self.lock:
+                old_value = self.dmx_data[channel - 1]
+                self.dmx_data[channel - 1] = int(value)
+                if old_value != int(value):
+                    self.dirty_ranges.append((channel - 1, channel))
             if old_value != int(value):
                 self.logger.debug(f"Channel {channel}: {old_value} -> {value}")
         else:
             self.logger.warning(f"Invalid channel/value: Ch{channel}={value}")
     
-    def send_dmx_frame(self):
+    def set_channels(self, values):
+        """Set several channels from {channel: value} in one atomic write"""
+        if not values:
+            return True
+        channels = list(values.keys())
+        levels = list(values.values())
+        if min(channels) < 1 or max(channels) > 512 or min(levels) < 0 or max(levels) > 255:
+            self.logger.warning(f"Invalid channel values, nothing written: {values}")
+            return False
+        
+        changed = []
+        with self.lock:
+            data = self.dmx_data
+            for channel, value in zip(channels, levels):
+                value = int(value)
+                if data[channel - 1] != value:
+                    data[channel - 1] = value
+                    changed.append(channel - 1)
+            if changed:
+                changed.sort()
+                self.dirty_ranges.extend(merge_ranges((i, i + 1) for i in changed))
+        if changed and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Channels set: {len(changed)} changed of {len(channels)}")
+        return True
+    
+    def set_range(self, start, values):
+        """Write consecutive channels from start (1-based) from bytes, a list or a NumPy array"""
+        try:
+            data = values_to_bytes(values)
+        except (TypeError, ValueError) as e:
+            self.logger.warning(f"Invalid channel values at {start}, nothing written: {e}")
+            return False
+        if start < 1 or start - 1 + len(data) > 512:
+            self.logger.warning(f"Channel range {start}-{start + len(data) - 1} outside universe, nothing written")
+            return False
+        
+        begin = start - 1
+        end = begin + len(data)
+        with self.lock:
+            if self.dmx_data[begin:end] != data:
+                self.dmx_data[begin:end] = data
+                self.dirty_ranges.append((begin, end))
+        return True
+    
+    def apply_frame(self, frame):
+        """Replace the universe from channel 1 with a whole frame"""
+        return self.set_range(1, frame)
+    
+    def snapshot(self):
+        """Copy of the universe before the output stage, and the ranges changed since the last one"""
+        with self.lock:
+            frame = bytes(self.dmx_data)
+            self.frame_ranges = merge_ranges(sorted(self.dirty_ranges))
+            self.dirty_ranges = []
+        return frame
+    
+    def render_frame(self, source=None):
+        """The universe as it should go out on the wire"""
+        if source is None:
+            source = self.snapshot()
+        tracer = self.tracer
+        if not tracer.enabled:
+            return self.masters.apply(self.transforms.apply(source))
+        start = tracer.now()
+        frame = self.transforms.apply(source)
+        middle = tracer.now()
+        frame = self.masters.apply(frame)
+        tracer.add(SPAN_TRANSFORMS, start, middle)
+        tracer.add(SPAN_MASTERS, middle, tracer.now())
+        return frame
+    
+    def send_dmx_frame(self, frame=None):
         """Send DMX frame to UDMX device via USB"""
+        if self.engine is not None:
+            # The output process owns the device and sends at its own pace
+            self.engine.publish(self.engine_slot, frame if frame is not None else self.render_frame())
+            return
+        if self.serial_port is not None:
+            self.send_serial_frame(frame if frame is not None else self.render_frame())
+            return
         if not self.usb_device:
             return
+        if frame is None:
+            frame = self.render_frame()
+        
+        # The uDMX keeps refreshing the line from its own buffer, so only the
+        # changed ranges need to go over USB. The whole universe is sent when
+        # the output stage changed and once a second in case the buffer was lost.
+        stage_version = (self.transforms.version, self.masters.version)
+        self.frames_since_full += 1
+        if (self.frame_ranges is None or stage_version != self.sent_stage_version or
+                self.frames_since_full >= FULL_REFRESH_FRAMES):
+            ranges = [(0, len(frame))]
+            self.sent_stage_version = stage_version
+            self.frames_since_full = 0
+        else:
+            ranges = self.frame_ranges
         
         try:
             start_time = time.time()
+            trace_start = self.tracer.now() if self.tracer.enabled else 0
             
             # UDMX specific USB control transfer
             # Request type: 0x40 = Host to device, Vendor specific, Device recipient
-            # Request: 0x02 = Set single channel or 0x01 = Set all channels
+            # Request: 0x02 = Set channel range or 0x01 = Set single channel
             # We'll send channels in chunks for better compatibility
             
-            # Method 1: Send all channels at once (if supported)
+            # Method 1: Send each changed range at once (if supported)
             try:
-                # Some UDMX devices support sending all 512 channels
-                # Control transfer: bmRequestType, bRequest, wValue, wIndex, data
-                self.usb_device.ctrl_transfer(0x40, 0x02, 512, 0, self.dmx_data[:512])
+                # Control transfer: bmRequestType, bRequest, wValue (count), wIndex (start), data
+                for start, end in ranges:
+                    self.usb_device.ctrl_transfer(0x40, 0x02, end - start, start, frame[start:end])
             except:
-                # Method 2: Send in smaller chunks (more compatible)
-                # Send first 9 channels (our active channels)
-                for i in range(9):
-                    self.usb_device.ctrl_transfer(0x40, 0x01, self.dmx_data[i], i, [])
+                # Method 2: Send channel by channel (more compatible)
+                # A full refresh covers the first 9 channels (our active channels)
+                if ranges[0] == (0, len(frame)):
+                    ranges = [(0, 9)]
+                for start, end in ranges:
+                    for i in range(start, end):
+                        self.usb_device.ctrl_transfer(0x40, 0x01, frame[i], i, [])
             
             self.frame_count += 1
             self.last_send_time = time.time() - start_time
+            if trace_start:
+                self.tracer.add(SPAN_TRANSFER, trace_start, self.tracer.now(), sum(e - s for s, e in ranges))
             
             if self.frame_count % 1000 == 0:
                 self.logger.debug(f"Frames sent: {self.frame_count}, Last frame time: {self.last_send_time*1000:.2f}ms")
             
         except usb.core.USBError as e:
             self.error_count += 1
+            # Part of the ranges may not have arrived: resend the whole universe next frame
+            self.sent_stage_version = None
             if self.error_count % 10 == 1:  # Log every 10th error to avoid spam
                 self.logger.error(f"USB Send error: {e}")
         except Exception as e:
             self.error_count += 1
+            self.sent_stage_version = None
             self.logger.error(f"Send error: {e}")
+    
+    def send_serial_frame(self, frame):
+        """Send the whole universe to a serial widget, which refreshes the line from its own buffer"""
+        try:
+            start_time = time.time()
+            trace_start = self.tracer.now() if self.tracer.enabled else 0
+            self.serial_port.send_dmx(frame)
+            self.frame_count += 1
+            self.last_send_time = time.time() - start_time
+            if trace_start:
+                self.tracer.add(SPAN_TRANSFER, trace_start, self.tracer.now(), len(frame))
+        except OSError as e:
+            self.error_count += 1
+            if self.error_count % 10 == 1:
+                self.logger.error(f"Serial send error: {e}")
+
+
+def merge_ranges(ranges):
+    """Merge sorted (start, end) ranges that touch or overlap"""
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def values_to_bytes(values):
+    """Convert channel values (bytes, sequence or NumPy array) to bytes, checking the 0-255 range"""
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        return bytes(values)
+    if isinstance(values, np.ndarray):
+        if values.dtype != np.uint8:
+            if values.size and (values.min() < 0 or values.max() > 255):
+                raise ValueError("values must be 0-255")
+            values = values.astype(np.uint8)
+        return values.tobytes()
+    return bytes(int(value) for value in values)
+
+
+class OutputScheduler:
+    """Sends DMX frames at a fixed rate and runs per-frame hooks"""
+    
+    def __init__(self, controllers, rate=FRAME_RATE, logger=None, clock=time.monotonic, tracer=None):
+        self.controllers = controllers  # {universe: DMXController}
+        self.tracer = tracer or Tracer()
+        for controller in controllers.values():
+            controller.tracer = self.tracer
+        self.interval = 1.0 / rate
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+        self.sources = []    # source(now) - runs before the frame is rendered
+        self.listeners = []  # listener(now, frames) - runs after the frame is sent
+        self.source_frames = {}  # Universes before the output stage, for the last frame
+        self.running = False
+        self.thread = None
+        self.frame_number = 0
+        self.late_frames = 0
+        self.source_errors = 0
+        self.watchdog = None  # Heartbeats and failsafe policies, checked every frame
+        self.next_deadline = None  # When the next frame is due, while the output thread runs
+        self.phase_shift = 0.0  # One-off shift of the next deadline, to line frames up with another clock
+    
+    def add_source(self, source):
+        self.sources.append(source)
+    
+    def remove_source(self, source):
+        if source in self.sources:
+            self.sources.remove(source)
+    
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def run_frame(self, now):
+        """Render and send one frame for every universe"""
+        if self.tracer.enabled:
+            self._run_frame_traced(now)
+            return
+        for source in list(self.sources):
+            self._run_source(source, now)
+        if self.watchdog is not None:
+            self.watchdog.enforce(now)
+        
+        sources = {}
+        frames = {}
+        for universe, controller in self.controllers.items():
+            source = controller.snapshot()
+            frame = controller.render_frame(source)
+            controller.send_dmx_frame(frame)
+            sources[universe] = source
+            frames[universe] = frame
+        self.source_frames = sources
+        
+        for listener in list(self.listeners):
+            listener(now, frames)
+        self.frame_number += 1
+    
+    def _run_source(self, source, now):
+        # A failing source must not stop the frame; it just misses its heartbeat
+        try:
+            source(now)
+        except Exception as e:
+            self.source_errors += 1
+            if self.source_errors % 100 == 1:
+                name = getattr(source, '__qualname__', repr(source))
+                self.logger.error(f"Frame source {name} failed: {e} ({self.source_errors} errors)")
+            return
+        if self.watchdog is not None:
+            self.watchdog.beat_source(source, now)
+    
+    def _run_frame_traced(self, now):
+        # Same as run_frame with a span around every stage
+        tracer = self.tracer
+        frame_start = tracer.now()
+        for source in list(self.sources):
+            start = tracer.now()
+            self._run_source(source, now)
+            tracer.add(getattr(source, '__qualname__', SPAN_SOURCES), start, tracer.now())
+        if self.watchdog is not None:
+            start = tracer.now()
+            self.watchdog.enforce(now)
+            tracer.add(SPAN_WATCHDOG, start, tracer.now())
+        tracer.add(SPAN_SOURCES, frame_start, tracer.now())
+        
+        sources = {}
+        frames = {}
+        for universe, controller in self.controllers.items():
+            start = tracer.now()
+            source = controller.snapshot()
+            tracer.add(SPAN_SNAPSHOT, start, tracer.now(), universe)
+            frame = controller.render_frame(source)
+            start = tracer.now()
+            controller.send_dmx_frame(frame)
+            tracer.add(SPAN_SEND, start, tracer.now(), universe)
+            sources[universe] = source
+            frames[universe] = frame
+        self.source_frames = sources
+        
+        start = tracer.now()
+        for listener in list(self.listeners):
+            listener(now, frames)
+        end = tracer.now()
+        tracer.add(SPAN_LISTENERS, start, end)
+        tracer.add(SPAN_FRAME, frame_start, end, self.frame_number)
+        self.frame_number += 1
+    
+    def start(self):
+        """Start the output thread"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop the output thread"""
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+        self.next_deadline = None
+    
+    def _loop(self):
+        # Frames are scheduled against absolute deadlines so time spent
+        # rendering and sending does not stretch the frame interval
+        next_frame = self.clock()
+        while self.running:
+            # Listeners with optional work (RDM) use the slack before this deadline
+            self.next_deadline = next_frame + self.interval
+            try:
+                self.run_frame(self.clock())
+            except Exception as e:
+                self.logger.error(f"Output frame error: {e}")
+            
+            next_frame += self.interval + self.phase_shift
+            self.phase_shift = 0.0
+            delay = next_frame - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.interval:
+                # Too far behind to catch up, skip the missed frames
+                self.late_frames += 1
+                next_frame = self.clock()
 
 
 class DMXControllerGUI:
-    def __init__(self, root):
+    def __init__(self, root, trace_path=None, profile_path=None, benchmark_path=None):
+        self.startup = StartupTimer(STARTUP_BEGIN)
+        self.startup.mark('imports')
+        self.benchmark_path = benchmark_path
         self.root = root
         self.root.title(f"DMX Controller - UDMX v{__version__}")
         self.root.geometry("900x750")
@@ -175,72 +574,195 @@ class DMXControllerGUI:
         self.setup_logging()
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"Starting DMX Controller v{__version__}")
+        self.startup.mark('logging')
         
         self.controller = DMXController(logger=self.logger)
-        self.update_thread = None
+        # Devices are enumerated in the background and rescanned on hot-plug; the UI reads the cache
+        self.device_cache = DeviceIndex(self.controller.find_udmx_devices, logger=self.logger)
+        self.device_cache.start()
+        self.devices_shown = None
+        self.patch = Patch.from_config({})
+        self.controller.masters.configure(self.patch, 1)
+        self.scheduler = OutputScheduler({1: self.controller}, logger=self.logger)
+        self.recorder = None
+        self.player = None
+        
+        # Cues and timecode
+        self.show_clock = ShowClock(logger=self.logger, clock=self.scheduler.clock)
+        self.cue_list = CueList(self.controller, logger=self.logger)
+        self.cue_triggers = CueTriggers(self.show_clock, logger=self.logger)
+        self.timecode_source = None
+        self.scheduler.add_source(self.cue_triggers.on_frame)
+        self.scheduler.add_source(self.cue_list.on_frame)
         self.running = False
         self.debug_mode = tk.BooleanVar(value=False)
         self.stats_enabled = tk.BooleanVar(value=True)
         
-        # Gamepad support
-        self.gamepad = None
-        self.gamepad_thread = None
+        # Optional separate output process
+        self.engine = None
+        self.engine_mode = tk.BooleanVar(value=False)
+        self.engine_options = {}
+        
+        # OSC remote control
+        self.osc_server = None
+        self.osc_enabled = tk.BooleanVar(value=False)
+        self.osc_options = {}
+        
+        # Browser remote over WebSocket
+        self.web_server = None
+        self.web_enabled = tk.BooleanVar(value=False)
+        self.web_options = {}
+        
+        # Cluster sync with other controller PCs
+        self.cluster = None
+        self.cluster_enabled = tk.BooleanVar(value=False)
+        self.cluster_options = {}
+        
+        # MIDI faders, coalesced to one write per frame
+        self.midi_input = MIDIInput(self.scheduler.controllers, cue_list=self.cue_list,
+                                    clock=self.scheduler.clock, logger=self.logger)
+        self.scheduler.add_source(self.midi_input.on_frame)
+        self.midi_enabled = tk.BooleanVar(value=False)
+        self.midi_options = {}
+        self.learn_targets = {}
+        
+        # Profiling: frame trace and sampling profiler, exported on exit when started from the CLI
+        self.trace_enabled = tk.BooleanVar(value=trace_path is not None)
+        self.profiler = None
+        self.profiler_enabled = tk.BooleanVar(value=profile_path is not None)
+        self.trace_path = trace_path
+        self.profile_path = profile_path
+        if trace_path is not None:
+            self.scheduler.tracer.enable()
+        if profile_path is not None:
+            self.toggle_profiler()
+        
+        # Gamepads, read once per output frame
+        self.gamepads = GamepadManager(self.scheduler.controllers, patch=self.patch, logger=self.logger)
         self.gamepad_enabled = tk.BooleanVar(value=False)
-        self.init_gamepad()
-        
+        if sys.platform == 'darwin':
+            # SDL on macOS is started and pumped on the main thread, once the window is up
+            self.root.after(0, self.init_gamepad_main)
+        else:
+            threading.Thread(target=self.init_gamepad, name="gamepad-events", daemon=True).start()
+        self.scheduler.add_source(self.gamepads.on_frame)
+        
+        # Sound to light: audio analysis mapped to channels once per frame
+        self.audio_input = AudioInput(clock=self.scheduler.clock, logger=self.logger)
+        self.audio_modulation = AudioModulation(self.scheduler.controllers, self.audio_input, logger=self.logger)
+        self.scheduler.add_source(self.audio_modulation.on_frame)
+        self.audio_enabled = tk.BooleanVar(value=False)
+        self.audio_options = {}
+        
+        # Pixel map from config.json, inserted before the scripts when configured
+        self.pixel_source = None
+        
+        # User scripts from config.json, run after the other sources so they layer on top
+        self.scripts = ScriptEngine(self.scheduler.controllers, scheduler=self.scheduler, gamepads=self.gamepads,
+                                    audio=self.audio_input, clock=self.scheduler.clock, logger=self.logger)
+        self.scheduler.add_source(self.scripts.on_frame)
+        
+        # Watchdog: heartbeats from the GUI and frame sources, failsafe policies on stalls
+        self.load_watchdog({})
+        
+        # RDM, run in the slack between output frames on serial widgets
+        self.rdm = RDMController(scheduler=self.scheduler, logger=self.logger)
+        self.scheduler.add_listener(self.rdm.on_frame)
+        self.rdm_result = None
+        self.rdm_identifying = set()
+        
+        # Crash-safe journal of the live look, restored and sent before the window is built
+        self.journal = None
+        self.journal_options = {}
+        self.resume_last_look()
+        
+        self.startup.mark('core')
         self.create_ui()
+        self.root.after_idle(self.startup.mark, 'window')
+        for channel in range(1, 10):
+            self.update_slider_from_gamepad(channel, self.controller.dmx_data[channel - 1])
         self.load_config()
+        self.startup.mark('config')
         
     def setup_logging(self):
-        """Setup logging configuration"""
-        # Create logs directory
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-        
-        # Create log filename with timestamp
-        log_filename = f"logs/dmx_controller_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-        
-        # Configure root logger
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_filename, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
-        
-        # Keep only last 10 log files
-        self.cleanup_old_logs()
-    
-    def cleanup_old_logs(self):
-        """Keep only the 10 most recent log files"""
+        """Log to the indexed JSON-lines store in logs/ and the console"""
+        # Rotation by size, compression and retention are handled by the store
+        self.log_store = setup_logging('logs', level=logging.DEBUG)
+        self.log_query = None  # Search results shown instead of the live tail
+    
+    def init_gamepad(self):
+        """Initialize gamepad support, open the gamepads already connected and pump their events (worker)"""
         try:
-            log_files = sorted([f for f in os.listdir('logs') if f.endswith('.log')])
-            if len(log_files) > 10:
-                for old_log in log_files[:-10]:
-                    os.remove(os.path.join('logs', old_log))
+            self.gamepads.init()
+            if not self.gamepads.pads:
+                self.logger.warning("No gamepad detected")
         except Exception as e:
-            print(f"Error cleaning up logs: {e}")
+            self.logger.error(f"Gamepad initialization error: {e}")
+        self.startup.mark('gamepads')
+        if self.gamepads.ready:
+            self.gamepads.run_events()
     
-    def init_gamepad(self):
-        """Initialize gamepad support"""
+    def init_gamepad_main(self):
+        """Initialize gamepad support on the Tk thread and pump its events from there (macOS)"""
         try:
-            pygame.init()
-            pygame.joystick.init()
-            
-            if pygame.joystick.get_count() > 0:
-                self.gamepad = pygame.joystick.Joystick(0)
-                self.gamepad.init()
-                gamepad_name = self.gamepad.get_name()
-                self.logger.info(f"Gamepad detected: {gamepad_name}")
-                self.logger.info(f"Axes: {self.gamepad.get_numaxes()}, Buttons: {self.gamepad.get_numbuttons()}")
-            else:
+            self.gamepads.init()
+            if not self.gamepads.pads:
                 self.logger.warning("No gamepad detected")
-                self.gamepad = None
         except Exception as e:
             self.logger.error(f"Gamepad initialization error: {e}")
-            self.gamepad = None
+        self.startup.mark('gamepads')
+        self.pump_gamepad_events()
+    
+    def pump_gamepad_events(self):
+        if self.gamepads.pump():
+            self.root.after(GAMEPAD_PUMP_MS, self.pump_gamepad_events)
+    
+    def resume_last_look(self):
+        """Restore the journaled universes and, if enabled, schedule reconnecting the last device to send them"""
+        config = {}
+        try:
+            if os.path.exists('config.json'):
+                with open('config.json', 'r') as f:
+                    config = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Could not read config for the journal: {e}")
+        self.journal_options = config.get('journal', {})
+        if not self.journal_options.get('enabled', True):
+            return
+        
+        self.journal = StateJournal.from_config(config, self.scheduler, logger=self.logger)
+        try:
+            restored = self.journal.restore()
+            self.journal.start()
+        except OSError as e:
+            self.logger.error(f"State journal unavailable: {e}")
+            self.journal = None
+            return
+        
+        last_port = config.get('last_port')
+        if not restored or not self.journal.resume or not last_port:
+            return
+        # Runs once the window is up; the device scan must not hold up the Tk thread
+        self.root.after(0, self.resume_output, last_port)
+    
+    def resume_output(self, port):
+        """Connect the last device and send the restored look, once the first device scan has landed"""
+        if not self.device_cache.ready.is_set():
+            self.root.after(RESUME_POLL_MS, self.resume_output, port)
+            return
+        if self.running:
+            return  # Connected by hand in the meantime
+        names = [device['description'] for device in self.device_cache.devices]
+        if port not in names:
+            self.logger.warning(f"Last device {port} not found, restored look not sent")
+            return
+        if self.connect_output(names.index(port)):
+            self.running = True
+            self.start_update_thread()
+            self.port_combo.set(port)
+            self.status_label.config(text="Status: Connected (last look resumed)", foreground="green")
+            self.connect_btn.config(text="Disconnect")
+            self.logger.info(f"Last look resumed on {port}")
     
     def load_config(self):
         """Load saved configuration"""
@@ -249,17 +771,155 @@ class DMXControllerGUI:
                 with open('config.json', 'r') as f:
                     config = json.load(f)
                     self.debug_mode.set(config.get('debug_mode', False))
+                    self.engine_options = config.get('output_process', {})
+                    self.engine_mode.set(self.engine_options.get('enabled', False))
+                    if 'output_transforms' in config:
+                        self.controller.transforms = OutputTransforms.from_config(config, logger=self.logger)
+                    if 'patch' in config:
+                        self.load_patch(config)
+                    self.load_cues(config)
+                    if 'watchdog' in config:
+                        self.load_watchdog(config)
+                    if 'gamepads' in config:
+                        self.gamepads.profile_data = config['gamepads'].get('profiles', [])
+                        self.gamepads.set_patch(self.patch)
+                    self.osc_options = config.get('osc', {})
+                    if self.osc_options.get('enabled', False):
+                        self.osc_enabled.set(True)
+                        self.start_osc()
+                    self.load_midi(config)
+                    self.load_audio(config)
+                    self.load_pixelmap(config)
+                    self.load_scripts(config)
+                    self.visualizer.set_rate(config.get('visualizer', {}).get('rate', VISUALIZER_RATE))
+                    self.web_options = config.get('web', {})
+                    if self.web_options.get('enabled', False):
+                        self.web_enabled.set(True)
+                        self.start_web()
+                    self.cluster_options = config.get('cluster', {})
+                    if self.cluster_options.get('enabled', False):
+                        self.cluster_enabled.set(True)
+                        self.start_cluster()
                     self.logger.info("Configuration loaded")
         except Exception as e:
             self.logger.warning(f"Could not load config: {e}")
     
+    def load_patch(self, config):
+        """Load the fixture patch and rebuild the masters for it"""
+        self.patch = Patch.from_config(config)
+        self.controller.masters.configure(self.patch, 1)
+        self.create_master_controls()
+        if self.osc_server is not None:
+            self.osc_server.set_patch(self.patch)
+        self.gamepads.set_patch(self.patch)
+        self.audio_modulation.set_mappings(self.audio_options.get('mappings', DEFAULT_MAPPINGS), self.patch)
+        self.visualizer.set_patch(self.patch)
+        self.update_learn_targets()
+        self.logger.info(f"Patch loaded: {len(self.patch.fixtures)} fixtures, groups: {', '.join(self.patch.groups())}")
+    
+    def load_cues(self, config):
+        """Load the cue list and timecode triggers from the configuration"""
+        self.cue_list.cues = CueList.from_config(self.controller, config).cues
+        self.scheduler.remove_source(self.cue_triggers.on_frame)
+        self.cue_triggers = CueTriggers.from_config(self.show_clock, self.cue_list, config, logger=self.logger)
+        self.scheduler.sources.insert(0, self.cue_triggers.on_frame)
+        if self.cue_list.cues:
+            self.logger.info(f"Loaded {len(self.cue_list.cues)} cues, "
+                             f"{len(self.cue_triggers.times)} timecode triggers")
+    
+    def load_watchdog(self, config):
+        """Set up the watchdog from the 'watchdog' configuration (default: report stalls only)"""
+        self.watchdog = Watchdog.from_config(config, self.scheduler.controllers, logger=self.logger)
+        self.gamepads.watchdog = self.watchdog
+        self.watchdog.attach_source('midi', self.midi_input.on_frame)
+        self.watchdog.attach_source('cues', self.cue_list.on_frame)
+        self.watchdog.attach_source('audio', self.audio_modulation.on_frame)
+        self.watchdog.attach_source('scripts', self.scripts.on_frame)
+        self.scheduler.watchdog = self.watchdog
+    
+    def load_midi(self, config):
+        """Load MIDI bindings and reopen the saved MIDI port"""
+        self.midi_options = config.get('midi', {})
+        bindings = MIDIInput.from_config(config, self.scheduler.controllers, self.patch, logger=self.logger).bindings
+        with self.midi_input.lock:
+            self.midi_input.bindings = bindings
+        if self.midi_options.get('port') in self.midi_port_combo['values']:
+            self.midi_port_combo.set(self.midi_options['port'])
+        if self.midi_options.get('enabled', False):
+            self.midi_enabled.set(True)
+            self.toggle_midi()
+    
+    def load_audio(self, config):
+        """Load the sound-to-light bands and mappings and reopen the saved audio source"""
+        self.audio_options = config.get('audio', {})
+        self.audio_input.bands = self.audio_options.get('bands')
+        self.audio_input.block_size = self.audio_options.get('block_size', self.audio_input.block_size)
+        self.audio_modulation.max_latency = self.audio_options.get('max_latency', self.audio_modulation.max_latency)
+        self.audio_modulation.set_mappings(self.audio_options.get('mappings', DEFAULT_MAPPINGS), self.patch)
+        source = self.audio_options.get('source')
+        if source:
+            if source not in self.audio_source_combo['values']:
+                self.audio_source_combo['values'] = AudioInput.source_names() + [source]
+            self.audio_source_combo.set(source)
+        if self.audio_options.get('enabled', False) and source and source != "WAV file...":
+            self.audio_enabled.set(True)
+            self.toggle_audio()
+    
+    def load_pixelmap(self, config):
+        """Build the pixel map from the 'pixelmap' section and run it as a source, replacing the previous one"""
+        if self.pixel_source is not None:
+            self.scheduler.remove_source(self.pixel_source.on_frame)
+        self.pixel_source = PixelMapSource.from_config(config, self.scheduler.controllers, logger=self.logger)
+        if self.pixel_source is None:
+            return
+        # Before the scripts, so they can still layer on top of the pixels
+        self.scheduler.sources.insert(self.scheduler.sources.index(self.scripts.on_frame), self.pixel_source.on_frame)
+        pixel_map = self.pixel_source.pixel_map
+        self.logger.info(f"Pixel map loaded: {len(pixel_map.layout)} pixels in universes {pixel_map.universes}")
+        missing = [universe for universe in pixel_map.universes if universe not in self.scheduler.controllers]
+        if missing:
+            self.logger.warning(f"Pixel map universes {missing} have no output, their pixels are not sent")
+    
+    def load_scripts(self, config):
+        """Compile the 'scripts' list against the current patch, replacing the running scripts"""
+        count = self.scripts.load(config.get('scripts', []), self.patch)
+        if count:
+            self.logger.info(f"Loaded {count} scripts: {', '.join(s.name for s in self.scripts.scripts)}")
+    
+    def reload_scripts(self):
+        """Re-read the scripts from config.json while running"""
+        try:
+            with open('config.json', 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Scripts", f"Could not read config.json:\n{e}")
+            return
+        self.load_scripts(config)
+        skipped = len(config.get('scripts', [])) - len(self.scripts.scripts)
+        if skipped:
+            messagebox.showwarning("Scripts", f"{skipped} script(s) did not compile, see the log")
+    
     def save_config(self):
         """Save configuration"""
         try:
-            config = {
+            # Keep hand-edited sections such as cues intact
+            config = {}
+            if os.path.exists('config.json'):
+                with open('config.json', 'r') as f:
+                    config = json.load(f)
+            config.update({
                 'debug_mode': self.debug_mode.get(),
-                'last_port': self.port_combo.get()
-            }
+                'last_port': self.port_combo.get(),
+                'output_process': dict(self.engine_options, enabled=self.engine_mode.get()),
+                'osc': dict(self.osc_options, enabled=self.osc_enabled.get()),
+                'midi': dict(self.midi_options, enabled=self.midi_enabled.get(), port=self.midi_port_combo.get(),
+                             bindings=self.midi_input.to_config()),
+                'web': dict(self.web_options, enabled=self.web_enabled.get()),
+                'journal': dict(self.journal_options, enabled=self.journal_options.get('enabled', True)),
+                'cluster': dict(self.cluster_options, enabled=self.cluster_enabled.get()),
+                'audio': dict(self.audio_options, enabled=self.audio_enabled.get(),
+                              source=self.audio_source_combo.get())
+            })
             with open('config.json', 'w') as f:
                 json.dump(config, f, indent=2)
             self.logger.info("Configuration saved")
@@ -277,16 +937,26 @@ class DMXControllerGUI:
         main_tab = ttk.Frame(notebook)
         notebook.add(main_tab, text="Controls")
         
+        # Stage visualizer tab
+        stage_tab = ttk.Frame(notebook)
+        notebook.add(stage_tab, text="Stage")
+        
         # Debug tab
         debug_tab = ttk.Frame(notebook)
         notebook.add(debug_tab, text="Debug & Logs")
         
+        # RDM fixtures tab
+        fixtures_tab = ttk.Frame(notebook)
+        notebook.add(fixtures_tab, text="Fixtures")
+        
         # Info tab
         info_tab = ttk.Frame(notebook)
         notebook.add(info_tab, text="Info")
         
         self.create_main_controls(main_tab)
+        self.create_stage_tab(stage_tab)
         self.create_debug_tab(debug_tab)
+        self.create_fixtures_tab(fixtures_tab)
         self.create_info_tab(info_tab)
     
     def create_main_controls(self, parent):
@@ -299,7 +969,7 @@ class DMXControllerGUI:
         ttk.Label(conn_frame, text="Port:").grid(row=0, column=0, padx=5)
         self.port_combo = ttk.Combobox(conn_frame, width=20, state="readonly")
         self.port_combo.grid(row=0, column=1, padx=5)
-        self.refresh_ports()
+        self.show_devices()
         
         ttk.Button(conn_frame, text="Refresh", command=self.refresh_ports).grid(row=0, column=2, padx=5)
         self.connect_btn = ttk.Button(conn_frame, text="Connect", command=self.toggle_connection)
@@ -308,6 +978,9 @@ class DMXControllerGUI:
         self.status_label = ttk.Label(conn_frame, text="Status: Disconnected", foreground="red")
         self.status_label.grid(row=0, column=4, padx=10)
         
+        ttk.Checkbutton(conn_frame, text="Separate output process",
+                        variable=self.engine_mode).grid(row=1, column=0, columnspan=3, sticky="w", padx=5)
+        
         # Stats Frame
         stats_frame = ttk.LabelFrame(parent, text="Statistics", padding=5)
         stats_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
@@ -321,6 +994,9 @@ class DMXControllerGUI:
         self.fps_label = ttk.Label(stats_frame, text="FPS: 0")
         self.fps_label.grid(row=0, column=2, padx=10)
         
+        self.watchdog_label = ttk.Label(stats_frame, text="Watchdog: OK", foreground="green")
+        self.watchdog_label.grid(row=0, column=3, padx=10)
+        
         # Control Frame
         control_frame = ttk.Frame(parent, padding=10)
         control_frame.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="nsew")
@@ -396,31 +1072,124 @@ class DMXControllerGUI:
         action_frame = ttk.LabelFrame(parent, text="Quick Actions", padding=10)
         action_frame.grid(row=3, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
         
-        ttk.Button(action_frame, text="All Off", command=self.all_off).pack(side="left", padx=5)
-        ttk.Button(action_frame, text="Full Brightness", command=self.full_brightness).pack(side="left", padx=5)
+        self.blackout_btn = ttk.Button(action_frame, text="Blackout", command=self.toggle_blackout)
+        self.blackout_btn.pack(side="left", padx=5)
+        self.full_btn = ttk.Button(action_frame, text="Full Brightness", command=self.toggle_full)
+        self.full_btn.pack(side="left", padx=5)
         ttk.Button(action_frame, text="Reposition", command=self.reposition).pack(side="left", padx=5)
+        ttk.Button(action_frame, text="GO Cue", command=self.go_cue).pack(side="left", padx=5)
         
         # Gamepad Control
         gamepad_frame = ttk.LabelFrame(parent, text="🎮 Gamepad Control", padding=10)
         gamepad_frame.grid(row=4, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
         
-        if self.gamepad:
-            gamepad_info = ttk.Label(gamepad_frame, text=f"✅ {self.gamepad.get_name()} detected", foreground="green")
-            gamepad_info.pack(side="left", padx=5)
-            
-            ttk.Checkbutton(gamepad_frame, text="Enable Control (Stick: Pan/Tilt, L2: Strobe, R2: Dim, X/□/○: Color)", 
-                           variable=self.gamepad_enabled, command=self.toggle_gamepad).pack(side="left", padx=5)
-            
-            self.gamepad_status = ttk.Label(gamepad_frame, text="Status: Disabled", foreground="gray")
-            self.gamepad_status.pack(side="left", padx=10)
-        else:
-            ttk.Label(gamepad_frame, text="❌ No gamepad detected", foreground="red").pack(side="left", padx=5)
-            ttk.Button(gamepad_frame, text="Refresh", command=self.refresh_gamepad).pack(side="left", padx=5)
+        ttk.Checkbutton(gamepad_frame, text="Enable Control (Stick: Pan/Tilt, L2: Strobe, R2: Dim, X/□/○: Color)", 
+                       variable=self.gamepad_enabled, command=self.toggle_gamepad).pack(side="left", padx=5)
+        
+        self.gamepad_status = ttk.Label(gamepad_frame, text="Status: Disabled", foreground="gray")
+        self.gamepad_status.pack(side="left", padx=10)
+        self.gamepad_info = ttk.Label(gamepad_frame, text="")
+        self.gamepad_info.pack(side="left", padx=5)
+        self.update_gamepad_info()
+        
+        # Show recording
+        record_frame = ttk.LabelFrame(parent, text="Show Recording", padding=10)
+        record_frame.grid(row=5, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        
+        self.record_btn = ttk.Button(record_frame, text="● Record", command=self.toggle_recording)
+        self.record_btn.pack(side="left", padx=5)
+        self.play_btn = ttk.Button(record_frame, text="▶ Play...", command=self.toggle_playback)
+        self.play_btn.pack(side="left", padx=5)
+        
+        ttk.Label(record_frame, text="Speed:").pack(side="left", padx=(10, 2))
+        self.speed_combo = ttk.Combobox(record_frame, width=6, state="readonly",
+                                        values=["0.25x", "0.5x", "1x", "2x", "4x"])
+        self.speed_combo.set("1x")
+        self.speed_combo.bind("<<ComboboxSelected>>", self.change_playback_speed)
+        self.speed_combo.pack(side="left", padx=2)
+        
+        self.record_status = ttk.Label(record_frame, text="Idle", foreground="gray")
+        self.record_status.pack(side="left", padx=10)
+        
+        # Timecode
+        timecode_frame = ttk.LabelFrame(parent, text="Timecode", padding=10)
+        timecode_frame.grid(row=6, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        
+        ttk.Label(timecode_frame, text="Source:").pack(side="left", padx=5)
+        self.timecode_combo = ttk.Combobox(timecode_frame, width=14, state="readonly",
+                                           values=["Off", f"UDP :{DEFAULT_TIMECODE_PORT}", "MIDI (MTC)"])
+        self.timecode_combo.set("Off")
+        self.timecode_combo.bind("<<ComboboxSelected>>", self.change_timecode_source)
+        self.timecode_combo.pack(side="left", padx=5)
+        
+        self.timecode_label = ttk.Label(timecode_frame, text="--:--:--:--", font=("Courier", 12, "bold"))
+        self.timecode_label.pack(side="left", padx=10)
+        self.timecode_status = ttk.Label(timecode_frame, text="Off", foreground="gray")
+        self.timecode_status.pack(side="left", padx=5)
+        
+        # Masters
+        self.master_frame = ttk.LabelFrame(parent, text="Masters", padding=10)
+        self.master_frame.grid(row=7, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        self.create_master_controls()
+        
+        # Remote control
+        remote_frame = ttk.LabelFrame(parent, text="Remote Control", padding=10)
+        remote_frame.grid(row=8, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        
+        ttk.Checkbutton(remote_frame, text="OSC input", variable=self.osc_enabled,
+                        command=self.toggle_osc).pack(side="left", padx=5)
+        self.osc_status = ttk.Label(remote_frame, text="Off", foreground="gray")
+        self.osc_status.pack(side="left", padx=10)
+        
+        ttk.Checkbutton(remote_frame, text="MIDI input", variable=self.midi_enabled,
+                        command=self.toggle_midi).pack(side="left", padx=(20, 5))
+        self.midi_port_combo = ttk.Combobox(remote_frame, width=16, state="readonly",
+                                            values=MIDIInput.port_names())
+        self.midi_port_combo.current(0)
+        self.midi_port_combo.pack(side="left", padx=2)
+        self.learn_combo = ttk.Combobox(remote_frame, width=18, state="readonly")
+        self.learn_combo.pack(side="left", padx=(10, 2))
+        self.update_learn_targets()
+        ttk.Button(remote_frame, text="Learn", command=self.midi_learn).pack(side="left", padx=2)
+        self.midi_status = ttk.Label(remote_frame, text="Off", foreground="gray")
+        self.midi_status.pack(side="left", padx=10)
+        
+        ttk.Checkbutton(remote_frame, text="Web remote", variable=self.web_enabled,
+                        command=self.toggle_web).pack(side="left", padx=(20, 5))
+        self.web_status = ttk.Label(remote_frame, text="Off", foreground="gray")
+        self.web_status.pack(side="left", padx=10)
+        
+        ttk.Checkbutton(remote_frame, text="Cluster sync", variable=self.cluster_enabled,
+                        command=self.toggle_cluster).pack(side="left", padx=(20, 5))
+        self.cluster_status = ttk.Label(remote_frame, text="Off", foreground="gray")
+        self.cluster_status.pack(side="left", padx=10)
+        
+        # Sound to light
+        audio_frame = ttk.LabelFrame(parent, text="Sound to Light", padding=10)
+        audio_frame.grid(row=9, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        
+        ttk.Checkbutton(audio_frame, text="Audio input", variable=self.audio_enabled,
+                        command=self.toggle_audio).pack(side="left", padx=5)
+        self.audio_source_combo = ttk.Combobox(audio_frame, width=30, state="readonly",
+                                               values=AudioInput.source_names())
+        self.audio_source_combo.current(0)
+        self.audio_source_combo.pack(side="left", padx=2)
+        self.audio_status = ttk.Label(audio_frame, text="Off", foreground="gray")
+        self.audio_status.pack(side="left", padx=10)
         
         # Configure grid weights
         control_frame.columnconfigure(0, weight=1)
         parent.columnconfigure(0, weight=1)
     
+    def create_stage_tab(self, parent):
+        """Create the stage visualizer, drawn from the patch and the output frames"""
+        canvas = tk.Canvas(parent, highlightthickness=0)
+        canvas.pack(fill="both", expand=True, padx=5, pady=5)
+        self.stage_status = ttk.Label(parent, text="", foreground="gray")
+        self.stage_status.pack(fill="x", padx=10, pady=(0, 5))
+        self.visualizer = StageVisualizer(canvas, self.patch, self.scheduler, logger=self.logger)
+        self.visualizer.start()
+    
     def create_debug_tab(self, parent):
         """Create debug and logging interface"""
         
@@ -435,6 +1204,49 @@ class DMXControllerGUI:
         ttk.Button(control_frame, text="Export Logs", command=self.export_logs).pack(side="left", padx=5)
         ttk.Button(control_frame, text="Refresh", command=self.update_log_display).pack(side="left", padx=5)
         
+        # Indexed log search
+        search_frame = ttk.LabelFrame(parent, text="Log Search", padding=10)
+        search_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Label(search_frame, text="From:").pack(side="left")
+        self.log_from = ttk.Entry(search_frame, width=9)
+        self.log_from.pack(side="left", padx=2)
+        ttk.Label(search_frame, text="To:").pack(side="left")
+        self.log_to = ttk.Entry(search_frame, width=9)
+        self.log_to.pack(side="left", padx=2)
+        self.log_event = ttk.Combobox(search_frame, width=9, state="readonly", values=["all"] + EVENT_TYPES)
+        self.log_event.current(0)
+        self.log_event.pack(side="left", padx=2)
+        self.log_level = ttk.Combobox(search_frame, width=8, state="readonly",
+                                      values=["all", "DEBUG", "INFO", "WARNING", "ERROR"])
+        self.log_level.current(0)
+        self.log_level.pack(side="left", padx=2)
+        self.log_text = ttk.Entry(search_frame, width=14)
+        self.log_text.pack(side="left", padx=2)
+        ttk.Button(search_frame, text="Search", command=self.search_logs).pack(side="left", padx=2)
+        ttk.Button(search_frame, text="Live", command=self.show_live_logs).pack(side="left", padx=2)
+        self.log_search_status = ttk.Label(search_frame, text="Live", foreground="gray")
+        self.log_search_status.pack(side="left", padx=5)
+        
+        # Profiling
+        profile_frame = ttk.LabelFrame(parent, text="Profiling", padding=10)
+        profile_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Checkbutton(profile_frame, text="Trace Frames", variable=self.trace_enabled,
+                        command=self.toggle_trace).pack(side="left", padx=5)
+        ttk.Checkbutton(profile_frame, text="Sampling Profiler", variable=self.profiler_enabled,
+                        command=self.toggle_profiler).pack(side="left", padx=5)
+        ttk.Button(profile_frame, text="Frame Summary", command=self.log_trace_summary).pack(side="left", padx=5)
+        ttk.Button(profile_frame, text="Export Trace", command=self.export_trace).pack(side="left", padx=5)
+        
+        # User scripts
+        script_frame = ttk.LabelFrame(parent, text="Scripts", padding=10)
+        script_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Button(script_frame, text="Reload Scripts", command=self.reload_scripts).pack(side="left", padx=5)
+        self.script_status = ttk.Label(script_frame, text="No scripts", foreground="gray")
+        self.script_status.pack(side="left", padx=10)
+        
         # Channel monitor
         monitor_frame = ttk.LabelFrame(parent, text="Channel Monitor", padding=10)
         monitor_frame.pack(fill="x", padx=10, pady=5)
@@ -494,8 +1306,8 @@ TECHNICAL DETAILS:
 • Universe Size: 512 channels
 
 LOG FILES:
-Located in: ./logs/
-Retention: Last 10 sessions
+Located in: ./logs/ (JSON lines, indexed)
+Retention: 20 files of 5 MB, gzip-compressed
 
 ═══════════════════════════════════════
 """
@@ -523,111 +1335,22 @@ Retention: Last 10 sessions
                 self.gamepad_enabled.set(False)
                 return
             
-            self.logger.info("Gamepad pan/tilt control enabled")
+            self.gamepads.enabled = True
+            self.logger.info("Gamepad control enabled")
             self.gamepad_status.config(text="Status: Active 🎮", foreground="green")
-            self.start_gamepad_thread()
         else:
-            self.logger.info("Gamepad pan/tilt control disabled")
+            self.gamepads.enabled = False
+            self.watchdog.rest('gamepads')
+            self.logger.info("Gamepad control disabled")
             self.gamepad_status.config(text="Status: Disabled", foreground="gray")
     
-    def refresh_gamepad(self):
-        """Refresh gamepad detection"""
-        self.init_gamepad()
-        # Recreate UI to show updated status
-        messagebox.showinfo("Refresh", "Gamepad status updated. Please restart the application to see changes.")
-    
-    def start_gamepad_thread(self):
-        """Start gamepad reading thread"""
-        if self.gamepad_thread is None or not self.gamepad_thread.is_alive():
-            self.gamepad_thread = threading.Thread(target=self.gamepad_loop, daemon=True)
-            self.gamepad_thread.start()
-    
-    def gamepad_loop(self):
-        """Main gamepad reading loop"""
-        self.logger.info("Gamepad control loop started")
-        
-        while self.gamepad_enabled.get() and self.running:
-            try:
-                pygame.event.pump()  # Process event queue
-                
-                if self.gamepad:
-                    # Read left analog stick (PS5 DualSense)
-                    # Axis 0: Left stick X (horizontal) -> Pan (Channel 1)
-                    # Axis 1: Left stick Y (vertical) -> Tilt (Channel 2)
-                    # Axis 5: R2 trigger -> Dimming (Channel 6)
-                    
-                    left_x = self.gamepad.get_axis(0)  # -1.0 to 1.0
-                    left_y = self.gamepad.get_axis(1)  # -1.0 to 1.0
-                    
-                    # Read R2 trigger (Axis 5 on PS5 DualSense)
-                    r2_trigger = self.gamepad.get_axis(5) if self.gamepad.get_numaxes() > 5 else -1.0
-                    
-                    # Read L2 trigger (Axis 4 on PS5 DualSense)
-                    l2_trigger = self.gamepad.get_axis(4) if self.gamepad.get_numaxes() > 4 else -1.0
-                    
-                    # Read face buttons (PS5 DualSense)
-                    # Button 0: X -> Color value 5
-                    # Button 2: Square -> Color value 18  
-                    # Button 1: Circle -> Color value 34
-                    x_button = self.gamepad.get_button(0)
-                    square_button = self.gamepad.get_button(2)
-                    circle_button = self.gamepad.get_button(1)
-                    
-                    # Handle button presses for Channel 3 (Color)
-                    if x_button:
-                        color_value = 5
-                    elif square_button:
-                        color_value = 18
-                    elif circle_button:
-                        color_value = 34
-                    else:
-                        color_value = self.controller.dmx_data[2]  # Keep current value
-                    
-                    # Apply deadzone (ignore small movements)
-                    deadzone = 0.1
-                    if abs(left_x) < deadzone:
-                        left_x = 0
-                    if abs(left_y) < deadzone:
-                        left_y = 0
-                    
-                    # Convert to DMX values (0-255)
-                    # Map -1.0 to 1.0 -> 0 to 255
-                    pan_value = int((left_x + 1.0) * 127.5)
-                    tilt_value = int((left_y + 1.0) * 127.5)
-                    
-                    # R2 trigger: -1.0 (not pressed) to +1.0 (fully pressed) -> 0 to 255
-                    dimmer_value = int((r2_trigger + 1.0) * 127.5)
-                    
-                    # L2 trigger: -1.0 (not pressed) to +1.0 (fully pressed) -> 0 to 249 (max)
-                    strobe_value = int((l2_trigger + 1.0) * 124.5)  # Max 249
-                    
-                    # Clamp values
-                    pan_value = max(0, min(255, pan_value))
-                    tilt_value = max(0, min(255, tilt_value))
-                    dimmer_value = max(0, min(255, dimmer_value))
-                    strobe_value = max(0, min(249, strobe_value))  # Max 249
-                    
-                    # Update DMX channels
-                    self.controller.set_channel(1, pan_value)  # Horizontal
-                    self.controller.set_channel(2, tilt_value)  # Vertical
-                    self.controller.set_channel(3, color_value)  # Color (buttons)
-                    self.controller.set_channel(5, strobe_value)  # Strobe (L2)
-                    self.controller.set_channel(6, dimmer_value)  # Dimming (R2)
-                    
-                    # Update GUI sliders (in main thread)
-                    self.root.after(0, lambda pv=pan_value: self.update_slider_from_gamepad(1, pv))
-                    self.root.after(0, lambda tv=tilt_value: self.update_slider_from_gamepad(2, tv))
-                    self.root.after(0, lambda cv=color_value: self.update_slider_from_gamepad(3, cv))
-                    self.root.after(0, lambda sv=strobe_value: self.update_slider_from_gamepad(5, sv))
-                    self.root.after(0, lambda dv=dimmer_value: self.update_slider_from_gamepad(6, dv))
-                
-                time.sleep(0.02)  # 50 Hz update rate
-                
-            except Exception as e:
-                self.logger.error(f"Gamepad loop error: {e}")
-                time.sleep(0.1)
-        
-        self.logger.info("Gamepad control loop stopped")
+    def update_gamepad_info(self):
+        """Show the connected gamepads and their profiles"""
+        pads = self.gamepads.describe()
+        if pads:
+            self.gamepad_info.config(text="✅ " + ", ".join(pads), foreground="green")
+        else:
+            self.gamepad_info.config(text="❌ No gamepad detected (plug one in)", foreground="red")
     
     def update_slider_from_gamepad(self, channel, value):
         """Update slider value from gamepad (called from main thread)"""
@@ -656,26 +1379,222 @@ Retention: Last 10 sessions
             messagebox.showerror("Error", f"Failed to export logs: {e}")
             self.logger.error(f"Failed to export logs: {e}")
     
-    def update_log_display(self):
-        """Update the log display with recent log entries"""
+    def toggle_trace(self):
+        """Turn frame tracing on or off"""
+        if self.trace_enabled.get():
+            self.scheduler.tracer.clear()
+            self.scheduler.tracer.enable()
+            self.logger.info("Frame tracing enabled")
+        else:
+            self.scheduler.tracer.disable()
+            self.logger.info("Frame tracing disabled")
+    
+    def toggle_profiler(self):
+        """Start or stop the sampling profiler"""
+        if self.profiler_enabled.get():
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+            self.logger.info("Sampling profiler started")
+        elif self.profiler is not None:
+            self.profiler.stop()
+            self.logger.info(f"Sampling profiler stopped after {self.profiler.samples} samples")
+    
+    def log_trace_summary(self):
+        """Log where the frame time goes, per stage"""
+        stats = self.scheduler.tracer.summary()
+        if stats:
+            self.logger.info("Frame trace summary:\n" + format_summary(stats, self.scheduler.interval * 1000))
+        else:
+            self.logger.info("No frames traced yet, enable Trace Frames while connected")
+        if self.profiler is not None:
+            top = ", ".join(f"{name} ({samples})" for name, samples in self.profiler.top(5))
+            self.logger.info(f"Profiler hot spots: {top}")
+    
+    def export_trace(self):
+        """Export the frame trace (Chrome trace / Perfetto JSON) and profiler stacks"""
         try:
-            # Get the most recent log file
-            log_files = sorted([f for f in os.listdir('logs') if f.endswith('.log')])
-            if log_files:
-                latest_log = os.path.join('logs', log_files[-1])
-                with open(latest_log, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    # Show last 100 lines
-                    recent_lines = lines[-100:] if len(lines) > 100 else lines
-                    self.log_display.delete(1.0, tk.END)
-                    self.log_display.insert(1.0, ''.join(recent_lines))
-                    self.log_display.see(tk.END)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            trace_file = f"logs/trace_{stamp}.json"
+            spans = self.scheduler.tracer.export(trace_file)
+            message = f"{spans} spans exported to {trace_file}"
+            if self.profiler is not None:
+                profile_file = f"logs/profile_{stamp}.folded"
+                self.profiler.export(profile_file)
+                message += f"\nProfiler stacks exported to {profile_file}"
+            messagebox.showinfo("Success", message)
+            self.logger.info(message)
         except Exception as e:
-            pass
+            messagebox.showerror("Error", f"Failed to export trace: {e}")
+            self.logger.error(f"Failed to export trace: {e}")
+    
+    def create_fixtures_tab(self, parent):
+        """Create the RDM discovery and addressing interface"""
+        control_frame = ttk.LabelFrame(parent, text="RDM", padding=10)
+        control_frame.pack(fill="x", padx=10, pady=5)
+        
+        ttk.Button(control_frame, text="Discover", command=self.rdm_discover).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="Full Rediscovery",
+                   command=lambda: self.rdm_discover(full=True)).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="Identify", command=self.rdm_identify).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="Patch Discovered", command=self.patch_discovered).pack(side="left", padx=5)
+        self.rdm_status = ttk.Label(control_frame, text=f"{len(self.rdm.devices)} cached devices", foreground="gray")
+        self.rdm_status.pack(side="left", padx=10)
+        
+        list_frame = ttk.LabelFrame(parent, text="Devices", padding=10)
+        list_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        columns = ('uid', 'label', 'model', 'footprint', 'address')
+        self.rdm_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=12)
+        for column, heading, width in zip(columns, ("UID", "Label", "Model", "Footprint", "Address"),
+                                          (130, 220, 80, 80, 80)):
+            self.rdm_tree.heading(column, text=heading)
+            self.rdm_tree.column(column, width=width)
+        self.rdm_tree.pack(fill="both", expand=True)
+        
+        address_frame = ttk.Frame(list_frame)
+        address_frame.pack(fill="x", pady=5)
+        ttk.Label(address_frame, text="Start Address:").pack(side="left", padx=5)
+        self.rdm_address = tk.IntVar(value=1)
+        ttk.Spinbox(address_frame, from_=1, to=512, textvariable=self.rdm_address, width=6).pack(side="left", padx=5)
+        ttk.Button(address_frame, text="Set Address", command=self.rdm_set_address).pack(side="left", padx=5)
+        
+        self.refresh_rdm_devices()
+    
+    def refresh_rdm_devices(self):
+        """Show the discovered (or cached) RDM devices"""
+        self.rdm_tree.delete(*self.rdm_tree.get_children())
+        for device in sorted(self.rdm.devices.values(), key=lambda device: device.start_address):
+            address = "-" if not device.footprint else device.start_address
+            self.rdm_tree.insert('', 'end', iid=format_uid(device.uid),
+                                 values=(format_uid(device.uid), device.label, f"{device.model:04X}",
+                                         device.footprint, address))
+    
+    def rdm_ready(self):
+        """Check that an RDM job can be queued now"""
+        if not self.running:
+            messagebox.showwarning("Warning", "Please connect to a DMX interface first!")
+            return False
+        if self.rdm.port is None:
+            messagebox.showerror("RDM", "RDM needs a DMX USB Pro-compatible serial widget in this process.\n\n"
+                                        "uDMX interfaces are transmit-only, and the separate output process "
+                                        "keeps the device to itself.")
+            return False
+        if self.rdm.busy:
+            messagebox.showinfo("RDM", "An RDM job is still running")
+            return False
+        return True
+    
+    def rdm_finished(self, result):
+        # Runs on the output thread; the channel monitor picks the result up
+        self.rdm_result = result
+    
+    def rdm_submit(self, job, status):
+        self.rdm.submit(job, self.rdm_finished)
+        self.rdm_status.config(text=status, foreground="orange")
+    
+    def rdm_discover(self, full=False):
+        """Discover the RDM devices on the line"""
+        if self.rdm_ready():
+            self.logger.info(f"RDM {'full ' if full else ''}discovery started")
+            self.rdm_submit(self.rdm.discover(full), "Discovering...")
+    
+    def selected_rdm_uid(self):
+        selection = self.rdm_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Select a device first")
+            return None
+        return parse_uid(selection[0])
+    
+    def rdm_identify(self):
+        """Toggle identify mode on the selected device"""
+        uid = self.selected_rdm_uid()
+        if uid is None or not self.rdm_ready():
+            return
+        on = uid not in self.rdm_identifying
+        self.rdm_identifying.symmetric_difference_update({uid})
+        self.rdm_submit(self.rdm.identify(uid, on), f"Identify {'on' if on else 'off'}: {format_uid(uid)}")
+    
+    def rdm_set_address(self):
+        """Set the start address of the selected device"""
+        uid = self.selected_rdm_uid()
+        if uid is None or not self.rdm_ready():
+            return
+        try:
+            address = self.rdm_address.get()
+        except tk.TclError:
+            messagebox.showerror("Error", "Start address must be a number")
+            return
+        self.rdm_submit(self.rdm.set_start_address(uid, address), f"Setting {format_uid(uid)} to {address}...")
+    
+    def rdm_done(self, result):
+        """Show the outcome of the last RDM job"""
+        if isinstance(result, RDMError):
+            self.rdm_status.config(text=f"Failed: {result}", foreground="red")
+            messagebox.showerror("RDM", str(result))
+            return
+        self.rdm_status.config(text=f"{len(self.rdm.devices)} devices, {self.rdm.transactions} transactions, "
+                                    f"{self.rdm.timeouts} timeouts", foreground="green")
+        self.refresh_rdm_devices()
+    
+    def patch_discovered(self):
+        """Patch the discovered devices whose footprint matches a fixture type"""
+        entries = patch_entries(self.rdm.devices.values())
+        if not entries:
+            messagebox.showinfo("RDM", "No discovered device matches a known fixture type")
+            return
+        if not messagebox.askyesno("RDM", f"Add {len(entries)} discovered fixtures to the patch?\n\n"
+                                          "Fixtures with the same name are replaced."):
+            return
+        try:
+            config = {}
+            if os.path.exists('config.json'):
+                with open('config.json', 'r') as f:
+                    config = json.load(f)
+            names = {entry['name'] for entry in entries}
+            existing = [data for data in config.get('patch', []) if data['name'] not in names]
+            config['patch'] = existing + entries
+            self.load_patch(config)
+            with open('config.json', 'w') as f:
+                json.dump(config, f, indent=2)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not patch the discovered fixtures: {e}")
+            self.logger.error(f"Could not patch the discovered fixtures: {e}")
+    
+    def update_log_display(self):
+        """Show the most recent log entries, kept in memory by the log store"""
+        if self.log_query is None:
+            lines = [format_entry(entry) for entry in self.log_store.recent(100)]
+            self.log_display.delete(1.0, tk.END)
+            self.log_display.insert(1.0, '\n'.join(lines))
+            self.log_display.see(tk.END)
         
         # Schedule next update
         self.root.after(2000, self.update_log_display)
     
+    def search_logs(self):
+        """Query the log store by time range, event type, level and text"""
+        try:
+            start = parse_time(self.log_from.get()) if self.log_from.get().strip() else None
+            end = parse_time(self.log_to.get()) if self.log_to.get().strip() else None
+        except ValueError as e:
+            messagebox.showerror("Log Search", f"{e}\n\nUse HH:MM[:SS] or YYYY-MM-DD HH:MM[:SS]")
+            return
+        event = self.log_event.get()
+        level = self.log_level.get()
+        self.log_query = dict(start=start, end=end, event=None if event == "all" else event,
+                              level=None if level == "all" else level, text=self.log_text.get() or None)
+        entries = self.log_store.query(limit=LOG_SEARCH_LIMIT, **self.log_query)
+        self.log_display.delete(1.0, tk.END)
+        self.log_display.insert(1.0, '\n'.join(format_entry(entry) for entry in entries))
+        self.log_search_status.config(text=f"{len(entries)} entries" +
+                                      (" (limit reached)" if len(entries) >= LOG_SEARCH_LIMIT else ""))
+    
+    def show_live_logs(self):
+        """Leave the search results and follow the live log again"""
+        self.log_query = None
+        self.log_search_status.config(text="Live")
+        self.update_log_display()
+    
     def update_channel_monitor(self):
         """Update the channel monitor display"""
         if self.running:
@@ -695,17 +1614,117 @@ Retention: Last 10 sessions
             
             # Update stats
             if hasattr(self, 'frames_label'):
-                self.frames_label.config(text=f"Frames: {self.controller.frame_count}")
-                self.errors_label.config(text=f"Errors: {self.controller.error_count}")
+                frames, errors = self.controller.frame_count, self.controller.error_count
+                if self.engine is not None:
+                    frames, errors, _ = self.engine.stats()
+                    if not self.engine.alive:
+                        self.status_label.config(text="Status: Output process stopped", foreground="red")
+                self.frames_label.config(text=f"Frames: {frames}")
+                self.errors_label.config(text=f"Errors: {errors}")
                 
                 # Calculate FPS
                 if self.controller.last_send_time > 0:
                     fps = 1.0 / (self.controller.last_send_time + 0.025)
                     self.fps_label.config(text=f"FPS: {fps:.1f}")
         
+        if self.timecode_source is not None and hasattr(self, 'timecode_label'):
+            state = self.show_clock.state
+            colors = {STATE_LOCKED: "green", STATE_FREEWHEEL: "orange"}
+            self.timecode_label.config(text=self.show_clock.timecode())
+            self.timecode_status.config(text=state.capitalize(), foreground=colors.get(state, "gray"))
+        
+        if self.osc_server is not None and hasattr(self, 'osc_status'):
+            self.osc_status.config(text=f"Port {self.osc_server.address[1]} - {self.osc_server.messages} messages, "
+                                        f"{self.osc_server.unknown} unmapped", foreground="green")
+        
+        # The GUI's own heartbeat: this runs on the Tk main loop every 100 ms
+        now = self.scheduler.clock()
+        self.watchdog.beat('gui', now)
+        if hasattr(self, 'watchdog_label'):
+            stalled = [name for name, _, tripped in self.watchdog.status(now) if tripped]
+            if stalled:
+                self.watchdog_label.config(text=f"Watchdog: {', '.join(stalled)} stalled", foreground="red")
+            else:
+                self.watchdog_label.config(text="Watchdog: OK", foreground="green")
+        
+        if hasattr(self, 'gamepad_info'):
+            self.update_gamepad_info()
+            if self.gamepads.enabled:
+                for (universe, channel), value in self.gamepads.last_values.items():
+                    if universe == 1 and channel <= 9:
+                        self.update_slider_from_gamepad(channel, value)
+        
+        if hasattr(self, 'midi_status'):
+            if self.midi_input.learn_target is not None:
+                self.midi_status.config(text="Move a control...", foreground="orange")
+            elif self.midi_input.last_learned is not None:
+                binding = self.midi_input.last_learned
+                self.midi_status.config(text=f"Learned {control_name(binding.key)}", foreground="green")
+            elif self.midi_input.port is not None:
+                self.midi_status.config(text=f"{self.midi_input.messages} messages", foreground="green")
+        
+        if hasattr(self, 'stage_status'):
+            self.stage_status.config(text=self.visualizer.status())
+        
+        if self.web_server is not None and hasattr(self, 'web_status'):
+            self.web_status.config(text=f"Port {self.web_server.address[1]} - {self.web_server.status()}",
+                                   foreground="green")
+        
+        if self.cluster is not None and hasattr(self, 'cluster_status'):
+            self.cluster_status.config(text=self.cluster.status(self.scheduler.clock()), foreground="green")
+        
+        if self.audio_modulation.enabled and hasattr(self, 'audio_status'):
+            self.update_audio_status()
+        
+        if self.rdm_result is not None:
+            result, self.rdm_result = self.rdm_result, None
+            self.rdm_done(result)
+        
+        if hasattr(self, 'script_status'):
+            suspended = any(script.suspended_until is not None for script in self.scripts.scripts)
+            self.script_status.config(text=self.scripts.status(),
+                                      foreground="orange" if suspended else "green" if self.scripts.scripts else "gray")
+        
+        # Hot-plugged devices and the first background scan
+        if self.device_cache.version != self.devices_shown and hasattr(self, 'port_combo'):
+            self.show_devices()
+        
+        if not self.startup.reported and self.startup.complete(STARTUP_MILESTONES):
+            self.startup.reported = True
+            self.logger.info(f"Startup: {self.startup.summary()}")
+            if self.benchmark_path is not None:
+                self.startup.record(self.benchmark_path, __version__)
+                self.root.after(0, self.on_closing)
+                return
+        
         # Schedule next update
         self.root.after(100, self.update_channel_monitor)
         
+    def create_master_controls(self):
+        """Grandmaster and one submaster per patch group"""
+        if not hasattr(self, 'master_frame'):
+            return
+        for child in self.master_frame.winfo_children():
+            child.destroy()
+        
+        masters = self.controller.masters
+        faders = [("Grand Master", None, masters.grandmaster)]
+        faders += [(group, group, masters.submasters.get(group, 1.0)) for group in self.patch.groups()]
+        
+        for column, (name, group, level) in enumerate(faders):
+            ttk.Label(self.master_frame, text=name).grid(row=0, column=column, padx=10)
+            var = tk.IntVar(value=int(level * 100))
+            scale = ttk.Scale(self.master_frame, from_=100, to=0, orient="vertical", length=80, variable=var,
+                              command=lambda v, g=group: self.update_master(g, float(v) / 100.0))
+            scale.grid(row=1, column=column, padx=10)
+    
+    def update_master(self, group, level):
+        """Apply a grandmaster (group None) or submaster fader move"""
+        if group is None:
+            self.controller.masters.set_grandmaster(level)
+        else:
+            self.controller.masters.set_submaster(group, level)
+    
     def create_channel_control(self, parent, row, label_text, channel, min_val, max_val):
         """Create a standard channel control"""
         ttk.Label(parent, text=label_text, font=("Arial", 10, "bold")).grid(
@@ -725,24 +1744,39 @@ Retention: Last 10 sessions
         return var, scale, label
     
     def refresh_ports(self):
-        """Refresh available UDMX devices"""
-        devices = self.controller.find_udmx_devices()
-        
+        """Rescan for UDMX devices in the background; the list updates when the scan lands"""
+        self.device_cache.refresh()
+    
+    def show_devices(self):
+        """Fill the port list from the device cache"""
+        self.devices_shown = self.device_cache.version
+        if not self.device_cache.ready.is_set():
+            self.port_combo['values'] = [SCANNING_DEVICES]
+            self.port_combo.current(0)
+            return
+        self.startup.mark('devices')
+        devices = self.device_cache.devices
+        selected = self.port_combo.get()
         if devices:
             device_names = [dev['description'] for dev in devices]
             self.port_combo['values'] = device_names
-            self.port_combo.current(0)
+            # Keep the device in use, or the user's pick if it is still there
+            if selected in device_names or self.running:
+                self.port_combo.set(selected)
+            else:
+                self.port_combo.current(0)
             self.logger.info(f"Found {len(devices)} UDMX device(s)")
         else:
-            self.port_combo['values'] = ["No UDMX devices found"]
-            self.port_combo.current(0)
+            self.port_combo['values'] = [NO_DEVICES]
+            if not self.running:
+                self.port_combo.current(0)
             self.logger.warning("No UDMX devices detected")
     
     def toggle_connection(self):
         """Connect or disconnect from UDMX device"""
         if not self.running:
             device_name = self.port_combo.get()
-            if not device_name or device_name == "No UDMX devices found":
+            if not device_name or device_name in (NO_DEVICES, SCANNING_DEVICES):
                 messagebox.showerror("Error", "Please connect a UDMX device and click Refresh")
                 self.logger.warning("Connection attempt without device")
                 return
@@ -751,7 +1785,7 @@ Retention: Last 10 sessions
             device_index = self.port_combo.current()
             
             self.logger.info(f"User initiated connection to {device_name}")
-            if self.controller.connect(device_index):
+            if self.connect_output(device_index):
                 self.running = True
                 self.status_label.config(text="Status: Connected", foreground="green")
                 self.connect_btn.config(text="Disconnect")
@@ -764,19 +1798,342 @@ Retention: Last 10 sessions
         else:
             self.logger.info("User initiated disconnection")
             self.running = False
-            self.controller.disconnect()
+            self.stop_recording()
+            self.stop_playback()
+            self.scheduler.stop()
+            self.disconnect_output()
             self.status_label.config(text="Status: Disconnected", foreground="red")
             self.connect_btn.config(text="Connect")
     
+    def connect_output(self, device_index):
+        """Open the device in this process or in a separate output process"""
+        if not self.engine_mode.get():
+            if not self.controller.connect(device_index, self.device_cache.devices):
+                return False
+            self.rdm.port = self.controller.serial_port
+            return True
+        
+        try:
+            self.engine = OutputEngine.from_config({'output_process': self.engine_options}, rate=FRAME_RATE,
+                                                   logger=self.logger)
+        except ValueError as e:
+            self.logger.error(f"Invalid output process settings: {e}")
+            return False
+        if not self.engine.start([device_index]):
+            self.engine = None
+            return False
+        self.controller.attach_engine(self.engine)
+        return True
+    
+    def disconnect_output(self):
+        """Close the device, stopping the output process if one is running"""
+        self.rdm.port = None
+        self.rdm.jobs.clear()
+        if self.engine is not None:
+            self.controller.detach_engine()
+            self.engine.stop()
+            self.engine = None
+            self.logger.info(f"Session stats - Frames sent: {self.controller.frame_count}, "
+                             f"Errors: {self.controller.error_count}")
+        else:
+            self.controller.disconnect()
+    
     def start_update_thread(self):
-        """Start the DMX update thread"""
-        def update_loop():
-            while self.running:
-                self.controller.send_dmx_frame()
-                time.sleep(0.025)  # ~40 Hz update rate
+        """Start the DMX output scheduler"""
+        self.scheduler.start()
+    
+    def toggle_recording(self):
+        """Start or stop recording the DMX output"""
+        if self.recorder is not None:
+            self.stop_recording()
+            return
+        
+        if not self.running:
+            messagebox.showwarning("Warning", "Please connect to UDMX device first!")
+            return
+        
+        try:
+            self.recorder = ShowRecorder(new_recording_path(), logger=self.logger,
+                                         clock=self.scheduler.clock)
+            self.recorder.start()
+        except Exception as e:
+            self.recorder = None
+            messagebox.showerror("Error", f"Could not start recording: {e}")
+            self.logger.error(f"Could not start recording: {e}")
+            return
+        
+        self.recorder.attach(self.scheduler)
+        self.record_btn.config(text="■ Stop Recording")
+        self.record_status.config(text=f"Recording: {os.path.basename(self.recorder.path)}", foreground="red")
+    
+    def stop_recording(self):
+        """Stop the active recording, if any"""
+        if self.recorder is None:
+            return
+        self.recorder.detach()
+        self.recorder.stop()
+        self.recorder = None
+        if hasattr(self, 'record_btn'):
+            self.record_btn.config(text="● Record")
+            self.record_status.config(text="Idle", foreground="gray")
+    
+    def toggle_playback(self):
+        """Open a recording and play it, or stop the current playback"""
+        if self.player is not None:
+            self.stop_playback()
+            return
+        
+        if not self.running:
+            messagebox.showwarning("Warning", "Please connect to UDMX device first!")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="Open Recording",
+            initialdir=RECORDINGS_DIR if os.path.exists(RECORDINGS_DIR) else ".",
+            filetypes=[("DMX recordings", f"*{RECORDING_EXTENSION}"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        try:
+            reader = ShowReader(path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open recording: {e}")
+            self.logger.error(f"Could not open recording: {e}")
+            return
+        
+        self.player = ShowPlayer(reader, self.scheduler, speed=self.playback_speed(), logger=self.logger)
+        self.player.play()
+        self.play_btn.config(text="■ Stop Playback")
+        self.record_status.config(text=f"Playing: {os.path.basename(path)} ({reader.duration:.1f}s)",
+                                  foreground="green")
+    
+    def stop_playback(self):
+        """Stop the active playback, if any"""
+        if self.player is None:
+            return
+        self.player.stop()
+        self.player.reader.close()
+        self.player = None
+        if hasattr(self, 'play_btn'):
+            self.play_btn.config(text="▶ Play...")
+            self.record_status.config(text="Idle", foreground="gray")
+    
+    def playback_speed(self):
+        """Speed factor selected in the speed combo box"""
+        return float(self.speed_combo.get().rstrip('x'))
+    
+    def change_playback_speed(self, event=None):
+        """Apply a new playback speed"""
+        if self.player is not None:
+            self.player.set_speed(self.playback_speed())
+            self.logger.info(f"Playback speed: {self.playback_speed()}x")
+    
+    def change_timecode_source(self, event=None):
+        """Switch the timecode input selected in the combo box"""
+        self.stop_timecode()
+        selection = self.timecode_combo.get()
+        if selection == "Off":
+            return
         
-        self.update_thread = threading.Thread(target=update_loop, daemon=True)
-        self.update_thread.start()
+        try:
+            if selection.startswith("UDP"):
+                self.timecode_source = UDPTimecodeSource(self.show_clock, logger=self.logger)
+            else:
+                self.timecode_source = MTCSource(self.show_clock, logger=self.logger)
+            self.timecode_source.start()
+        except Exception as e:
+            self.timecode_source = None
+            self.timecode_combo.set("Off")
+            messagebox.showerror("Error", f"Could not start timecode input: {e}")
+            self.logger.error(f"Could not start timecode input: {e}")
+            return
+        
+        # Cue fades follow show time while timecode is in use
+        self.cue_list.timebase = self.show_clock.time
+    
+    def stop_timecode(self):
+        """Stop the timecode input, if any"""
+        if self.timecode_source is None:
+            return
+        self.timecode_source.stop()
+        self.timecode_source = None
+        self.cue_list.timebase = lambda now: now
+        if hasattr(self, 'timecode_label'):
+            self.timecode_label.config(text="--:--:--:--")
+            self.timecode_status.config(text="Off", foreground="gray")
+    
+    def toggle_osc(self):
+        """Start or stop the OSC input server"""
+        if self.osc_enabled.get():
+            self.start_osc()
+        else:
+            self.stop_osc()
+    
+    def start_osc(self):
+        """Start the OSC input server from the 'osc' configuration"""
+        if self.osc_server is not None:
+            return
+        server = OSCServer.from_config({'osc': self.osc_options}, self.scheduler.controllers, self.patch,
+                                       self.cue_list, clock=self.scheduler.clock, logger=self.logger,
+                                       inputs=self.scripts.inputs)
+        try:
+            server.start()
+        except OSError as e:
+            port = self.osc_options.get('port', DEFAULT_OSC_PORT)
+            self.logger.error(f"Could not start OSC input on port {port}: {e}")
+            messagebox.showerror("OSC", f"Could not open UDP port {port}:\n{e}")
+            self.osc_enabled.set(False)
+            return
+        self.osc_server = server
+    
+    def stop_osc(self):
+        """Stop the OSC input server"""
+        if self.osc_server is not None:
+            self.osc_server.stop()
+            self.osc_server = None
+            self.logger.info("OSC input stopped")
+        if hasattr(self, 'osc_status'):
+            self.osc_status.config(text="Off", foreground="gray")
+    
+    def toggle_midi(self):
+        """Open or close the selected MIDI input port"""
+        if self.midi_enabled.get():
+            try:
+                self.midi_input.start(self.midi_port_combo.get())
+            except Exception as e:
+                self.logger.error(f"Could not open MIDI input: {e}")
+                messagebox.showerror("MIDI", f"Could not open MIDI input:\n{e}")
+                self.midi_enabled.set(False)
+        else:
+            self.midi_input.stop()
+            self.midi_status.config(text="Off", foreground="gray")
+    
+    def toggle_web(self):
+        """Start or stop the browser remote"""
+        if self.web_enabled.get():
+            self.start_web()
+        else:
+            self.stop_web()
+    
+    def start_web(self):
+        """Start the HTTP/WebSocket server from the 'web' configuration"""
+        if self.web_server is not None:
+            return
+        server = WebServer.from_config({'web': self.web_options}, self.scheduler.controllers, self.scheduler,
+                                       logger=self.logger)
+        try:
+            server.start()
+        except OSError as e:
+            port = self.web_options.get('port', DEFAULT_WEB_PORT)
+            self.logger.error(f"Could not start the web remote on port {port}: {e}")
+            messagebox.showerror("Web Remote", f"Could not open TCP port {port}:\n{e}")
+            self.web_enabled.set(False)
+            return
+        self.web_server = server
+    
+    def stop_web(self):
+        """Stop the browser remote"""
+        if self.web_server is not None:
+            self.web_server.stop()
+            self.web_server = None
+            self.logger.info("Web remote stopped")
+        if hasattr(self, 'web_status'):
+            self.web_status.config(text="Off", foreground="gray")
+    
+    def toggle_cluster(self):
+        """Join or leave the controller cluster"""
+        if self.cluster_enabled.get():
+            self.start_cluster()
+        else:
+            self.stop_cluster()
+    
+    def start_cluster(self):
+        """Join the cluster described by 'cluster' in config.json"""
+        if self.cluster is not None:
+            return
+        try:
+            self.cluster = ClusterNode.from_config({'cluster': self.cluster_options}, self.scheduler.controllers,
+                                                   self.scheduler, logger=self.logger)
+            self.cluster.start()
+        except (KeyError, ValueError, OSError) as e:
+            self.cluster = None
+            self.logger.error(f"Could not join the cluster: {e}")
+            messagebox.showerror("Cluster", f"Could not join the cluster: {e}\n\n"
+                                            "Set 'node' and 'nodes' under 'cluster' in config.json.")
+            self.cluster_enabled.set(False)
+    
+    def stop_cluster(self):
+        if self.cluster is not None:
+            self.cluster.stop()
+            self.cluster = None
+        if hasattr(self, 'cluster_status'):
+            self.cluster_status.config(text="Off", foreground="gray")
+    
+    def toggle_audio(self):
+        """Start or stop the sound-to-light input"""
+        if not self.audio_enabled.get():
+            self.audio_modulation.enabled = False
+            self.audio_input.stop()
+            self.audio_status.config(text="Off", foreground="gray")
+            return
+        source = self.audio_source_combo.get()
+        if source == "WAV file...":
+            source = filedialog.askopenfilename(title="Audio File", filetypes=[("WAV files", "*.wav")])
+            if not source:
+                self.audio_enabled.set(False)
+                return
+            self.audio_source_combo['values'] = AudioInput.source_names() + [source]
+            self.audio_source_combo.set(source)
+        try:
+            self.audio_input.start(source, loop=self.audio_options.get('loop', True))
+        except Exception as e:
+            self.logger.error(f"Could not open audio input: {e}")
+            messagebox.showerror("Audio", f"Could not open audio input:\n{e}")
+            self.audio_enabled.set(False)
+            return
+        self.audio_modulation.enabled = True
+    
+    def update_audio_status(self):
+        """Levels, tempo and block-to-frame latency of the audio input"""
+        if not self.audio_input.running:
+            self.audio_status.config(text="Input ended", foreground="orange")
+            return
+        values = self.audio_modulation.last_values
+        text = "  ".join(f"{name} {values.get(name, 0.0):.2f}" for name in self.audio_input.analyzer.band_names)
+        if self.audio_input.analyzer.bpm:
+            text += f"  {self.audio_input.analyzer.bpm:.0f} BPM"
+        stats = self.audio_modulation.latency_stats()
+        if stats is not None:
+            text += f"  latency p99 {stats[1]:.0f} ms"
+        self.audio_status.config(text=text, foreground="green")
+    
+    def update_learn_targets(self):
+        """MIDI learn targets: every patched attribute and GO"""
+        targets = {}
+        for fixture in self.patch.fixtures:
+            for attribute in fixture.attributes:
+                targets[f"{fixture.name}: {attribute}"] = {'universe': fixture.universe,
+                                                           'channel': fixture.channel(attribute)}
+        targets["GO Cue"] = {'cue': 'go'}
+        self.learn_targets = targets
+        if hasattr(self, 'learn_combo'):
+            self.learn_combo['values'] = list(targets)
+            self.learn_combo.current(0)
+    
+    def midi_learn(self):
+        """Bind the next MIDI control that moves to the selected target"""
+        if not self.midi_enabled.get():
+            messagebox.showinfo("MIDI", "Enable MIDI input first.")
+            return
+        self.midi_input.last_learned = None
+        self.midi_input.learn(self.learn_targets[self.learn_combo.get()])
+    
+    def go_cue(self):
+        """Fire the next cue in the cue list"""
+        if not self.cue_list.cues:
+            messagebox.showinfo("Cues", "No cues defined. Add a 'cues' list to config.json.")
+            return
+        self.cue_list.go(self.cue_list.timebase(self.scheduler.clock()))
     
     def update_channel(self, channel):
         """Update a DMX channel value"""
@@ -786,20 +2143,19 @@ Retention: Last 10 sessions
         label.config(text=str(value))
         self.controller.set_channel(channel, value)
     
-    def all_off(self):
-        """Turn all channels off"""
-        self.logger.info("All channels off command")
-        for i in range(1, 10):
-            var = getattr(self, f"ch{i}_var", None)
-            if var:
-                var.set(0)
-                self.update_channel(i)
-    
-    def full_brightness(self):
-        """Set full brightness"""
-        self.logger.info("Full brightness command")
-        self.ch6_var.set(255)  # Dimming channel
-        self.update_channel(6)
+    def toggle_blackout(self):
+        """Toggle blackout, applied by the output stage on the next frame"""
+        blackout = not self.controller.masters.blackout
+        self.controller.masters.set_blackout(blackout)
+        self.blackout_btn.config(text="Release Blackout" if blackout else "Blackout")
+        self.logger.info(f"Blackout {'on' if blackout else 'off'}")
+    
+    def toggle_full(self):
+        """Toggle all intensity channels to full, applied by the output stage"""
+        full = not self.controller.masters.full
+        self.controller.masters.set_full(full)
+        self.full_btn.config(text="Release Full" if full else "Full Brightness")
+        self.logger.info(f"Full brightness {'on' if full else 'off'}")
     
     def reposition(self):
         """Trigger reposition function"""
@@ -813,26 +2169,59 @@ Retention: Last 10 sessions
     def on_closing(self):
         """Handle window closing"""
         self.logger.info("Application closing")
-        self.gamepad_enabled.set(False)  # Stop gamepad thread
+        self.gamepads.enabled = False
         self.running = False
-        self.controller.disconnect()
+        self.stop_recording()
+        self.stop_playback()
+        self.stop_timecode()
+        self.stop_osc()
+        self.stop_web()
+        self.visualizer.stop()
+        self.midi_input.stop()
+        self.stop_cluster()
+        self.audio_modulation.enabled = False
+        self.audio_input.stop()
+        self.scheduler.stop()
+        self.disconnect_output()
+        if self.journal is not None:
+            self.journal.close()
+            self.logger.info(f"State journal: {self.journal.status()}")
         
         # Cleanup pygame
-        if self.gamepad:
-            try:
-                pygame.joystick.quit()
-                pygame.quit()
-            except:
-                pass
+        try:
+            self.gamepads.quit()
+        except:
+            pass
+        self.device_cache.stop()
+        
+        if self.trace_path is not None:
+            spans = self.scheduler.tracer.export(self.trace_path)
+            self.logger.info(f"{spans} trace spans written to {self.trace_path}")
+        if self.profiler is not None:
+            self.profiler.stop()
+            if self.profile_path is not None:
+                self.profiler.export(self.profile_path)
+                self.logger.info(f"Profiler stacks written to {self.profile_path}")
         
         self.save_config()
         self.logger.info("Goodbye!")
+        self.log_store.close()
         self.root.destroy()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="DMX Controller for UDMX interfaces")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="Trace every frame and write a Chrome trace / Perfetto JSON file on exit")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Run the sampling profiler and write collapsed stacks on exit")
+    parser.add_argument('--startup-benchmark', metavar='FILE',
+                        help="Start up, append the startup milestones to FILE as a JSON line and exit")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = DMXControllerGUI(root)
+    app = DMXControllerGUI(root, trace_path=args.trace, profile_path=args.profile,
+                           benchmark_path=args.startup_benchmark)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
@@ -0,0 +1,86 @@
+"""
+DMX Cue Lists
+Cues store channel values and a fade time, the cue list fades between them
+"""
+import logging
+import threading
+
+
+class Cue:
+    """A look: target channel values reached over a fade time"""
+
+    def __init__(self, name, values, fade=0.0):
+        self.name = name
+        self.values = {int(channel): int(value) for channel, value in values.items()}
+        self.fade = float(fade)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('name', ''), data.get('values', {}), data.get('fade', 0.0))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'values': {str(channel): value for channel, value in self.values.items()},
+            'fade': self.fade,
+        }
+
+
+class CueList:
+    """Runs cues against a controller, evaluated once per output frame"""
+
+    def __init__(self, controller, cues=None, logger=None):
+        self.controller = controller
+        self.cues = list(cues or [])
+        self.logger = logger or logging.getLogger(__name__)
+        self.timebase = lambda now: now  # Maps scheduler time to cue time
+        self.lock = threading.Lock()
+        self.current = -1
+        self._fade_start = None   # cue time the running fade started at
+        self._fade_from = {}      # channel -> value when the fade started
+        self._fade_done = True
+
+    @classmethod
+    def from_config(cls, controller, config, logger=None):
+        return cls(controller, [Cue.from_dict(c) for c in config.get('cues', [])], logger=logger)
+
+    @property
+    def fading(self):
+        """True while a cue is still writing values"""
+        return not self._fade_done and self.current >= 0
+
+    def go(self, at):
+        """Fire the next cue at cue time at"""
+        if self.current + 1 < len(self.cues):
+            self.goto(self.current + 1, at)
+
+    def goto(self, index, at):
+        """Fire cue index, with its fade starting at cue time at"""
+        if not 0 <= index < len(self.cues):
+            self.logger.warning(f"No cue {index}")
+            return
+        cue = self.cues[index]
+        with self.lock:
+            self.current = index
+            self._fade_start = at
+            self._fade_from = {channel: self.controller.dmx_data[channel - 1] for channel in cue.values}
+            self._fade_done = False
+        self.logger.info(f"Cue {index + 1} '{cue.name}' (fade {cue.fade:.1f}s)")
+
+    def on_frame(self, now):
+        """Write the faded cue values for this frame (scheduler source)"""
+        with self.lock:
+            if self._fade_done or self.current < 0:
+                return
+            cue = self.cues[self.current]
+            elapsed = self.timebase(now) - self._fade_start
+            if elapsed < 0:
+                return  # Scheduled for later in the show
+            progress = 1.0 if cue.fade <= 0 else min(1.0, elapsed / cue.fade)
+
+            values = {}
+            for channel, target in cue.values.items():
+                start = self._fade_from[channel]
+                values[channel] = int(round(start + (target - start) * progress))
+            self.controller.set_channels(values)
+            self._fade_done = progress >= 1.0
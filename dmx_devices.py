@@ -0,0 +1,116 @@
+"""
+DMX Device Index
+Cached list of DMX interfaces, scanned in a background thread and rescanned on hot-plug
+"""
+import logging
+import os
+import threading
+import time
+
+HOTPLUG_POLL = 0.5        # Seconds between checks of the USB bus signature
+RESCAN_INTERVAL = 5.0     # Without a bus signature (Windows, macOS), rescan this often instead
+SCAN_TIMEOUT = 1.0        # Longest the GUI waits for the first scan when it needs a device at startup
+
+# Linux lists every USB device and tty here; reading the names costs far less than
+# enumerating the bus through libusb and changes whenever something is plugged in
+SIGNATURE_DIRS = ('/sys/bus/usb/devices', '/dev/serial/by-id')
+
+
+def bus_signature():
+    """Names of the attached USB and serial devices, None where the OS offers no cheap listing"""
+    names = []
+    found = False
+    for directory in SIGNATURE_DIRS:
+        try:
+            names.extend(os.listdir(directory))
+            found = True
+        except OSError:
+            pass
+    return tuple(sorted(names)) if found else None
+
+
+def device_key(device):
+    dev = device.get('device')
+    if dev is not None:
+        return ('usb', getattr(dev, 'bus', None), getattr(dev, 'address', None), device['product'])
+    return ('serial', device.get('port'))
+
+
+class DeviceIndex:
+    """Devices found by scan(), kept current by a watcher thread; readers never touch the bus"""
+
+    def __init__(self, scan, logger=None, poll=HOTPLUG_POLL, rescan_interval=RESCAN_INTERVAL,
+                 signature=bus_signature, clock=time.monotonic):
+        self.scan = scan  # () -> [device dict] as returned by DMXController.find_udmx_devices
+        self.logger = logger or logging.getLogger(__name__)
+        self.poll = poll
+        self.rescan_interval = rescan_interval
+        self.signature = signature
+        self.clock = clock
+        self.devices = []
+        self.version = 0        # Bumped whenever the device list changes
+        self.scans = 0
+        self.scan_time = None   # Seconds the last scan took
+        self.error = None
+        self.ready = threading.Event()  # Set once the first scan finished
+        self.requested = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="device-index", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.requested.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def refresh(self):
+        """Ask the watcher for a rescan now (the Refresh button); the result arrives in devices"""
+        self.requested.set()
+
+    def wait(self, timeout=SCAN_TIMEOUT):
+        """Devices after the first scan, waiting for it at most timeout seconds"""
+        self.ready.wait(timeout)
+        return self.devices
+
+    def _run(self):
+        signature = None
+        last_scan = None
+        while self.running:
+            current = self.signature()
+            now = self.clock()
+            due = (last_scan is None or self.requested.is_set() or
+                   (current is None and now - last_scan >= self.rescan_interval) or
+                   (current is not None and current != signature))
+            if due:
+                self.requested.clear()
+                signature = current
+                last_scan = now
+                self._scan()
+            self.requested.wait(self.poll)
+
+    def _scan(self):
+        start = time.perf_counter()
+        try:
+            devices = self.scan()
+            self.error = None
+        except Exception as e:
+            devices = []
+            if str(e) != self.error:
+                self.logger.error(f"Device scan failed: {e}")
+            self.error = str(e)
+        self.scan_time = time.perf_counter() - start
+        self.scans += 1
+        if [device_key(d) for d in devices] != [device_key(d) for d in self.devices] or not self.ready.is_set():
+            if self.ready.is_set():
+                self.logger.info(f"Devices changed: {', '.join(d['description'] for d in devices) or 'none'}")
+            self.devices = devices
+            self.version += 1
+        self.ready.set()
@@ -0,0 +1,294 @@
+"""
+DMX Output Engine Process
+Transmits frames from a separate process, reading universes from shared memory
+"""
+import logging
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+UNIVERSE_SIZE = 512
+
+# Shared memory layout:
+#   stop flag     - written only by the parent
+#   status block  - written only by the engine
+#   one slot per universe - sequence counter followed by the frame
+# The parent makes the counter odd while it writes a slot and even when done,
+# so the engine can tell a torn read apart from a complete frame.
+STOP = struct.Struct('<Q')
+STATUS = struct.Struct('<QQQQ')     # state, frames sent, errors, heartbeat
+CONTROL_SIZE = STOP.size + STATUS.size
+SEQUENCE = struct.Struct('<I')
+SLOT_SIZE = 8 + UNIVERSE_SIZE      # Counter padded to 8 bytes
+
+STATE_STARTING = 0
+STATE_RUNNING = 1
+STATE_FAILED = 2
+STATE_STOPPED = 3
+
+# What the engine sends when the parent stops publishing frames
+FAILSAFE_HOLD = 'hold'
+FAILSAFE_BLACKOUT = 'blackout'
+FAILSAFE_TIMEOUT = 1.0
+
+
+class SharedUniverses:
+    """Universe frames in shared memory with a sequence-counter handshake"""
+
+    def __init__(self, count, name=None):
+        size = CONTROL_SIZE + count * SLOT_SIZE
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+            self.owner = True
+        else:
+            # The engine is spawned by the owner and shares its resource
+            # tracker, so attaching does not register a second owner
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.count = count
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+
+    def _slot(self, index):
+        return CONTROL_SIZE + index * SLOT_SIZE
+
+    def sequence(self, index):
+        return SEQUENCE.unpack_from(self.buf, self._slot(index))[0]
+
+    def write(self, index, frame):
+        """Publish a frame (parent side)"""
+        offset = self._slot(index)
+        sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+        SEQUENCE.pack_into(self.buf, offset, (sequence + 1) & 0xFFFFFFFF)
+        self.buf[offset + 8:offset + 8 + len(frame)] = frame
+        SEQUENCE.pack_into(self.buf, offset, (sequence + 2) & 0xFFFFFFFF)
+
+    def read(self, index, retries=100):
+        """Consistent (sequence, frame) copy of a slot, or None if the writer kept it busy"""
+        offset = self._slot(index)
+        for _ in range(retries):
+            before = SEQUENCE.unpack_from(self.buf, offset)[0]
+            if before & 1:
+                continue
+            frame = bytes(self.buf[offset + 8:offset + SLOT_SIZE])
+            if SEQUENCE.unpack_from(self.buf, offset)[0] == before:
+                return before, frame
+        return None
+
+    @property
+    def stop_requested(self):
+        return STOP.unpack_from(self.buf, 0)[0] != 0
+
+    def request_stop(self):
+        STOP.pack_into(self.buf, 0, 1)
+
+    def status(self):
+        """(state, frames sent, errors, heartbeat)"""
+        return STATUS.unpack_from(self.buf, STOP.size)
+
+    def set_status(self, state, frames=0, errors=0, heartbeat=0):
+        STATUS.pack_into(self.buf, STOP.size, state, frames, errors, heartbeat)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def set_process_priority(cpu=None, nice=None, logger=None):
+    """Pin the current process to a CPU and raise its priority, where the OS allows it"""
+    logger = logger or logging.getLogger(__name__)
+    if cpu is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, {cpu})
+                logger.info(f"Output engine pinned to CPU {cpu}")
+            except OSError as e:
+                logger.warning(f"Could not pin output engine to CPU {cpu}: {e}")
+        else:
+            logger.warning("CPU pinning not supported on this platform")
+    if nice:
+        try:
+            os.nice(nice)
+            logger.info(f"Output engine niceness changed by {nice}")
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not change output engine priority: {e}")
+
+
+def engine_main(name, device_indexes, rate, cpu=None, nice=None, failsafe=FAILSAFE_HOLD,
+                failsafe_timeout=FAILSAFE_TIMEOUT):
+    """Output process entry point: send shared universes to the uDMX devices"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger('dmx_engine')
+    shared = SharedUniverses(len(device_indexes), name=name)
+    set_process_priority(cpu, nice, logger)
+
+    from dmx_controller import DMXController
+
+    controllers = []
+    for device_index in device_indexes:
+        controller = DMXController(logger=logger)
+        if not controller.connect(device_index):
+            for connected in controllers:
+                connected.disconnect()
+            shared.set_status(STATE_FAILED)
+            shared.close()
+            return
+        controllers.append(controller)
+
+    shared.set_status(STATE_RUNNING)
+    interval = 1.0 / rate
+    last_sequence = [None] * len(controllers)
+    last_frame = [bytes(UNIVERSE_SIZE)] * len(controllers)
+    heartbeat = 0
+    next_frame = time.monotonic()
+    # The parent publishes every frame, so slots that stop changing mean it stalled
+    last_publish = next_frame
+    failsafe_active = False
+    force_full = [False] * len(controllers)
+    dark = bytes(UNIVERSE_SIZE)
+
+    while not shared.stop_requested:
+        now = time.monotonic()
+        if any(shared.sequence(i) != last_sequence[i] for i in range(len(controllers))):
+            last_publish = now
+            if failsafe_active:
+                logger.info("Parent process publishing again, failsafe released")
+                failsafe_active = False
+                force_full = [True] * len(controllers)
+        elif not failsafe_active and now - last_publish > failsafe_timeout:
+            logger.error(f"No frames from the parent process for {now - last_publish:.1f}s, failsafe: {failsafe}")
+            failsafe_active = True
+            force_full = [True] * len(controllers)
+
+        for i, controller in enumerate(controllers):
+            ranges = []
+            if shared.sequence(i) != last_sequence[i]:
+                snapshot = shared.read(i)
+                if snapshot is not None:
+                    sequence, frame = snapshot
+                    ranges = changed_span(last_frame[i], frame)
+                    last_sequence[i] = sequence
+                    last_frame[i] = frame
+            if force_full[i]:
+                ranges = None
+                force_full[i] = False
+            controller.frame_ranges = ranges
+            if failsafe_active and failsafe == FAILSAFE_BLACKOUT:
+                controller.send_dmx_frame(dark)
+            else:
+                controller.send_dmx_frame(last_frame[i])
+
+        heartbeat += 1
+        shared.set_status(STATE_RUNNING, sum(c.frame_count for c in controllers),
+                          sum(c.error_count for c in controllers), heartbeat)
+
+        next_frame += interval
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -interval:
+            next_frame = time.monotonic()
+
+    for controller in controllers:
+        controller.disconnect()
+    shared.set_status(STATE_STOPPED, sum(c.frame_count for c in controllers),
+                      sum(c.error_count for c in controllers), heartbeat)
+    shared.close()
+
+
+def changed_span(old, new):
+    """Single (start, end) range covering every difference, as a list"""
+    if old == new:
+        return []
+    start = 0
+    while old[start] == new[start]:
+        start += 1
+    end = len(new)
+    while old[end - 1] == new[end - 1]:
+        end -= 1
+    return [(start, end)]
+
+
+class OutputEngine:
+    """Parent-side handle for the output process"""
+
+    def __init__(self, universes=1, rate=40, cpu=None, nice=None, failsafe=FAILSAFE_HOLD,
+                 failsafe_timeout=FAILSAFE_TIMEOUT, logger=None):
+        if failsafe not in (FAILSAFE_HOLD, FAILSAFE_BLACKOUT):
+            raise ValueError(f"Unknown failsafe: {failsafe}")
+        self.universes = universes
+        self.rate = rate
+        self.cpu = cpu
+        self.nice = nice
+        self.failsafe = failsafe
+        self.failsafe_timeout = failsafe_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.shared = None
+        self.process = None
+
+    @classmethod
+    def from_config(cls, config, universes=1, rate=40, logger=None):
+        options = config.get('output_process', {})
+        return cls(universes, rate, options.get('cpu'), options.get('nice'),
+                   options.get('failsafe', FAILSAFE_HOLD), options.get('failsafe_timeout', FAILSAFE_TIMEOUT), logger)
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self, device_indexes, timeout=5.0):
+        """Start the output process and wait until its devices are connected"""
+        self.shared = SharedUniverses(self.universes)
+        # Spawn instead of fork: the GUI process has Tk, pygame and USB state
+        # that must not be duplicated into the engine
+        context = multiprocessing.get_context('spawn')
+        self.process = context.Process(target=engine_main, name="dmx-output-engine", daemon=True,
+                                       args=(self.shared.name, list(device_indexes), self.rate,
+                                             self.cpu, self.nice, self.failsafe, self.failsafe_timeout))
+        self.process.start()
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.is_alive():
+            state = self.shared.status()[0]
+            if state == STATE_RUNNING:
+                self.logger.info(f"Output engine running (pid {self.process.pid})")
+                return True
+            if state == STATE_FAILED:
+                break
+            time.sleep(0.02)
+
+        self.logger.error("Output engine failed to start")
+        self.stop()
+        return False
+
+    def publish(self, slot, frame):
+        """Hand a rendered frame to the output process"""
+        if self.shared is not None:
+            self.shared.write(slot, frame)
+
+    def stats(self):
+        """(frames sent, errors, heartbeat) reported by the output process"""
+        if self.shared is None:
+            return 0, 0, 0
+        _, frames, errors, heartbeat = self.shared.status()
+        return frames, errors, heartbeat
+
+    def stop(self):
+        """Ask the output process to stop, terminating it if it does not"""
+        if self.process is not None:
+            if self.shared is not None:
+                self.shared.request_stop()
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.logger.warning("Output engine did not stop, terminating")
+                self.process.terminate()
+                self.process.join(timeout=1.0)
+            self.process = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
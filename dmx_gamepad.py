@@ -0,0 +1,293 @@
+"""
+DMX Gamepad Input
+Several gamepads at once, hot-plugged, each with its own mapping profile, read in one pass per frame
+"""
+import logging
+import os
+import threading
+import time
+
+from dmx_output import compile_lut
+
+pygame = None  # Imported by GamepadManager.init(), which runs off the startup path
+
+EVENT_INTERVAL = 0.005  # Seconds between event pumps; SDL refreshes the axes only when pumped
+
+# PS5 DualSense on the 9-channel moving head at address 1: the original hard-coded mapping
+DEFAULT_PROFILE = {
+    'name': 'DualSense',
+    'match': '',
+    'universe': 1,
+    'deadzone': 0.1,
+    'axes': [
+        {'axis': 0, 'channel': 1, 'mode': 'stick'},              # Left stick X -> Pan
+        {'axis': 1, 'channel': 2, 'mode': 'stick'},              # Left stick Y -> Tilt
+        {'axis': 4, 'channel': 5, 'mode': 'trigger', 'max': 249},  # L2 -> Strobe (limited)
+        {'axis': 5, 'channel': 6, 'mode': 'trigger'},            # R2 -> Dimming
+    ],
+    'buttons': [
+        {'button': 0, 'channel': 3, 'value': 5},     # X -> Color 5
+        {'button': 2, 'channel': 3, 'value': 18},    # Square -> Color 18
+        {'button': 1, 'channel': 3, 'value': 34},    # Circle -> Color 34
+    ],
+}
+
+
+class GamepadProfile:
+    """A mapping profile compiled to (axis, target, lookup table) and (button, target, value) lists"""
+
+    def __init__(self, data, patch=None):
+        self.name = data.get('name', 'Gamepad')
+        self.match = data.get('match', '').lower()
+        self.deadzone = float(data.get('deadzone', 0.1))
+        universe = int(data.get('universe', 1))
+        fixture = patch.fixture(data['fixture']) if 'fixture' in data else None
+
+        def target(entry):
+            if 'attribute' in entry:
+                owner = patch.fixture(entry['fixture']) if 'fixture' in entry else fixture
+                if owner is None:
+                    raise ValueError(f"Profile '{self.name}' maps '{entry['attribute']}' without a fixture")
+                return owner.universe, owner.channel(entry['attribute'])
+            return int(entry.get('universe', universe)), int(entry['channel'])
+
+        self.axes = []
+        for entry in data.get('axes', []):
+            lut = compile_lut(entry.get('curve', 'linear'), entry.get('min', 0), entry.get('max', 255),
+                              entry.get('invert', False))
+            self.axes.append((int(entry['axis']), target(entry), entry.get('mode', 'stick') == 'stick', lut))
+        self.buttons = [(int(entry['button']), target(entry), int(entry['value']))
+                        for entry in data.get('buttons', [])]
+
+    def matches(self, name):
+        return self.match in name.lower()
+
+    def read(self, joystick, values, last=None):
+        """Add this pad's current targets to values {(universe, channel): value}
+
+        With last ({axis index: value} of this pad's previous read, updated in place) an axis at rest
+        that has not moved is left out, so it does not overwrite another pad driving the same channel
+        """
+        axis_count = joystick.get_numaxes()
+        deadzone = self.deadzone
+        for index, (axis, key, stick, lut) in enumerate(self.axes):
+            x = joystick.get_axis(axis) if axis < axis_count else -1.0
+            if stick and abs(x) < deadzone:
+                x = 0.0
+            value = int(lut[min(255, max(0, int((x + 1.0) * 127.5)))])
+            if last is not None:
+                resting = x == 0.0 if stick else x < deadzone - 1.0  # Triggers rest at -1.0
+                if resting and last.get(index) == value:
+                    continue
+                last[index] = value
+            values[key] = value
+        button_count = joystick.get_numbuttons()
+        pressed = set()
+        for button, key, value in self.buttons:
+            # The first pressed button in profile order wins; released buttons leave the channel alone
+            if key not in pressed and button < button_count and joystick.get_button(button):
+                values[key] = value
+                pressed.add(key)
+
+
+class GamepadManager:
+    """Open gamepads and their profiles, polled once per output frame (scheduler source)"""
+
+    def __init__(self, controllers, profiles=None, patch=None, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.logger = logger or logging.getLogger(__name__)
+        self.profile_data = list(profiles or [])
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.ready = False      # pygame imported and its joystick support started
+        self.pads = {}          # instance id -> (joystick, profile)
+        self.axis_values = {}   # instance id -> {axis index: value} of the pad's last read
+        self.event_thread = None
+        self.last_values = {}   # (universe, channel) -> value written on the last frame
+        self.watchdog = None    # Gets a 'gamepads' heartbeat on every frame a pad was read
+        self.set_patch(patch)
+
+    @classmethod
+    def from_config(cls, config, controllers, patch=None, logger=None):
+        return cls(controllers, config.get('gamepads', {}).get('profiles', []), patch, logger)
+
+    def set_patch(self, patch):
+        """Compile the profiles against a patch and re-assign open pads"""
+        profiles = []
+        for data in self.profile_data:
+            try:
+                profiles.append(GamepadProfile(data, patch))
+            except (KeyError, ValueError) as e:
+                self.logger.warning(f"Skipping gamepad profile '{data.get('name')}': {e}")
+        self.default_profile = GamepadProfile(DEFAULT_PROFILE)
+        with self.lock:
+            self.profiles = profiles
+            joysticks = [joystick for joystick, _ in self.pads.values()]
+            self.pads = {}
+        for joystick in joysticks:
+            self.add_joystick(joystick)
+
+    def _assign(self, name):
+        # First matching profile not already in use, so two identical pads get different profiles
+        used = {id(profile) for _, profile in self.pads.values()}
+        for profile in self.profiles:
+            if profile.matches(name) and id(profile) not in used:
+                return profile
+        for profile in self.profiles:
+            if profile.matches(name):
+                return profile
+        return self.default_profile
+
+    def init(self):
+        """Import pygame, start joystick support and open the pads already connected
+
+        Slow; run it on the thread that will pump the events (run_events or pump)
+        """
+        global pygame
+        import pygame
+        # pygame only hands out events once its video subsystem is up. SDL's dummy driver provides
+        # the event queue without a windowing system (no Cocoa, X11 or Win32), so any thread can own it
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.display.init()
+        pygame.joystick.init()
+        self.scan()
+        self.ready = True
+
+    def run_events(self):
+        """Pump the event queue until quit(), then shut pygame down (blocks; call on the thread that ran init)
+
+        SDL expects its events pumped on the thread that initialized it, and the axis values are only
+        refreshed by pumping, so the output thread just reads the pads
+        """
+        self.event_thread = threading.current_thread()
+        try:
+            while self.pump():
+                time.sleep(EVENT_INTERVAL)
+        finally:
+            self.event_thread = None
+            pygame.joystick.quit()
+            pygame.quit()
+
+    def pump(self):
+        """One pass of run_events for a caller with its own loop; False once pumping has to stop"""
+        if not self.ready:
+            return False
+        try:
+            self.handle_events()
+        except pygame.error as e:
+            self.logger.error(f"Gamepad event error: {e}")
+            self.ready = False
+            return False
+        return True
+
+    def quit(self):
+        """Close the pads and shut pygame down, on the event thread when one is running"""
+        if not self.ready:
+            return
+        self.ready = False
+        with self.lock:
+            self.pads = {}
+            self.axis_values = {}
+        thread = self.event_thread
+        if thread is not None:
+            thread.join(timeout=1.0)
+        else:
+            pygame.joystick.quit()
+            pygame.quit()
+
+    def scan(self):
+        """Open every gamepad already connected"""
+        for index in range(pygame.joystick.get_count()):
+            self.open_device(index)
+
+    def open_device(self, device_index):
+        try:
+            joystick = pygame.joystick.Joystick(device_index)
+            joystick.init()
+        except pygame.error as e:
+            self.logger.error(f"Could not open gamepad {device_index}: {e}")
+            return
+        self.add_joystick(joystick)
+
+    def add_joystick(self, joystick):
+        instance = joystick.get_instance_id()
+        with self.lock:
+            if instance in self.pads:
+                return
+            profile = self._assign(joystick.get_name())
+            self.pads[instance] = (joystick, profile)
+            self.axis_values[instance] = {}
+        self.logger.info(f"Gamepad connected: {joystick.get_name()} -> profile '{profile.name}' "
+                         f"(axes: {joystick.get_numaxes()}, buttons: {joystick.get_numbuttons()})")
+
+    def remove_joystick(self, instance):
+        with self.lock:
+            pad = self.pads.pop(instance, None)
+            self.axis_values.pop(instance, None)
+        if pad is not None:
+            self.logger.info(f"Gamepad disconnected: {pad[0].get_name()}")
+
+    def handle_events(self):
+        """Apply hot-plug events; all other events are dropped, nothing else reads the queue"""
+        for event in pygame.event.get():
+            if event.type == pygame.JOYDEVICEADDED:
+                self.open_device(event.device_index)
+            elif event.type == pygame.JOYDEVICEREMOVED:
+                self.remove_joystick(event.instance_id)
+
+    def control(self, kind, number, pad=0):
+        """Axis (-1.0 to 1.0) or button (0/1) of the pad-th open gamepad, 0 when there is no such control"""
+        with self.lock:
+            pads = list(self.pads.values())
+        if pad >= len(pads):
+            return 0
+        joystick = pads[pad][0]
+        try:
+            if kind == 'axis':
+                return joystick.get_axis(number) if number < joystick.get_numaxes() else 0.0
+            return joystick.get_button(number) if number < joystick.get_numbuttons() else 0
+        except pygame.error:
+            return 0
+
+    def describe(self):
+        with self.lock:
+            return [f"{joystick.get_name()} ({profile.name})" for joystick, profile in self.pads.values()]
+
+    def on_frame(self, now):
+        """Read the pads (scheduler source); hot-plug events are handled by run_events"""
+        if not self.ready:
+            return
+        self.poll(now)
+
+    def poll(self, now=None):
+        """Read every pad and write their targets, one set_channels per universe
+
+        Pads sharing a channel are merged: only axes that are off rest or moved are written, the
+        last such pad wins, and a channel no pad is moving keeps whatever else set it
+        """
+        if not self.enabled:
+            return
+        values = {}
+        with self.lock:
+            pads = [(pad, self.axis_values.setdefault(instance, {})) for instance, pad in self.pads.items()]
+        read = False
+        for (joystick, profile), last in pads:
+            try:
+                profile.read(joystick, values, last)
+                read = True
+            except pygame.error as e:
+                self.logger.debug(f"Gamepad read error: {e}")
+        # Only a pad that answered counts as alive: no pads or only failing reads let the watchdog trip
+        if read and now is not None and self.watchdog is not None:
+            self.watchdog.beat('gamepads', now)
+        if not values:
+            return
+
+        writes = {}
+        for (universe, channel), value in values.items():
+            writes.setdefault(universe, {})[channel] = value
+        for universe, channels in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None:
+                controller.set_channels(channels)
+        self.last_values = values
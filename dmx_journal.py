@@ -0,0 +1,304 @@
+"""
+DMX State Journal
+Crash-safe journal of the live universes: fsync-batched deltas on top of compacted snapshots,
+replayed on startup so the rig comes back with its last look
+"""
+import argparse
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from dmx_recorder import diff_runs, encode_runs, apply_runs, runs_size, UNIVERSE_SIZE
+
+# Files in the journal directory:
+#   snapshot - header, then a keyframe record for every universe
+#   journal  - header, then delta records appended in fsync'd batches
+#   records  - record header (payload size, CRC-32 of the payload), then time, universe and a run list
+# Both headers carry a generation number. Compaction writes generation N+1 to the
+# snapshot before it starts a new journal, so a crash in between leaves a journal
+# of generation N that restore ignores instead of replaying old deltas over the
+# newer snapshot. A torn record at the end of the journal fails its CRC and is cut off.
+SNAPSHOT_MAGIC = b'DMXS'
+JOURNAL_MAGIC = b'DMXJ'
+JOURNAL_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHI')       # magic, version, generation
+RECORD_HEADER = struct.Struct('<II')       # payload size, CRC-32 of the payload
+RECORD_BODY = struct.Struct('<dH')         # wall-clock time, universe; followed by a run list
+
+JOURNAL_DIR = 'journal'
+SNAPSHOT_FILE = 'snapshot.dmxs'
+JOURNAL_FILE = 'journal.dmxj'
+FSYNC_INTERVAL = 0.25         # Seconds of changes batched into one write and fsync
+SNAPSHOT_INTERVAL = 60.0      # Compact at least this often while the look keeps changing
+COMPACT_BYTES = 256 * 1024    # ...or as soon as the journal grows past this size
+
+
+def encode_record(t, universe, runs):
+    """Journal record for one universe's run list"""
+    payload = RECORD_BODY.pack(t, universe) + encode_runs(runs)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(data, offset, frames):
+    """Apply the records from offset to frames, returns (records, offset after the last intact one)"""
+    records = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        size, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + size]
+        if len(payload) != size or size < RECORD_BODY.size or zlib.crc32(payload) != crc:
+            break
+        _, universe = RECORD_BODY.unpack_from(payload)
+        try:
+            if runs_size(payload, RECORD_BODY.size) != size - RECORD_BODY.size:
+                break
+            frame = frames.setdefault(universe, bytearray(UNIVERSE_SIZE))
+            apply_runs(frame, payload, RECORD_BODY.size)
+        except struct.error:
+            break
+        records += 1
+        offset = start + size
+    return records, offset
+
+
+def read_file(path, magic):
+    """(generation, contents) of a journal file, None if it is missing or not one"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < FILE_HEADER.size:
+        return None
+    file_magic, version, generation = FILE_HEADER.unpack_from(data)
+    if file_magic != magic or version != JOURNAL_VERSION:
+        return None
+    return generation, data
+
+
+def read_state(directory=JOURNAL_DIR):
+    """Rebuild the universes from the snapshot and journal
+
+    Returns ({universe: bytearray}, generation, records replayed, end of the intact
+    journal or None when the journal is missing or belongs to another generation)
+    """
+    frames = {}
+    generation = 0
+    records = 0
+    snapshot = read_file(os.path.join(directory, SNAPSHOT_FILE), SNAPSHOT_MAGIC)
+    if snapshot is not None:
+        generation, data = snapshot
+        records, _ = read_records(data, FILE_HEADER.size, frames)
+
+    journal_end = None
+    journal = read_file(os.path.join(directory, JOURNAL_FILE), JOURNAL_MAGIC)
+    if journal is not None and journal[0] == generation:
+        replayed, journal_end = read_records(journal[1], FILE_HEADER.size, frames)
+        records += replayed
+    return frames, generation, records, journal_end
+
+
+def fsync_directory(directory):
+    """Make a rename durable; not possible (nor needed) on Windows"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StateJournal:
+    """Journals the universes before the output stage from a background thread"""
+
+    def __init__(self, scheduler, directory=JOURNAL_DIR, fsync_interval=FSYNC_INTERVAL,
+                 snapshot_interval=SNAPSHOT_INTERVAL, compact_bytes=COMPACT_BYTES, resume=True, logger=None):
+        self.scheduler = scheduler
+        self.controllers = scheduler.controllers
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.compact_bytes = compact_bytes
+        self.resume = resume  # Reconnect the last device and send the restored look on startup
+        self.logger = logger or logging.getLogger(__name__)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+
+        self.written = {}  # universe -> frame as it is on disk
+        self.generation = 0
+        self.journal_end = None
+        self.file = None
+        self.journal_bytes = 0
+        self.last_snapshot = time.monotonic()
+        self.thread = None
+        self.stopping = threading.Event()
+
+        self.records = 0
+        self.syncs = 0
+        self.compactions = 0
+        self.restore_time = None
+
+    @classmethod
+    def from_config(cls, config, scheduler, logger=None):
+        options = config.get('journal', {})
+        return cls(scheduler,
+                   directory=options.get('directory', JOURNAL_DIR),
+                   fsync_interval=options.get('fsync_interval', FSYNC_INTERVAL),
+                   snapshot_interval=options.get('snapshot_interval', SNAPSHOT_INTERVAL),
+                   compact_bytes=options.get('compact_bytes', COMPACT_BYTES),
+                   resume=options.get('resume', True),
+                   logger=logger)
+
+    def restore(self):
+        """Load the journaled universes into the controllers, returns the universes that had a look"""
+        start = time.perf_counter()
+        frames, self.generation, records, self.journal_end = read_state(self.directory)
+        restored = []
+        for universe, frame in frames.items():
+            self.written[universe] = bytes(frame)
+            controller = self.controllers.get(universe)
+            if controller is not None and any(frame):
+                controller.apply_frame(frame)
+                restored.append(universe)
+        self.restore_time = time.perf_counter() - start
+        if records:
+            self.logger.info(f"Journal restored universes {restored} from {records} records "
+                             f"in {self.restore_time * 1000:.1f} ms")
+        return restored
+
+    def start(self):
+        """Open the journal for appending and start the writer thread"""
+        if self.thread is not None:
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if self.journal_end is None:
+            self._new_journal()
+        else:
+            # Cut off a torn tail so new records follow the last intact one
+            self.file = open(self.journal_path, 'r+b')
+            self.file.truncate(self.journal_end)
+            self.file.seek(self.journal_end)
+            self.journal_bytes = self.journal_end
+        self.last_snapshot = time.monotonic()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="state-journal", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """Write the last changes, compact them into the snapshot and stop"""
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join(timeout=2.0)
+        self.thread = None
+        try:
+            self.flush()
+            self._compact()
+        except OSError as e:
+            self.logger.error(f"Journal close failed: {e}")
+        self.file.close()
+        self.file = None
+
+    def _run(self):
+        while not self.stopping.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                self.logger.error(f"Journal write failed: {e}")
+
+    def current_frames(self):
+        if self.scheduler.running:
+            return self.scheduler.source_frames  # Replaced whole every frame, never modified
+        return {universe: bytes(controller.dmx_data) for universe, controller in self.controllers.items()}
+
+    def flush(self):
+        """Append the changes since the last flush as one fsync'd batch, compacting when due"""
+        t = time.time()
+        parts = []
+        for universe, frame in self.current_frames().items():
+            old = self.written.get(universe)
+            if old is frame or old == frame:
+                continue
+            if old is None or len(old) != len(frame):
+                runs = [(0, bytes(frame))]
+            else:
+                runs = diff_runs(old, frame)
+            parts.append(encode_record(t, universe, runs))
+            self.written[universe] = bytes(frame)
+
+        if parts:
+            data = b''.join(parts)
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.journal_bytes += len(data)
+            self.records += len(parts)
+            self.syncs += 1
+
+        if self.journal_bytes > FILE_HEADER.size and (
+                self.journal_bytes >= self.compact_bytes or
+                time.monotonic() - self.last_snapshot >= self.snapshot_interval):
+            self._compact()
+
+    def _compact(self):
+        """Replace the snapshot with the current state and start an empty journal"""
+        generation = self.generation + 1
+        t = time.time()
+        parts = [FILE_HEADER.pack(SNAPSHOT_MAGIC, JOURNAL_VERSION, generation)]
+        for universe, frame in self.written.items():
+            parts.append(encode_record(t, universe, [(0, frame)]))
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b''.join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        fsync_directory(self.directory)
+
+        self.generation = generation
+        if self.file is not None:
+            self.file.close()
+        self._new_journal()
+        self.last_snapshot = time.monotonic()
+        self.compactions += 1
+
+    def _new_journal(self):
+        self.file = open(self.journal_path, 'wb')
+        self.file.write(FILE_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, self.generation))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.journal_bytes = FILE_HEADER.size
+
+    def status(self):
+        restored = f", restored in {self.restore_time * 1000:.1f} ms" if self.restore_time is not None else ""
+        return (f"{self.records} changes in {self.syncs} syncs, {self.compactions} snapshots, "
+                f"{self.journal_bytes // 1024} KB journal{restored}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the look stored in a DMX state journal")
+    parser.add_argument('directory', nargs='?', default=JOURNAL_DIR, help="Journal directory")
+    parser.add_argument('--channels', type=int, default=32, help="Channels to print per universe")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    frames, generation, records, journal_end = read_state(args.directory)
+    elapsed = (time.perf_counter() - start) * 1000
+    journal = "no journal" if journal_end is None else f"journal intact to byte {journal_end}"
+    print(f"Generation {generation}, {records} records, {journal}, read in {elapsed:.2f} ms")
+    for universe, frame in sorted(frames.items()):
+        active = sum(1 for value in frame if value)
+        print(f"Universe {universe}: {active} channels above zero")
+        print(' '.join(f"{value:3d}" for value in frame[:args.channels]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+DMX Latency Harness
+Input-to-wire latency: stamped inputs from stand-in gamepad, network and GUI sources are matched
+to the transfers a loopback uDMX receives, under synthetic input storms
+"""
+import abc
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from dmx_controller import DMXController, OutputScheduler, FRAME_RATE
+from dmx_gamepad import GamepadManager
+from dmx_osc import OSCServer, encode_message
+
+STORM_RATE = 200.0            # Inputs per second per source
+STORM_SECONDS = 10.0
+SETTLE_SECONDS = 0.5          # Time after the storm for the last inputs to reach the wire
+GUI_CHANNELS = (4, 7, 8, 9)   # Slider channels the default gamepad profile leaves alone
+OSC_CHANNELS = tuple(range(10, 42))
+VALUE_STEP = 37               # Stamped values walk 1-255 in this step, so a channel repeats a value only every 255 inputs
+SOURCES = ('gamepad', 'osc', 'gui')
+
+
+class LatencyProbe:
+    """Input stamps matched to the values the wire carries
+
+    Every stamped input writes a value its channel did not have. The first transfer that carries
+    the value resolves the stamp; older stamps on the channel that never made it out were
+    overwritten before a frame went out and count as superseded.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.pending = {}           # (universe, channel) -> [(time, source, value)]
+        self.latencies = {}         # source -> [seconds]
+        self.frames = {}            # source -> frame numbers that carried its inputs
+        self.stamped = Counter()
+        self.superseded = Counter()
+        self.frame = 0
+
+    def stamp(self, source, universe, channel, value):
+        """Call right before the input is written"""
+        with self.lock:
+            self.pending.setdefault((universe, channel), []).append((self.clock(), source, value))
+            self.stamped[source] += 1
+
+    def on_wire(self, universe, start, data):
+        """A transfer of data to the channels from index start went out"""
+        t = self.clock()
+        with self.lock:
+            for key in list(self.pending):
+                offset = key[1] - 1 - start
+                if key[0] != universe or not 0 <= offset < len(data):
+                    continue
+                entries = self.pending[key]
+                value = data[offset]
+                for j in range(len(entries) - 1, -1, -1):
+                    if entries[j][2] == value:
+                        break
+                else:
+                    continue
+                stamped, source, _ = entries[j]
+                self.latencies.setdefault(source, []).append(t - stamped)
+                self.frames.setdefault(source, set()).add(self.frame)
+                for _, older, _ in entries[:j]:
+                    self.superseded[older] += 1
+                if j + 1 < len(entries):
+                    self.pending[key] = entries[j + 1:]
+                else:
+                    del self.pending[key]
+
+    def on_frame(self, now, frames):
+        """Scheduler listener: transfers after this belong to the next frame"""
+        self.frame += 1
+
+    def report(self):
+        """{source: statistics}, latencies in ms"""
+        with self.lock:
+            lost = Counter(source for entries in self.pending.values() for _, source, _ in entries)
+            results = {}
+            for source in sorted(self.stamped):
+                latencies = np.asarray(self.latencies.get(source, []), dtype=np.float64) * 1000
+                results[source] = {
+                    'inputs': self.stamped[source],
+                    'delivered': len(latencies),
+                    'superseded': self.superseded[source],
+                    'lost': lost[source],
+                    'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                    'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                    'max': float(latencies.max()) if len(latencies) else None,
+                    'frames': len(self.frames.get(source, ())),
+                }
+            return results
+
+
+class LoopbackDevice:
+    """Stand-in uDMX for DMXController.connect: keeps the universe like the device and reports each transfer"""
+
+    def __init__(self, probe, universe=1, transfer_time=0.0):
+        self.probe = probe
+        self.universe = universe
+        self.transfer_time = transfer_time  # Seconds a control transfer takes on the real device
+        self.buffer = bytearray(512)
+        self.transfers = 0
+        self.bus = None
+        self.address = None
+
+    def device_info(self):
+        return {'device': self, 'name': 'Loopback uDMX', 'vendor': 0, 'product': 0,
+                'description': 'Loopback uDMX (latency harness)'}
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def set_configuration(self):
+        pass
+
+    def ctrl_transfer(self, request_type, request, value, index, data=None, timeout=None):
+        if self.transfer_time:
+            end = time.perf_counter() + self.transfer_time
+            while time.perf_counter() < end:
+                pass
+        if request == 0x02:
+            data = bytes(data)
+            self.buffer[index:index + len(data)] = data
+        else:
+            self.buffer[index] = value
+            data = bytes((value,))
+        self.transfers += 1
+        self.probe.on_wire(self.universe, index, data)
+        return len(data)
+
+
+class VirtualPad:
+    """Stand-in joystick with the calls GamepadManager and GamepadProfile make"""
+
+    def __init__(self, name='Virtual DualSense', axes=6, buttons=12):
+        self.name = name
+        self.axes = [0.0] * axes
+        self.buttons = [0] * buttons
+
+    def get_instance_id(self):
+        return id(self)
+
+    def get_name(self):
+        return self.name
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_axis(self, axis):
+        return self.axes[axis]
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_button(self, button):
+        return self.buttons[button]
+
+
+class Storm(abc.ABC):
+    """Fires inputs at random (Poisson) times, burst at a time, from its own thread"""
+
+    name = 'storm'
+
+    def __init__(self, probe, rate=STORM_RATE, burst=1, seed=None):
+        self.probe = probe
+        self.rate = rate
+        self.burst = burst
+        self.random = random.Random(seed)
+        self.counters = Counter()  # channel -> stamped inputs, for the value walk
+        self.thread = None
+
+    def next_value(self, channel):
+        self.counters[channel] += 1
+        return 1 + (self.counters[channel] * VALUE_STEP) % 255
+
+    def run(self, duration):
+        self.thread = threading.Thread(target=self._run, args=(duration,), name=f"{self.name}-storm", daemon=True)
+        self.thread.start()
+
+    def _run(self, duration):
+        # Arrivals follow an absolute schedule, so sleep overshoot does not lower the rate
+        start = time.perf_counter()
+        due = start
+        while due - start < duration:
+            due += self.random.expovariate(self.rate / self.burst)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for _ in range(self.burst):
+                self.fire()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    @abc.abstractmethod
+    def fire(self):
+        """Send one stamped input"""
+
+    def close(self):
+        pass
+
+
+class GamepadStorm(Storm):
+    """Moves the sticks and triggers of a virtual pad, read by GamepadManager once per frame"""
+
+    name = 'gamepad'
+
+    def __init__(self, probe, scheduler, rate=STORM_RATE, burst=1, seed=None):
+        super().__init__(probe, rate, burst, seed)
+        self.manager = GamepadManager(scheduler.controllers)
+        self.pad = VirtualPad()
+        self.manager.add_joystick(self.pad)
+        self.manager.enabled = True
+        self.profile = self.manager.default_profile
+        initial = {}
+        self.profile.read(self.pad, initial)
+        self.last = {channel: value for (_, channel), value in initial.items()}  # channel -> value last stamped
+        scheduler.add_source(self.manager.poll)
+
+    def fire(self):
+        axis, (universe, channel), stick, _ = self.random.choice(self.profile.axes)
+        value = self.next_value(channel)
+        # The axis position that the profile maps to value; in the deadzone it maps to centre
+        trial = VirtualPad(axes=len(self.pad.axes))
+        trial.axes = list(self.pad.axes)
+        trial.axes[axis] = (value + 0.5) / 127.5 - 1.0
+        expected = {}
+        self.profile.read(trial, expected)
+        if expected[(universe, channel)] == self.last.get(channel):
+            return
+        self.last[channel] = expected[(universe, channel)]
+        self.probe.stamp(self.name, universe, channel, expected[(universe, channel)])
+        self.pad.axes[axis] = trial.axes[axis]
+
+
+class OSCStorm(Storm):
+    """Sends /dmx/<channel> over UDP to an OSC server on the loopback interface"""
+
+    name = 'osc'
+
+    def __init__(self, probe, controllers, rate=STORM_RATE, burst=1, seed=None, logger=None):
+        super().__init__(probe, rate, burst, seed)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe_socket:
+            probe_socket.bind(('127.0.0.1', 0))
+            port = probe_socket.getsockname()[1]
+        self.server = OSCServer(controllers, host='127.0.0.1', port=port, logger=logger)
+        self.server.start()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def fire(self):
+        channel = self.random.choice(OSC_CHANNELS)
+        value = self.next_value(channel)
+        self.probe.stamp(self.name, 1, channel, value)
+        self.socket.sendto(encode_message(f'/dmx/{channel}', value), self.server.address)
+
+    def close(self):
+        self.socket.close()
+        self.server.stop()
+
+
+class GUIStorm(Storm):
+    """Slider moves: the set_channel call update_channel makes, from a thread standing in for Tk"""
+
+    name = 'gui'
+
+    def __init__(self, probe, controller, rate=STORM_RATE, burst=1, seed=None):
+        super().__init__(probe, rate, burst, seed)
+        self.controller = controller
+
+    def fire(self):
+        channel = self.random.choice(GUI_CHANNELS)
+        value = self.next_value(channel)
+        self.probe.stamp(self.name, 1, channel, value)
+        self.controller.set_channel(channel, value)
+
+
+def run(sources=SOURCES, rate=STORM_RATE, duration=STORM_SECONDS, burst=1, fps=FRAME_RATE, transfer_time=0.0,
+        seed=None, logger=None):
+    """Run the storms against a loopback device, returns (probe report, run statistics)"""
+    logger = logger or logging.getLogger(__name__)
+    probe = LatencyProbe()
+    device = LoopbackDevice(probe, transfer_time=transfer_time)
+    controller = DMXController(logger=logger)
+    if not controller.connect(0, [device.device_info()]):
+        raise RuntimeError("Loopback device did not connect")
+    scheduler = OutputScheduler({1: controller}, rate=fps, logger=logger)
+    scheduler.add_listener(probe.on_frame)
+
+    storms = []
+    for index, source in enumerate(sources):
+        source_seed = None if seed is None else seed + index
+        if source == 'gamepad':
+            storms.append(GamepadStorm(probe, scheduler, rate, burst, source_seed))
+        elif source == 'osc':
+            storms.append(OSCStorm(probe, scheduler.controllers, rate, burst, source_seed, logger))
+        elif source == 'gui':
+            storms.append(GUIStorm(probe, controller, rate, burst, source_seed))
+        else:
+            raise ValueError(f"Unknown input source: {source}")
+
+    scheduler.start()
+    started = time.perf_counter()
+    try:
+        for storm in storms:
+            storm.run(duration)
+        for storm in storms:
+            storm.join()
+        time.sleep(SETTLE_SECONDS)
+    finally:
+        elapsed = time.perf_counter() - started
+        scheduler.stop()
+        for storm in storms:
+            storm.close()
+        controller.disconnect()
+    stats = {'frames': scheduler.frame_number, 'fps': scheduler.frame_number / elapsed,
+             'late_frames': scheduler.late_frames, 'source_errors': scheduler.source_errors,
+             'transfers': device.transfers}
+    return probe.report(), stats
+
+
+def format_report(results, stats):
+    lines = [f"{'source':<10}{'inputs':>8}{'sent':>8}{'superseded':>12}{'lost':>6}"
+             f"{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'frames':>8}"]
+    for source, r in results.items():
+        figures = ''.join(f"{r[k]:>9.2f}" if r[k] is not None else f"{'-':>9}" for k in ('p50', 'p99', 'max'))
+        lines.append(f"{source:<10}{r['inputs']:>8}{r['delivered']:>8}{r['superseded']:>12}{r['lost']:>6}"
+                     f"{figures}{r['frames']:>8}")
+    lines.append(f"{stats['frames']} frames at {stats['fps']:.1f} fps, {stats['late_frames']} late, "
+                 f"{stats['transfers']} transfers, {stats['source_errors']} source errors")
+    return '\n'.join(lines)
+
+
+def gate(results, max_p99=None, max_latency=None):
+    """Reasons the run fails the release gate, empty when it passes"""
+    failures = []
+    for source, r in results.items():
+        if r['lost']:
+            failures.append(f"{source}: {r['lost']} inputs never reached the wire")
+        if max_p99 is not None and r['p99'] is not None and r['p99'] > max_p99:
+            failures.append(f"{source}: p99 {r['p99']:.2f} ms over {max_p99} ms")
+        if max_latency is not None and r['max'] is not None and r['max'] > max_latency:
+            failures.append(f"{source}: max {r['max']:.2f} ms over {max_latency} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure input-to-wire latency under synthetic input storms")
+    parser.add_argument('--sources', default=','.join(SOURCES), help="Comma separated: gamepad, osc, gui")
+    parser.add_argument('--rate', type=float, default=STORM_RATE, help="Inputs per second per source")
+    parser.add_argument('--burst', type=int, default=1, help="Inputs fired together at each arrival")
+    parser.add_argument('--duration', type=float, default=STORM_SECONDS, help="Storm length in seconds")
+    parser.add_argument('--fps', type=float, default=FRAME_RATE, help="Output frame rate")
+    parser.add_argument('--transfer-ms', type=float, default=0.0, help="Simulated time per USB control transfer")
+    parser.add_argument('--seed', type=int, help="Random seed for repeatable storms")
+    parser.add_argument('--max-p99', type=float, help="Fail (exit 1) if any source's p99 exceeds this many ms")
+    parser.add_argument('--max-latency', type=float, help="Fail (exit 1) if any input took longer than this many ms")
+    parser.add_argument('--json', metavar='FILE', help="Append the results to FILE as a JSON line")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+
+    sources = [source.strip() for source in args.sources.split(',') if source.strip()]
+    results, stats = run(sources, args.rate, args.duration, args.burst, args.fps, args.transfer_ms / 1000.0, args.seed)
+    print(format_report(results, stats))
+    failures = gate(results, args.max_p99, args.max_latency)
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'options': vars(args), 'results': results, 'stats': stats,
+                                'passed': not failures}) + '\n')
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+DMX Log Store
+Structured JSON-lines logs with size-based rotation, gzip compression and a block index
+for time, event type and level range queries
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+# Files in the log directory:
+#   dmx_controller.jsonl              - segment being written, one JSON object per line
+#   dmx_controller_<time>.jsonl.gz    - rotated segments, every index block a separate gzip member
+#   dmx_controller_<time>.jsonl       - rotated segment still waiting for the compressor thread
+#   index.json                        - per segment, blocks of about BLOCK_BYTES of lines: byte range,
+#                                       first and last time, highest level and the event types in it
+# A query opens only the segments and decompresses only the blocks whose time range,
+# events and level can match; the rotated files stay readable with zcat.
+LOG_DIR = 'logs'
+ACTIVE_FILE = 'dmx_controller.jsonl'
+INDEX_FILE = 'index.json'
+SEGMENT_PREFIX = 'dmx_controller_'
+SEGMENT_EXTENSION = '.jsonl.gz'
+PLAIN_EXTENSION = '.jsonl'      # Rotated segment waiting for compression
+MAX_BYTES = 5 * 1024 * 1024   # Rotate the active segment at this size
+MAX_SEGMENTS = 20             # Rotated segments kept, oldest deleted first
+BLOCK_BYTES = 64 * 1024       # Index granularity: the most a query reads outside its range per segment
+TAIL_SIZE = 500               # Recent entries kept in memory for the Debug tab
+
+# Event type of a record: the 'event' extra of the log call, else the first group with a
+# keyword in the message
+EVENT_KEYWORDS = (
+    ('rdm', ('RDM',)),
+    ('serial', ('Serial', 'serial', 'DMX widget')),
+    ('web', ('Web ', 'web remote')),
+    ('osc', ('OSC',)),
+    ('midi', ('MIDI',)),
+    ('audio', ('Audio', 'audio')),
+    ('gamepad', ('Gamepad', 'gamepad')),
+    ('cluster', ('Cluster', 'cluster')),
+    ('timecode', ('Timecode', 'timecode')),
+    ('cue', ('Cue ', 'cue')),
+    ('watchdog', ('Watchdog', 'failsafe')),
+    ('journal', ('Journal', 'journal')),
+    ('recording', ('Recording', 'recording', 'Playback', 'playback')),
+    ('usb', ('USB', 'UDMX', 'uDMX', 'Connect', 'connect', 'Send error', 'Device', 'device')),
+    ('output', ('Output', 'output', 'Frame', 'frame')),
+    ('profiling', ('trace', 'Profiler', 'profiler')),
+    ('config', ('onfig',)),
+)
+EVENT_TYPES = [event for event, _ in EVENT_KEYWORDS] + ['app']
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def classify(message):
+    for event, keywords in EVENT_KEYWORDS:
+        for keyword in keywords:
+            if keyword in message:
+                return event
+    return 'app'
+
+
+def parse_time(text):
+    """Epoch seconds from 'HH:MM[:SS]' (today), 'YYYY-MM-DD HH:MM[:SS]' or a number"""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for layout in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, layout).timestamp()
+        except ValueError:
+            pass
+    for layout in ('%H:%M:%S', '%H:%M'):
+        try:
+            clock = datetime.strptime(text, layout).time()
+        except ValueError:
+            continue
+        return datetime.combine(datetime.now().date(), clock).timestamp()
+    raise ValueError(f"Unrecognized time: {text}")
+
+
+def format_entry(entry):
+    """One text line, as the console shows it"""
+    stamp = datetime.fromtimestamp(entry['t']).strftime('%Y-%m-%d %H:%M:%S')
+    line = (f"{stamp},{int(entry['t'] * 1000) % 1000:03d} - {entry['level']} - "
+            f"{entry['event']} - {entry['msg']}")
+    if 'exc' in entry:
+        line += '\n' + entry['exc']
+    return line
+
+
+class Block:
+    """Index entry for a run of lines: [offset, length, first, last, highest level, events]"""
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.length = 0
+        self.first = None
+        self.last = None
+        self.level = 0
+        self.events = set()
+
+    def add(self, t, level, event, size):
+        if self.first is None:
+            self.first = t
+        self.last = t
+        self.level = max(self.level, level)
+        self.events.add(event)
+        self.length += size
+
+    def to_list(self):
+        return [self.offset, self.length, self.first, self.last, self.level, sorted(self.events)]
+
+
+def block_matches(block, start, end, event, level):
+    _, _, first, last, highest, events = block
+    return ((start is None or last >= start) and (end is None or first <= end) and
+            (event is None or event in events) and (level is None or highest >= level))
+
+
+def first_time(path):
+    """Time of the first entry in a plain segment, now if it has none"""
+    try:
+        with open(path, 'rb') as f:
+            return json.loads(f.readline())['t']
+    except (OSError, ValueError, KeyError, TypeError):
+        return time.time()
+
+
+class LogStore:
+    """Writes log entries to the active segment and answers indexed queries over all segments"""
+
+    def __init__(self, directory=LOG_DIR, max_bytes=MAX_BYTES, max_segments=MAX_SEGMENTS,
+                 block_bytes=BLOCK_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.block_bytes = block_bytes
+        self.active_path = os.path.join(directory, ACTIVE_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.lock = threading.Lock()
+        self.segments = []  # Rotated segments, oldest first: {'file', 'blocks'}
+        self.active_blocks = []
+        self.block = None
+        self.file = None
+        self.size = 0
+        self.tail = deque(maxlen=TAIL_SIZE)
+        self.pending = queue.Queue()  # (plain segment path, blocks or None to scan) to compress
+        self.compressor = None
+
+    def open(self):
+        """Load the index and start a new segment, compressing the last session's in the background"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.segments = self._load_index()
+        if os.path.exists(self.active_path):
+            self._set_aside(first_time(self.active_path))
+        indexed = {s['file'] for s in self.segments}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_EXTENSION) and name not in indexed:
+                # Compressed, but the index was not updated before a crash: compress its plain copy again
+                plain = os.path.join(self.directory, name[:-len('.gz')])
+                if os.path.exists(plain):
+                    os.remove(os.path.join(self.directory, name))
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(PLAIN_EXTENSION):
+                self.pending.put((os.path.join(self.directory, name), None))
+        self.file = open(self.active_path, 'ab')
+        self.size = 0
+        self.block = Block(0)
+        self.active_blocks = []
+        self.compressor = threading.Thread(target=self._compress_loop, name="log-compressor", daemon=True)
+        self.compressor.start()
+
+    def close(self):
+        """Index the last lines and wait for pending compression"""
+        with self.lock:
+            if self.file is None:
+                return
+            self._end_block()
+            self.file.close()
+            self.file = None
+        self.pending.put(None)
+        self.compressor.join()
+
+    def write(self, entry):
+        """Append one entry (a dict with t, level, levelno, event and msg)"""
+        levelno = entry.pop('levelno')
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            self.tail.append(entry)
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.file.flush()
+            self.size += len(line)
+            self.block.add(entry['t'], levelno, entry['event'], len(line))
+            if self.block.length >= self.block_bytes:
+                self._end_block()
+                if self.size >= self.max_bytes:
+                    self._rotate()
+
+    def _end_block(self):
+        if self.block.length:
+            self.active_blocks.append(self.block.to_list())
+            self._save_index()
+        self.block = Block(self.size)
+
+    def _rotate(self):
+        """Move the active segment aside for the compressor and start a new one"""
+        self.file.close()
+        self.pending.put((self._set_aside(self.active_blocks[0][2]), self.active_blocks))
+        self.file = open(self.active_path, 'ab')
+        self.size = 0
+        self.block = Block(0)
+        self.active_blocks = []
+        self._save_index()
+
+    def _set_aside(self, first):
+        """Rename the active segment after its first entry, returns the new path"""
+        stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(first))
+        base = f"{SEGMENT_PREFIX}{stamp}"
+        suffix = 1
+        while any(os.path.exists(os.path.join(self.directory, base + extension))
+                  for extension in (PLAIN_EXTENSION, SEGMENT_EXTENSION)):
+            suffix += 1
+            base = f"{SEGMENT_PREFIX}{stamp}_{suffix}"
+        path = os.path.join(self.directory, base + PLAIN_EXTENSION)
+        os.replace(self.active_path, path)
+        return path
+
+    def _compress_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            path, blocks = item
+            try:
+                self._compress(path, blocks if blocks is not None else self._scan(path))
+            except OSError as e:
+                logging.getLogger(__name__).error(f"Could not compress {path}: {e}")
+
+    def _compress(self, path, blocks):
+        """Rewrite a plain segment as one gzip member per block and add it to the index"""
+        if not blocks:
+            os.remove(path)
+            return
+        name = os.path.basename(path)[:-len(PLAIN_EXTENSION)] + SEGMENT_EXTENSION
+        compressed = []
+        offset = 0
+        with open(path, 'rb') as source, open(os.path.join(self.directory, name), 'wb') as target:
+            for block in blocks:
+                source.seek(block[0])
+                member = gzip.compress(source.read(block[1]))
+                target.write(member)
+                compressed.append([offset, len(member)] + block[2:])
+                offset += len(member)
+        with self.lock:
+            self.segments.append({'file': name, 'blocks': compressed})
+            self.segments.sort(key=lambda segment: segment['blocks'][0][2])
+            while len(self.segments) > self.max_segments:
+                old = self.segments.pop(0)
+                try:
+                    os.remove(os.path.join(self.directory, old['file']))
+                except OSError:
+                    pass
+            self._save_index()
+        os.remove(path)
+
+    def _scan(self, path):
+        """Blocks of a plain segment that has no index (left by a crash)"""
+        blocks = []
+        block = Block(0)
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    t, event, level = entry['t'], entry['event'], logging.getLevelName(entry['level'])
+                except (ValueError, KeyError, TypeError):
+                    break  # Torn last line
+                block.add(t, level if isinstance(level, int) else 0, event, len(line))
+                offset += len(line)
+                if block.length >= self.block_bytes:
+                    blocks.append(block.to_list())
+                    block = Block(offset)
+        if block.length:
+            blocks.append(block.to_list())
+        return blocks
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                segments = json.load(f).get('segments', [])
+        except (OSError, ValueError):
+            return []
+        return [s for s in segments if os.path.exists(os.path.join(self.directory, s['file']))]
+
+    def _save_index(self):
+        data = {'segments': self.segments, 'active': {'file': ACTIVE_FILE, 'blocks': self.active_blocks}}
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.index_path)
+
+    def query(self, start=None, end=None, event=None, level=None, text=None, limit=None):
+        """Entries between start and end (epoch seconds) of an event type at or above a level, oldest first"""
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        with self.lock:
+            segments = [(s['file'], s['blocks'], True) for s in self.segments]
+            blocks = list(self.active_blocks)
+            if self.block is not None and self.block.length:
+                blocks.append(self.block.to_list())
+        segments.append((ACTIVE_FILE, blocks, False))
+        return search(self.directory, segments, start, end, event, level, text, limit)
+
+    def recent(self, count=100):
+        """The last entries written, without reading any file"""
+        with self.lock:
+            return list(self.tail)[-count:]
+
+
+def search(directory, segments, start, end, event, level, text, limit):
+    results = []
+    for name, blocks, compressed in segments:
+        wanted = [block for block in blocks if block_matches(block, start, end, event, level)]
+        if not wanted:
+            continue
+        try:
+            f = open(os.path.join(directory, name), 'rb')
+        except OSError:
+            continue
+        with f:
+            for block in wanted:
+                f.seek(block[0])
+                data = f.read(block[1])
+                if compressed:
+                    data = zlib.decompress(data, wbits=31)
+                for line in data.splitlines():
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    t = entry.get('t', 0)
+                    if ((start is not None and t < start) or (end is not None and t > end) or
+                            (event is not None and entry.get('event') != event) or
+                            (level is not None and logging.getLevelName(entry.get('level')) < level) or
+                            (text is not None and text not in entry.get('msg', ''))):
+                        continue
+                    results.append(entry)
+                    if limit is not None and len(results) >= limit:
+                        return results
+    return results
+
+
+def read_index(directory=LOG_DIR):
+    """Segments from index.json, the active one last, for querying without a running LogStore"""
+    try:
+        with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    segments = [(s['file'], s['blocks'], True) for s in data.get('segments', [])]
+    active = data.get('active', {}).get('blocks', [])
+    # Lines written after the last indexed block are not in the index yet: read them as one more block
+    path = os.path.join(directory, ACTIVE_FILE)
+    if os.path.exists(path):
+        indexed = active[-1][0] + active[-1][1] if active else 0
+        size = os.path.getsize(path)
+        if size > indexed:
+            active = active + [[indexed, size - indexed, 0, float('inf'), logging.CRITICAL, EVENT_TYPES]]
+    segments.append((ACTIVE_FILE, active, False))
+    return segments
+
+
+class JSONLinesHandler(logging.Handler):
+    """Logging handler that writes structured entries to a LogStore"""
+
+    def __init__(self, store, level=logging.NOTSET):
+        super().__init__(level)
+        self.store = store
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            entry = {
+                't': round(record.created, 3),
+                'level': record.levelname,
+                'levelno': record.levelno,
+                'event': getattr(record, 'event', None) or classify(message),
+                'logger': record.name,
+                'thread': record.threadName,
+                'msg': message,
+            }
+            if record.exc_info:
+                entry['exc'] = logging.Formatter().formatException(record.exc_info)
+            self.store.write(entry)
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(directory=LOG_DIR, level=logging.DEBUG, console=True, **options):
+    """Send the root logger to a new LogStore (and the console), returns the store"""
+    store = LogStore(directory, **options)
+    store.open()
+    handlers = [JSONLinesHandler(store)]
+    if console:
+        handlers.append(logging.StreamHandler())
+    logging.basicConfig(level=level, format=CONSOLE_FORMAT, handlers=handlers)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the DMX controller logs",
+                                     epilog="Example: --event usb --level ERROR --from 21:00 --to 21:05")
+    parser.add_argument('--dir', default=LOG_DIR, help="Log directory")
+    parser.add_argument('--from', dest='start', help="Start time: HH:MM[:SS] today, or YYYY-MM-DD HH:MM[:SS]")
+    parser.add_argument('--to', dest='end', help="End time, same formats")
+    parser.add_argument('--event', choices=EVENT_TYPES, help="Event type")
+    parser.add_argument('--level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help="Lowest level shown")
+    parser.add_argument('--grep', help="Only messages containing this text")
+    parser.add_argument('--limit', type=int, help="Stop after this many entries")
+    parser.add_argument('--json', action='store_true', help="Print the JSON entries")
+    parser.add_argument('--stats', action='store_true', help="Show segments, blocks and the entries read")
+    args = parser.parse_args()
+
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+    level = logging.getLevelName(args.level) if args.level else None
+    segments = read_index(args.dir)
+    began = time.perf_counter()
+    entries = search(args.dir, segments, start, end, args.event, level, args.grep, args.limit)
+    elapsed = (time.perf_counter() - began) * 1000
+    for entry in entries:
+        print(json.dumps(entry, ensure_ascii=False) if args.json else format_entry(entry))
+    if args.stats:
+        blocks = sum(len(blocks) for _, blocks, _ in segments)
+        read = sum(1 for _, blocks, _ in segments for block in blocks
+                   if block_matches(block, start, end, args.event, level))
+        print(f"{len(entries)} entries from {read} of {blocks} blocks in {len(segments)} segments, "
+              f"{elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
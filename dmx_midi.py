@@ -0,0 +1,253 @@
+"""
+DMX MIDI Input
+MIDI faders and buttons mapped to channels, fixture attributes and cues, with MIDI learn
+"""
+import logging
+import threading
+import time
+
+try:
+    import mido
+except ImportError:
+    mido = None
+
+LOOPBACK_PORT = 'loopback'
+
+CC = 0xB0
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+
+
+def control_name(key):
+    """Readable name of a control key, e.g. 'CC 7 (ch 1)'"""
+    kind, midi_channel, number = key
+    return f"{'CC' if kind == 'cc' else 'Note'} {number} (ch {midi_channel})"
+
+
+class MIDIBinding:
+    """A MIDI control bound to a target: DMX channel (with optional fine channel) or cue"""
+
+    def __init__(self, kind, midi_channel, number, universe=1, channel=None, fine=None, cue=None):
+        if kind not in ('cc', 'note'):
+            raise ValueError(f"Unknown MIDI control: {kind}")
+        if channel is None and cue is None:
+            raise ValueError("Binding needs a channel or a cue")
+        if fine is not None and not (kind == 'cc' and number < 32):
+            raise ValueError("Fine channels need a CC number 0-31 (LSB on number + 32)")
+        self.kind = kind
+        self.midi_channel = int(midi_channel)
+        self.number = int(number)
+        self.universe = int(universe)
+        self.channel = channel
+        self.fine = fine
+        self.cue = cue
+
+    @property
+    def key(self):
+        return (self.kind, self.midi_channel, self.number)
+
+    @classmethod
+    def from_dict(cls, data, patch=None):
+        universe = data.get('universe', 1)
+        channel = data.get('channel')
+        fine = data.get('fine')
+        if 'fixture' in data:
+            fixture = patch.fixture(data['fixture'])
+            universe = fixture.universe
+            channel = fixture.channel(data['attribute'])
+            if 'fine_attribute' in data:
+                fine = fixture.channel(data['fine_attribute'])
+        return cls(data.get('control', 'cc'), data.get('midi_channel', 1), data['number'], universe,
+                   channel, fine, data.get('cue'))
+
+    def to_dict(self):
+        data = {'control': self.kind, 'midi_channel': self.midi_channel, 'number': self.number}
+        if self.cue is not None:
+            data['cue'] = self.cue
+        else:
+            data.update({'universe': self.universe, 'channel': self.channel})
+            if self.fine is not None:
+                data['fine'] = self.fine
+        return data
+
+
+class LoopbackPort:
+    """In-process MIDI port: messages sent to it go straight to the input, no hardware needed"""
+
+    name = LOOPBACK_PORT
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def send(self, data):
+        self.callback(bytes(data))
+
+    def close(self):
+        self.callback = lambda data: None
+
+
+class MIDIInput:
+    """Collects MIDI controls and writes the latest value of each once per output frame"""
+
+    def __init__(self, controllers, bindings=None, cue_list=None, clock=time.monotonic, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.cue_list = cue_list
+        self.clock = clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.bindings = {}
+        for binding in bindings or []:
+            self.bind(binding)
+        self.port = None
+        self.pending = {}      # key -> latest 7-bit value (MSB for 14-bit), replaced until the next frame
+        self.msb = {}          # 14-bit key -> latest MSB
+        self.lsb = {}          # 14-bit key -> latest LSB
+        self.presses = []      # cue keys pressed since the last frame
+        self.learn_target = None
+        self.last_learned = None
+        self.messages = 0
+
+    @classmethod
+    def from_config(cls, config, controllers, patch=None, cue_list=None, clock=time.monotonic, logger=None):
+        bindings = []
+        for data in config.get('midi', {}).get('bindings', []):
+            try:
+                bindings.append(MIDIBinding.from_dict(data, patch))
+            except (KeyError, ValueError) as e:
+                (logger or logging.getLogger(__name__)).warning(f"Skipping MIDI binding {data}: {e}")
+        return cls(controllers, bindings, cue_list, clock, logger)
+
+    def to_config(self):
+        return [binding.to_dict() for binding in self.bindings.values()]
+
+    @staticmethod
+    def port_names():
+        if mido is None:
+            return [LOOPBACK_PORT]
+        try:
+            return mido.get_input_names() + [LOOPBACK_PORT]
+        except Exception:
+            return [LOOPBACK_PORT]
+
+    def start(self, port_name=None, virtual=False):
+        """Open a MIDI input port ('loopback' for the in-process test port)"""
+        if port_name == LOOPBACK_PORT:
+            self.port = LoopbackPort(self.feed)
+        else:
+            if mido is None:
+                raise RuntimeError("MIDI input needs the 'mido' and 'python-rtmidi' packages")
+            self.port = mido.open_input(port_name, virtual=virtual, callback=lambda msg: self.feed(msg.bytes()))
+        self.logger.info(f"MIDI input: {self.port.name}")
+
+    def stop(self):
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+    def bind(self, binding):
+        with self.lock:
+            self.bindings[binding.key] = binding
+
+    def unbind(self, key):
+        with self.lock:
+            self.bindings.pop(key, None)
+
+    def learn(self, target):
+        """Bind the next control that moves to target (MIDIBinding keyword arguments)"""
+        with self.lock:
+            self.learn_target = dict(target)
+        self.logger.info(f"MIDI learn armed for {target}")
+
+    def cancel_learn(self):
+        with self.lock:
+            self.learn_target = None
+
+    def feed(self, data):
+        """Take one raw MIDI message (called from the MIDI thread, kept cheap)"""
+        if len(data) < 3:
+            return
+        status, number, value = data[0], data[1], data[2]
+        kind = status & 0xF0
+        midi_channel = (status & 0x0F) + 1
+        if kind == CC:
+            key = ('cc', midi_channel, number)
+        elif kind == NOTE_ON or kind == NOTE_OFF:
+            key = ('note', midi_channel, number)
+            if kind == NOTE_OFF:
+                value = 0
+        else:
+            return
+
+        with self.lock:
+            self.messages += 1
+            if self.learn_target is not None and value and self._learn(key):
+                return
+            binding = self.bindings.get(key)
+            if binding is None:
+                if kind == CC and 32 <= number < 64:
+                    # LSB of a 14-bit pair
+                    msb_key = ('cc', midi_channel, number - 32)
+                    binding = self.bindings.get(msb_key)
+                    if binding is not None and binding.fine is not None:
+                        self.lsb[msb_key] = value
+                        self.pending[msb_key] = self.msb.get(msb_key, 0)
+                return
+            if binding.cue is not None:
+                if value:
+                    self.presses.append(key)
+            elif binding.fine is not None:
+                self.msb[key] = value
+                self.lsb[key] = 0  # A new MSB resets the LSB
+                self.pending[key] = value
+            else:
+                self.pending[key] = value
+
+    def _learn(self, key):
+        # Called with the lock held; stays armed if the control cannot drive the target
+        target = self.learn_target
+        try:
+            binding = MIDIBinding(key[0], key[1], key[2], **target)
+        except ValueError as e:
+            self.logger.debug(f"MIDI learn: {control_name(key)} cannot drive {target}: {e}")
+            return False
+        self.learn_target = None
+        self.bindings[key] = binding
+        self.last_learned = binding
+        self.logger.info(f"MIDI learn: {control_name(key)} -> {target}")
+        return True
+
+    def on_frame(self, now):
+        """Write the latest control values (scheduler source)"""
+        with self.lock:
+            if not self.pending and not self.presses:
+                return
+            pending, self.pending = self.pending, {}
+            presses, self.presses = self.presses, []
+            lsb = {key: self.lsb.get(key, 0) for key in pending}
+            bindings = self.bindings
+
+        writes = {}
+        for key, value in pending.items():
+            binding = bindings.get(key)
+            if binding is None:
+                continue
+            values = writes.setdefault(binding.universe, {})
+            if binding.fine is None:
+                values[binding.channel] = (value * 255 + 63) // 127
+            else:
+                level = (((value << 7) | lsb[key]) * 65535 + 8191) // 16383
+                values[binding.channel] = level >> 8
+                values[binding.fine] = level & 0xFF
+        for universe, values in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None:
+                controller.set_channels(values)
+
+        if presses and self.cue_list is not None:
+            at = self.cue_list.timebase(self.clock())
+            for key in presses:
+                cue = bindings[key].cue
+                if cue == 'go':
+                    self.cue_list.go(at)
+                else:
+                    self.cue_list.goto(int(cue) - 1, at)
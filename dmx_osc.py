@@ -0,0 +1,400 @@
+"""
+DMX OSC Input
+Asyncio OSC/UDP server mapping addresses to channels, fixture attributes and cues
+"""
+import asyncio
+import logging
+import re
+import struct
+import threading
+import time
+
+DEFAULT_OSC_PORT = 8000
+ROUTE_CACHE_SIZE = 4096
+BUNDLE_TAG = b'#bundle\0'
+
+INT32 = struct.Struct('>i')
+INT64 = struct.Struct('>q')
+FLOAT32 = struct.Struct('>f')
+FLOAT64 = struct.Struct('>d')
+
+
+def _read_string(data, offset):
+    end = data.index(b'\0', offset)
+    return data[offset:end].decode('utf-8', errors='replace'), (end + 4) & ~3
+
+
+def _read_blob(data, offset):
+    size = INT32.unpack_from(data, offset)[0]
+    start = offset + 4
+    if size < 0 or start + size > len(data):
+        raise ValueError("Blob runs past the end of the packet")
+    return data[start:start + size], (start + size + 3) & ~3
+
+
+def parse_message(data):
+    """(address, [args]) from one OSC message"""
+    address, offset = _read_string(data, 0)
+    if not address.startswith('/'):
+        raise ValueError(f"Bad OSC address: {address[:32]!r}")
+    if offset >= len(data):
+        return address, []  # No type tag string (very old senders)
+    tags, offset = _read_string(data, offset)
+    if not tags.startswith(','):
+        raise ValueError(f"Bad OSC type tags: {tags[:32]!r}")
+
+    args = []
+    for tag in tags[1:]:
+        if tag == 'i':
+            args.append(INT32.unpack_from(data, offset)[0])
+            offset += 4
+        elif tag == 'f':
+            args.append(FLOAT32.unpack_from(data, offset)[0])
+            offset += 4
+        elif tag == 's' or tag == 'S':
+            value, offset = _read_string(data, offset)
+            args.append(value)
+        elif tag == 'b':
+            value, offset = _read_blob(data, offset)
+            args.append(value)
+        elif tag == 'h':
+            args.append(INT64.unpack_from(data, offset)[0])
+            offset += 8
+        elif tag == 'd':
+            args.append(FLOAT64.unpack_from(data, offset)[0])
+            offset += 8
+        elif tag == 'T':
+            args.append(True)
+        elif tag == 'F':
+            args.append(False)
+        elif tag in 'NI':
+            args.append(None)
+        else:
+            raise ValueError(f"Unsupported OSC type tag: {tag}")
+    return address, args
+
+
+def parse_packet(data, messages=None):
+    """All messages in a packet, bundles flattened in order"""
+    if messages is None:
+        messages = []
+    if data.startswith(BUNDLE_TAG):
+        # Time tags are ignored: bundles are applied as soon as they arrive
+        offset = len(BUNDLE_TAG) + 8
+        while offset < len(data):
+            size = INT32.unpack_from(data, offset)[0]
+            offset += 4
+            if size <= 0 or offset + size > len(data):
+                raise ValueError("Bundle element runs past the end of the packet")
+            parse_packet(data[offset:offset + size], messages)
+            offset += size
+    else:
+        messages.append(parse_message(data))
+    return messages
+
+
+def _pad(data):
+    return data + b'\0' * (4 - len(data) % 4)
+
+
+def encode_message(address, *args):
+    """Build an OSC message (int, float, str, bytes and bool arguments)"""
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, bool):
+            tags += 'T' if arg else 'F'
+        elif isinstance(arg, int):
+            tags += 'i'
+            payload += INT32.pack(arg)
+        elif isinstance(arg, float):
+            tags += 'f'
+            payload += FLOAT32.pack(arg)
+        elif isinstance(arg, str):
+            tags += 's'
+            payload += _pad(arg.encode('utf-8'))
+        elif isinstance(arg, (bytes, bytearray)):
+            tags += 'b'
+            payload += INT32.pack(len(arg)) + bytes(arg) + b'\0' * (-len(arg) % 4)
+        else:
+            raise TypeError(f"Cannot encode {type(arg).__name__} as an OSC argument")
+    return _pad(address.encode('utf-8')) + _pad(tags.encode('ascii')) + payload
+
+
+def encode_bundle(*elements):
+    """Build an OSC bundle (time tag 'immediately') from encoded messages or bundles"""
+    return BUNDLE_TAG + INT64.pack(1) + b''.join(INT32.pack(len(e)) + e for e in elements)
+
+
+def compile_pattern(pattern):
+    """Regular expression for an OSC address pattern (* ? [] [!] {a,b})"""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = pattern.index(']', i)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += f'[{body}]'
+            i = end
+        elif c == '{':
+            end = pattern.index('}', i)
+            regex += '(?:' + '|'.join(re.escape(p) for p in pattern[i + 1:end].split(',')) + ')'
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + '$')
+
+
+def osc_name(name):
+    """Fixture or group name as it appears in an address (no spaces)"""
+    return name.strip().lower().replace(' ', '_')
+
+
+def to_dmx(value):
+    """OSC argument to a DMX value: floats are 0.0-1.0, ints 0-255"""
+    if isinstance(value, bool):
+        return 255 if value else 0
+    if isinstance(value, float):
+        return max(0, min(255, int(round(value * 255.0))))
+    if isinstance(value, int):
+        return max(0, min(255, value))
+    raise ValueError(f"Not a level: {value!r}")
+
+
+class _OSCProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.handle_packet(data)
+
+
+# Built-in address space, extended by patterns from the 'osc' section of config.json:
+#   /dmx/<channel>                 universe 1
+#   /dmx/<universe>/<channel>      several arguments (or a blob) write consecutive channels
+#   /fixture/<name>/<attribute>    e.g. /fixture/moving_head/dimmer
+#   /group/<name>/<attribute>      every fixture in the group
+#   /cue/go, /cue/<number>/go
+#   /input/<name>                  a named value for scripts (first argument, as sent)
+class OSCServer:
+    """Receives OSC and applies each packet (message or whole bundle) as one batched write"""
+
+    def __init__(self, controllers, patch=None, cue_list=None, host='0.0.0.0', port=DEFAULT_OSC_PORT,
+                 mappings=None, clock=time.monotonic, logger=None, inputs=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.cue_list = cue_list
+        self.inputs = inputs  # name -> value, read by scripts; None ignores /input/ addresses
+        self.address = (host, port)
+        self.clock = clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.exact = {}      # address -> mapping
+        self.patterns = []   # (compiled pattern, mapping)
+        for pattern, mapping in (mappings or {}).items():
+            if any(c in pattern for c in '*?[{'):
+                self.patterns.append((compile_pattern(pattern), mapping))
+            else:
+                self.exact[pattern] = mapping
+        self.set_patch(patch)
+
+        self.loop = None
+        self.thread = None
+        self.running = False
+        self.packets = 0
+        self.messages = 0
+        self.unknown = 0
+        self.bad_packets = 0
+
+    @classmethod
+    def from_config(cls, config, controllers, patch=None, cue_list=None, clock=time.monotonic, logger=None,
+                    inputs=None):
+        options = config.get('osc', {})
+        return cls(controllers, patch, cue_list, options.get('host', '0.0.0.0'),
+                   options.get('port', DEFAULT_OSC_PORT), options.get('mappings', {}), clock, logger, inputs)
+
+    def set_patch(self, patch):
+        """Use a new patch; cached routes are dropped"""
+        self.patch = patch
+        self.fixtures = {}
+        self.groups = {}
+        if patch is not None:
+            for fixture in patch.fixtures:
+                self.fixtures[osc_name(fixture.name)] = fixture
+            for group in patch.groups():
+                self.groups[osc_name(group)] = patch.group_fixtures(group)
+        self.routes = {}
+
+    def resolve(self, address):
+        """Route for an address, worked out once and then served from the cache"""
+        route = self.routes.get(address, False)
+        if route is not False:
+            return route
+        mapping = self.exact.get(address)
+        if mapping is None:
+            for pattern, candidate in self.patterns:
+                if pattern.match(address):
+                    mapping = candidate
+                    break
+        try:
+            route = self._mapping_route(mapping) if mapping is not None else self._builtin_route(address)
+        except (KeyError, ValueError) as e:
+            self.logger.warning(f"OSC mapping for {address} is invalid: {e}")
+            route = None
+        if len(self.routes) >= ROUTE_CACHE_SIZE:
+            self.routes.clear()
+        self.routes[address] = route  # Unknown addresses are cached as None too
+        return route
+
+    def _mapping_route(self, mapping):
+        if 'cue' in mapping:
+            cue = mapping['cue']
+            return ('go', None) if cue == 'go' else ('goto', int(cue) - 1)
+        if 'channel' in mapping:
+            universe, channel = int(mapping.get('universe', 1)), int(mapping['channel'])
+            if universe < 1:
+                raise ValueError(f"Invalid universe: {universe}")
+            if not 1 <= channel <= 512:
+                raise ValueError(f"Invalid channel: {channel}")
+            return ('channels', [(universe, channel)])
+        if 'fixture' in mapping:
+            return self._fixture_route([self.patch.fixture(mapping['fixture'])], mapping['attribute'])
+        if 'group' in mapping:
+            return self._fixture_route(self.patch.group_fixtures(mapping['group']), mapping['attribute'])
+        raise ValueError(f"Unknown mapping {mapping}")
+
+    def _builtin_route(self, address):
+        parts = address.strip('/').split('/')
+        kind = parts[0]
+        if kind == 'dmx' and len(parts) in (2, 3) and all(p.isdigit() for p in parts[1:]):
+            universe = int(parts[1]) if len(parts) == 3 else 1
+            channel = int(parts[-1])
+            if 1 <= channel <= 512:
+                return ('channels', [(universe, channel)])
+        elif kind == 'fixture' and len(parts) == 3 and parts[1] in self.fixtures:
+            return self._fixture_route([self.fixtures[parts[1]]], parts[2])
+        elif kind == 'group' and len(parts) == 3 and parts[1] in self.groups:
+            return self._fixture_route(self.groups[parts[1]], parts[2])
+        elif kind == 'input' and len(parts) == 2 and self.inputs is not None:
+            return ('input', parts[1])
+        elif kind == 'cue':
+            if parts[1:] == ['go']:
+                return ('go', None)
+            if len(parts) == 3 and parts[1].isdigit() and parts[2] == 'go':
+                return ('goto', int(parts[1]) - 1)
+        return None
+
+    def _fixture_route(self, fixtures, attribute):
+        targets = [(f.universe, f.channel(attribute)) for f in fixtures if attribute in f.attributes]
+        return ('channels', targets) if targets else None
+
+    def handle_packet(self, data):
+        """Apply one datagram: all channel writes per universe in one set_channels call"""
+        try:
+            messages = parse_packet(data)
+        except (ValueError, IndexError, struct.error) as e:
+            self.bad_packets += 1
+            if self.bad_packets % 100 == 1:
+                self.logger.warning(f"Bad OSC packet ({e}): {data[:32]!r}")
+            return
+        self.packets += 1
+        self.messages += len(messages)
+
+        writes = {}   # universe -> {channel: value}
+        cues = []
+        for address, args in messages:
+            route = self.resolve(address)
+            if route is None:
+                self.unknown += 1
+                if self.unknown % 100 == 1:
+                    self.logger.debug(f"Unmapped OSC address: {address}")
+                continue
+            kind, target = route
+            if kind == 'channels':
+                try:
+                    levels = self._levels(args)
+                except ValueError:
+                    self.unknown += 1
+                    continue
+                if not levels:
+                    continue
+                if len(target) == 1:
+                    universe, channel = target[0]
+                    values = writes.setdefault(universe, {})
+                    for offset, level in enumerate(levels[:513 - channel]):
+                        values[channel + offset] = level
+                else:
+                    for universe, channel in target:
+                        writes.setdefault(universe, {})[channel] = levels[0]
+            elif kind == 'input':
+                if args and isinstance(args[0], (int, float)):
+                    self.inputs[target] = args[0]
+            elif not args or args[0]:
+                cues.append(route)  # Buttons send 1 on press and 0 on release
+
+        for universe, values in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None:
+                controller.set_channels(values)
+        if cues and self.cue_list is not None:
+            at = self.cue_list.timebase(self.clock())
+            for kind, index in cues:
+                if kind == 'go':
+                    self.cue_list.go(at)
+                else:
+                    self.cue_list.goto(index, at)
+
+    @staticmethod
+    def _levels(args):
+        levels = []
+        for arg in args:
+            if isinstance(arg, bytes):
+                levels.extend(arg)
+            else:
+                levels.append(to_dmx(arg))
+        return levels
+
+    def start(self, timeout=2.0):
+        """Run the server on its own event loop thread"""
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+                    lambda: _OSCProtocol(self), local_addr=self.address))
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                self.loop.close()
+                return
+            started.set()
+            try:
+                self.loop.run_forever()
+            finally:
+                transport.close()
+                self.loop.run_until_complete(asyncio.sleep(0))
+                self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="osc-server", daemon=True)
+        self.thread.start()
+        started.wait(timeout)
+        if errors:
+            self.thread = None
+            raise errors[0]
+        self.running = True
+        self.logger.info(f"OSC input on {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=1.0)
+            self.thread = None
@@ -0,0 +1,200 @@
+"""
+DMX Output Stage
+Per-channel dimmer curves and limits compiled into lookup tables,
+followed by grandmaster, blackout and group submasters
+"""
+import logging
+import threading
+
+import numpy as np
+
+UNIVERSE_SIZE = 512
+
+# Response curves on a 0.0-1.0 input
+CURVES = {
+    'linear': lambda x: x,
+    'square': lambda x: x * x,                      # Square-law, finer control at the low end
+    'scurve': lambda x: x * x * (3.0 - 2.0 * x),    # Smoothstep
+    'root': np.sqrt,                                # Inverse square-law
+}
+
+
+def compile_lut(curve='linear', minimum=0, maximum=255, invert=False):
+    """Build a 256-entry table mapping a DMX value through a transform"""
+    if curve not in CURVES:
+        raise ValueError(f"Unknown curve: {curve}")
+    x = np.arange(256, dtype=np.float64) / 255.0
+    if invert:
+        x = 1.0 - x
+    y = CURVES[curve](x)
+    return np.rint(minimum + y * (maximum - minimum)).clip(0, 255).astype(np.uint8)
+
+
+IDENTITY_LUT = compile_lut()
+
+
+class ChannelTransform:
+    """Output settings for one channel"""
+
+    def __init__(self, curve='linear', minimum=0, maximum=255, invert=False):
+        if curve not in CURVES:
+            raise ValueError(f"Unknown curve: {curve}")
+        if not 0 <= minimum <= 255 or not 0 <= maximum <= 255:
+            raise ValueError(f"Limits out of range: {minimum}-{maximum}")
+        self.curve = curve
+        self.minimum = int(minimum)
+        self.maximum = int(maximum)
+        self.invert = bool(invert)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('curve', 'linear'), data.get('min', 0), data.get('max', 255),
+                   data.get('invert', False))
+
+    def to_dict(self):
+        return {'curve': self.curve, 'min': self.minimum, 'max': self.maximum, 'invert': self.invert}
+
+    def compile(self):
+        return compile_lut(self.curve, self.minimum, self.maximum, self.invert)
+
+
+class OutputTransforms:
+    """Applies every channel's lookup table to a frame in one vectorized step"""
+
+    def __init__(self, size=UNIVERSE_SIZE):
+        self.size = size
+        self.transforms = {}  # channel (1-based) -> ChannelTransform
+        self.lock = threading.Lock()
+        # Row per channel, flattened so a frame maps through with a single take()
+        self.offsets = np.arange(size, dtype=np.intp) * 256
+        self.table = np.tile(IDENTITY_LUT, size)
+        self.identity = True
+        self.version = 0  # Bumped on every change so senders know to refresh
+
+    @classmethod
+    def from_config(cls, config, size=UNIVERSE_SIZE, logger=None):
+        """Transforms from 'output_transforms'; invalid entries are logged and skipped"""
+        logger = logger or logging.getLogger(__name__)
+        transforms = cls(size)
+        for channel, data in config.get('output_transforms', {}).items():
+            try:
+                number = int(channel)
+                if not 1 <= number <= size:
+                    raise ValueError(f"channel outside 1-{size}")
+                transforms.transforms[number] = ChannelTransform.from_dict(data)
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping output transform for channel {channel}: {e}")
+        transforms.compile()
+        return transforms
+
+    def to_config(self):
+        return {str(channel): transform.to_dict() for channel, transform in sorted(self.transforms.items())}
+
+    def set_transform(self, channel, transform):
+        """Set or replace the transform for a channel (1-based)"""
+        if not 1 <= channel <= self.size:
+            raise ValueError(f"Invalid channel: {channel}")
+        with self.lock:
+            self.transforms[channel] = transform
+        self.compile()
+
+    def clear_transform(self, channel):
+        with self.lock:
+            self.transforms.pop(channel, None)
+        self.compile()
+
+    def compile(self):
+        """Rebuild the lookup tables, swapped in whole so frames never see a partial table"""
+        with self.lock:
+            table = np.tile(IDENTITY_LUT, self.size)
+            for channel, transform in self.transforms.items():
+                start = (channel - 1) * 256
+                table[start:start + 256] = transform.compile()
+            self.identity = not self.transforms
+            self.table = table
+            self.version += 1
+
+    def apply(self, frame):
+        """Map a frame (bytes-like, one byte per channel) through the tables"""
+        if self.identity:
+            return bytes(frame)
+        values = np.frombuffer(frame, dtype=np.uint8)
+        return self.table.take(self.offsets[:len(values)] + values).tobytes()
+
+
+class MasterStage:
+    """Grandmaster, blackout and group submasters, applied as one multiply per frame"""
+
+    def __init__(self, size=UNIVERSE_SIZE):
+        self.size = size
+        self.grandmaster = 1.0
+        self.submasters = {}        # group -> level (0.0-1.0)
+        self.group_channels = {}    # group -> intensity channel indices
+        self.intensity = np.zeros(size, dtype=bool)
+        self.blackout = False
+        self.full = False
+        self.version = 0
+        self.lock = threading.Lock()
+        self._rebuild()
+
+    def configure(self, patch, universe):
+        """Take intensity channels and groups for one universe from the patch"""
+        intensity = np.zeros(self.size, dtype=bool)
+        intensity[[channel - 1 for channel in patch.intensity_channels(universe)]] = True
+        groups = {}
+        for group in patch.groups():
+            channels = patch.intensity_channels(universe, group)
+            if channels:
+                groups[group] = np.array(channels, dtype=np.intp) - 1
+        with self.lock:
+            self.intensity = intensity
+            self.group_channels = groups
+            for group in groups:
+                self.submasters.setdefault(group, 1.0)
+        self._rebuild()
+
+    def set_grandmaster(self, level):
+        self.grandmaster = max(0.0, min(1.0, float(level)))
+        self._rebuild()
+
+    def set_submaster(self, group, level):
+        with self.lock:
+            self.submasters[group] = max(0.0, min(1.0, float(level)))
+        self._rebuild()
+
+    def set_blackout(self, enabled):
+        """Blackout is a flag flip: the next frame picks the zero scale"""
+        self.blackout = bool(enabled)
+        self.version += 1
+
+    def set_full(self, enabled):
+        """Drive every intensity channel to full (still under the masters)"""
+        self.full = bool(enabled)
+        self.version += 1
+
+    def _rebuild(self):
+        # Fixed-point scale per channel, 256 = unity, so frames only need
+        # an integer multiply and shift
+        with self.lock:
+            levels = np.ones(self.size, dtype=np.float64)
+            for group, channels in self.group_channels.items():
+                levels[channels] *= self.submasters.get(group, 1.0)
+            levels[self.intensity] *= self.grandmaster
+            scale = np.rint(levels * 256).astype(np.uint16)
+            dark = scale.copy()
+            dark[self.intensity] = 0
+            self.full_floor = np.where(self.intensity, 255, 0).astype(np.uint8)
+            self.scale = scale
+            self.dark_scale = dark
+            self.unity = bool((scale == 256).all())
+            self.version += 1
+
+    def apply(self, frame):
+        """Scale a frame (bytes-like) by the masters"""
+        if self.unity and not self.blackout and not self.full:
+            return frame
+        values = np.frombuffer(frame, dtype=np.uint8)
+        if self.full:
+            values = np.maximum(values, self.full_floor[:len(values)])
+        scale = self.dark_scale if self.blackout else self.scale
+        return ((values * scale[:len(values)]) >> 8).astype(np.uint8).tobytes()
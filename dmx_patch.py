@@ -0,0 +1,123 @@
+"""
+DMX Patch
+Fixture types, fixture addresses and groups
+"""
+
+# Fixture personalities: attributes in channel order, and which of them carry intensity
+FIXTURE_TYPES = {
+    'moving_head_9ch': {
+        'name': '9-Channel Moving Head',
+        'attributes': ['pan', 'tilt', 'color', 'gobo', 'strobe', 'dimmer', 'speed', 'auto', 'reset'],
+        'intensity': ['dimmer'],
+        'pan_range': 540,     # Degrees over the full 0-255 travel
+        'tilt_range': 270,
+        # Color wheel slots as (first value, color); from wheel_auto on the wheel spins
+        'wheel': [(0, '#ffffff'), (14, '#ff0000'), (28, '#00ff00'), (42, '#0000ff'), (56, '#ffff00'),
+                  (70, '#ff00ff'), (84, '#00ffff'), (98, '#ff8000'), (112, '#ff80c0'), (126, '#80c0ff')],
+        'wheel_auto': 140,
+    },
+    'dimmer': {
+        'name': 'Dimmer',
+        'attributes': ['dimmer'],
+        'intensity': ['dimmer'],
+    },
+    'rgb': {
+        'name': 'RGB',
+        'attributes': ['red', 'green', 'blue'],
+        'intensity': ['red', 'green', 'blue'],
+    },
+    'rgbw': {
+        'name': 'RGBW',
+        'attributes': ['red', 'green', 'blue', 'white'],
+        'intensity': ['red', 'green', 'blue', 'white'],
+    },
+}
+
+# The rig the GUI was built for: one moving head at address 1
+DEFAULT_PATCH = [
+    {'name': 'Moving Head', 'type': 'moving_head_9ch', 'universe': 1, 'address': 1, 'groups': ['heads']},
+]
+
+
+class Fixture:
+    """A fixture patched at a universe and start address"""
+
+    def __init__(self, name, fixture_type, universe=1, address=1, groups=None, position=None):
+        if fixture_type not in FIXTURE_TYPES:
+            raise ValueError(f"Unknown fixture type: {fixture_type}")
+        self.name = name
+        self.type = fixture_type
+        self.universe = int(universe)
+        self.address = int(address)
+        self.groups = list(groups or [])
+        self.position = None  # (x, y) in metres on the stage plan, laid out automatically when missing
+        if position is not None:
+            if len(position) != 2:
+                raise ValueError(f"Fixture '{name}' position must be [x, y]")
+            self.position = (float(position[0]), float(position[1]))
+        if self.address < 1 or self.address + self.footprint - 1 > 512:
+            raise ValueError(f"Fixture '{name}' does not fit in the universe at address {address}")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['type'], data.get('universe', 1), data.get('address', 1),
+                   data.get('groups'), data.get('position'))
+
+    @property
+    def personality(self):
+        return FIXTURE_TYPES[self.type]
+
+    @property
+    def footprint(self):
+        return len(self.personality['attributes'])
+
+    @property
+    def attributes(self):
+        return self.personality['attributes']
+
+    def channel(self, attribute):
+        """Absolute channel (1-512) of an attribute"""
+        return self.address + self.attributes.index(attribute)
+
+    def intensity_channels(self):
+        return [self.channel(attribute) for attribute in self.personality['intensity']]
+
+
+class Patch:
+    """All patched fixtures, looked up by name, group and universe"""
+
+    def __init__(self, fixtures=None):
+        self.fixtures = list(fixtures or [])
+        self.by_name = {fixture.name: fixture for fixture in self.fixtures}
+        if len(self.by_name) != len(self.fixtures):
+            raise ValueError("Fixture names must be unique")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls([Fixture.from_dict(data) for data in config.get('patch', DEFAULT_PATCH)])
+
+    def fixture(self, name):
+        return self.by_name[name]
+
+    def groups(self):
+        """Group names in first-seen order"""
+        names = []
+        for fixture in self.fixtures:
+            for group in fixture.groups:
+                if group not in names:
+                    names.append(group)
+        return names
+
+    def universes(self):
+        return sorted({fixture.universe for fixture in self.fixtures})
+
+    def group_fixtures(self, group):
+        return [fixture for fixture in self.fixtures if group in fixture.groups]
+
+    def intensity_channels(self, universe, group=None):
+        """Intensity channels of a universe, optionally limited to one group"""
+        channels = []
+        for fixture in self.fixtures:
+            if fixture.universe == universe and (group is None or group in fixture.groups):
+                channels.extend(fixture.intensity_channels())
+        return channels
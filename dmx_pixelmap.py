@@ -0,0 +1,353 @@
+"""
+DMX Pixel Mapping
+Renders RGB frames (arrays, images, generated patterns) onto LED pixels across many universes
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+UNIVERSE_SIZE = 512
+COLOR_ORDERS = ('RGB', 'RBG', 'GRB', 'GBR', 'BRG', 'BGR', 'RGBW', 'GRBW')
+
+
+def gamma_lut(gamma=2.2):
+    """256-entry gamma correction table"""
+    x = np.arange(256, dtype=np.float64) / 255.0
+    return np.rint((x ** gamma) * 255.0).astype(np.uint8)
+
+
+class PixelLayout:
+    """Pixel positions on the canvas (0.0-1.0) and where each pixel is patched"""
+
+    def __init__(self):
+        self.positions = []   # (x, y)
+        self.addresses = []   # (universe, address, color order)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add_pixel(self, x, y, universe, address, color_order='RGB'):
+        if color_order not in COLOR_ORDERS:
+            raise ValueError(f"Unknown color order: {color_order}")
+        if address < 1 or address + len(color_order) - 1 > UNIVERSE_SIZE:
+            raise ValueError(f"Pixel at universe {universe} address {address} does not fit")
+        self.positions.append((x, y))
+        self.addresses.append((universe, address, color_order))
+
+    def add_strip(self, count, start, end, universe, address=1, color_order='RGB', per_universe=None):
+        """Pixels evenly spaced from start (x, y) to end (x, y), wrapping into the next universe
+
+        Returns the last universe used
+        """
+        footprint = len(color_order)
+        span = (per_universe or UNIVERSE_SIZE // footprint) * footprint  # Channels used per universe
+        for i in range(count):
+            t = i / (count - 1) if count > 1 else 0.0
+            x = start[0] + (end[0] - start[0]) * t
+            y = start[1] + (end[1] - start[1]) * t
+            offset = address - 1 + i * footprint
+            self.add_pixel(x, y, universe + offset // span, offset % span + 1, color_order)
+        return universe + (address - 1 + (max(count, 1) - 1) * footprint) // span
+
+    def add_matrix(self, width, height, universe, address=1, color_order='RGB', serpentine=True,
+                   per_universe=None):
+        """A width x height matrix wired row by row (zig-zag when serpentine)
+
+        Returns the last universe used
+        """
+        footprint = len(color_order)
+        span = (per_universe or UNIVERSE_SIZE // footprint) * footprint
+        offset = address - 1
+        for row in range(height):
+            columns = range(width)
+            if serpentine and row % 2:
+                columns = reversed(columns)
+            for column in columns:
+                x = (column + 0.5) / width
+                y = (row + 0.5) / height
+                self.add_pixel(x, y, universe + offset // span, offset % span + 1, color_order)
+                offset += footprint
+        return universe + (address - 1 + (max(width * height, 1) - 1) * footprint) // span
+
+    def truncate(self, length):
+        """Drop the pixels added after the first length"""
+        del self.positions[length:]
+        del self.addresses[length:]
+
+    def universes(self):
+        return sorted({universe for universe, _, _ in self.addresses})
+
+
+class PixelMap:
+    """Compiled pixel map: one gather and one scatter per frame"""
+
+    def __init__(self, layout, gamma=2.2, sampling='nearest', brightness=1.0):
+        if not len(layout):
+            raise ValueError("Pixel layout is empty")
+        if sampling not in ('nearest', 'bilinear'):
+            raise ValueError(f"Unknown sampling: {sampling}")
+        self.layout = layout
+        self.sampling = sampling
+        self.universes = layout.universes()
+        self.slots = {universe: i for i, universe in enumerate(self.universes)}
+        self.positions = np.array(layout.positions, dtype=np.float64).clip(0.0, 1.0)
+        self.set_gamma(gamma, brightness)
+        self._samplers = {}  # frame (height, width) -> sampling indices
+        self._compile_outputs()
+        self.output = np.zeros((len(self.universes), UNIVERSE_SIZE), dtype=np.uint8)
+
+    def set_gamma(self, gamma, brightness=1.0):
+        """Gamma and brightness are folded into a single lookup table"""
+        self.lut = np.rint(gamma_lut(gamma) * max(0.0, min(1.0, brightness))).astype(np.uint8)
+
+    def _compile_outputs(self):
+        # For every DMX channel a pixel drives: where it goes in the flattened
+        # output and which (pixel, component) it comes from. Component 3 is
+        # white, extracted from the RGB minimum.
+        destinations = []
+        sources = []
+        whites = []
+        for pixel, (universe, address, order) in enumerate(self.layout.addresses):
+            base = self.slots[universe] * UNIVERSE_SIZE + address - 1
+            for offset, component in enumerate(order):
+                destinations.append(base + offset)
+                sources.append(pixel * 4 + 'RGBW'.index(component))
+            whites.append('W' in order)
+        self.destinations = np.array(destinations, dtype=np.intp)
+        self.sources = np.array(sources, dtype=np.intp)
+        self.has_white = np.array(whites, dtype=bool)
+        self.any_white = bool(self.has_white.any())
+
+        # Contiguous channel runs per universe, so only patched channels are written
+        self.runs = {}
+        for universe in self.universes:
+            slot = self.slots[universe]
+            channels = np.unique(self.destinations[(self.destinations // UNIVERSE_SIZE) == slot] % UNIVERSE_SIZE)
+            breaks = np.flatnonzero(np.diff(channels) != 1) + 1
+            self.runs[universe] = [(int(run[0]), int(run[-1]) + 1) for run in np.split(channels, breaks)]
+
+    def _sampler(self, height, width):
+        key = (height, width)
+        if key not in self._samplers:
+            x = self.positions[:, 0] * (width - 1)
+            y = self.positions[:, 1] * (height - 1)
+            if self.sampling == 'nearest':
+                self._samplers[key] = (np.rint(y).astype(np.intp) * width + np.rint(x).astype(np.intp),)
+            else:
+                x0 = np.floor(x).astype(np.intp)
+                y0 = np.floor(y).astype(np.intp)
+                x1 = np.minimum(x0 + 1, width - 1)
+                y1 = np.minimum(y0 + 1, height - 1)
+                fx = (x - x0)[:, None]
+                fy = (y - y0)[:, None]
+                self._samplers[key] = (y0 * width + x0, y0 * width + x1, y1 * width + x0, y1 * width + x1,
+                                       (1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy)
+        return self._samplers[key]
+
+    def sample(self, frame):
+        """Colors (pixels x 3, uint8) of the layout sampled from an RGB frame"""
+        frame = np.asarray(frame)
+        if frame.ndim != 3 or frame.shape[2] < 3:
+            raise ValueError(f"Expected a height x width x 3 frame, got {frame.shape}")
+        if frame.dtype != np.uint8:
+            frame = (np.clip(frame, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+        height, width = frame.shape[:2]
+        flat = frame[:, :, :3].reshape(-1, 3)
+        sampler = self._sampler(height, width)
+        if len(sampler) == 1:
+            return flat[sampler[0]]
+        i00, i01, i10, i11, w00, w01, w10, w11 = sampler
+        colors = flat[i00] * w00 + flat[i01] * w01 + flat[i10] * w10 + flat[i11] * w11
+        return (colors + 0.5).astype(np.uint8)
+
+    def render(self, frame):
+        """Map a frame into the (universes x 512) output array"""
+        colors = self.lut[self.sample(frame)]
+        components = np.empty((len(colors), 4), dtype=np.uint8)
+        components[:, :3] = colors
+        if self.any_white:
+            white = colors.min(axis=1)
+            white[~self.has_white] = 0
+            components[:, 3] = white
+            components[self.has_white, :3] -= white[self.has_white, None]
+        else:
+            components[:, 3] = 0
+        self.output.reshape(-1)[self.destinations] = components.reshape(-1)[self.sources]
+        return self.output
+
+    def write(self, controllers):
+        """Write the last rendered output into {universe: DMXController}"""
+        for universe, runs in self.runs.items():
+            controller = controllers.get(universe)
+            if controller is None:
+                continue
+            row = self.output[self.slots[universe]]
+            for start, end in runs:
+                controller.set_range(start + 1, row[start:end])
+
+
+class PixelMapSource:
+    """Scheduler source that renders a frame provider through a pixel map every frame"""
+
+    def __init__(self, pixel_map, controllers, provider, logger=None):
+        self.pixel_map = pixel_map
+        self.controllers = controllers
+        self.provider = provider  # provider(now) -> RGB frame
+        self.logger = logger or logging.getLogger(__name__)
+        self.render_time = 0.0
+
+    def on_frame(self, now):
+        start = time.perf_counter()
+        self.pixel_map.render(self.provider(now))
+        self.pixel_map.write(self.controllers)
+        self.render_time = time.perf_counter() - start
+
+    @classmethod
+    def from_config(cls, config, controllers, logger=None):
+        """Source for the 'pixelmap' section, None when there is none, it is disabled or nothing is patched"""
+        logger = logger or logging.getLogger(__name__)
+        options = config.get('pixelmap', {})
+        if not options.get('enabled', True) or not (options.get('strips') or options.get('matrices')):
+            return None
+        layout = PixelLayout()
+        for data in options.get('strips', []):
+            patched = len(layout)
+            try:
+                start, end = tuple(data.get('start', (0.0, 0.5))), tuple(data.get('end', (1.0, 0.5)))
+                layout.add_strip(data['count'], start, end, data.get('universe', 1), data.get('address', 1),
+                                 data.get('color_order', 'RGB'), data.get('per_universe'))
+            except (KeyError, TypeError, ValueError) as e:
+                layout.truncate(patched)
+                logger.warning(f"Skipping pixel strip {data}: {e}")
+        for data in options.get('matrices', []):
+            patched = len(layout)
+            try:
+                layout.add_matrix(data['width'], data['height'], data.get('universe', 1), data.get('address', 1),
+                                  data.get('color_order', 'RGB'), data.get('serpentine', True),
+                                  data.get('per_universe'))
+            except (KeyError, TypeError, ValueError) as e:
+                layout.truncate(patched)
+                logger.warning(f"Skipping pixel matrix {data}: {e}")
+        if not len(layout):
+            return None
+        try:
+            pixel_map = PixelMap(layout, gamma=options.get('gamma', 2.2), sampling=options.get('sampling', 'nearest'),
+                                 brightness=options.get('brightness', 1.0))
+            if options.get('images'):
+                provider = ImageSequence(options['images'], options.get('fps', 25.0), options.get('loop', True))
+            else:
+                effect = options.get('effect', 'rainbow')
+                if effect not in EFFECTS:
+                    raise ValueError(f"Unknown effect: {effect}")
+                provider = EFFECTS[effect](**options.get('options', {}))
+        except Exception as e:
+            logger.warning(f"Pixel map disabled: {e}")
+            return None
+        return cls(pixel_map, controllers, provider, logger=logger)
+
+
+def load_image(path):
+    """Load an image file as a height x width x 3 uint8 array"""
+    import pygame
+    surface = pygame.image.load(path)
+    return np.ascontiguousarray(pygame.surfarray.array3d(surface).transpose(1, 0, 2))
+
+
+class ImageSequence:
+    """Frame provider cycling through images (or video frames) at a fixed rate"""
+
+    def __init__(self, frames, fps=25.0, loop=True):
+        self.frames = [load_image(frame) if isinstance(frame, str) else np.asarray(frame) for frame in frames]
+        self.fps = fps
+        self.loop = loop
+
+    def __call__(self, now):
+        index = int(now * self.fps)
+        index = index % len(self.frames) if self.loop else min(index, len(self.frames) - 1)
+        return self.frames[index]
+
+
+def _grid(width, height):
+    return np.meshgrid(np.linspace(0.0, 1.0, width), np.linspace(0.0, 1.0, height))
+
+
+def rainbow(width=64, height=64, speed=0.2):
+    """Frame provider: horizontal rainbow scrolling over time"""
+    x, _ = _grid(width, height)
+
+    def provider(now):
+        hue = (x + now * speed) % 1.0
+        return _hue_to_rgb(hue)
+    return provider
+
+
+def plasma(width=64, height=64, speed=1.0):
+    """Frame provider: classic plasma"""
+    x, y = _grid(width, height)
+    x = x * 8.0
+    y = y * 8.0
+
+    def provider(now):
+        t = now * speed
+        value = np.sin(x + t) + np.sin(y + t * 0.7) + np.sin((x + y + t) * 0.5) + np.sin(np.hypot(x, y) + t)
+        return _hue_to_rgb((value / 8.0 + 0.5) % 1.0)
+    return provider
+
+
+def chase(width=64, height=1, speed=0.5, size=0.1, color=(255, 255, 255)):
+    """Frame provider: a bar of color moving left to right"""
+    x, _ = _grid(width, height)
+    color = np.array(color, dtype=np.float64) / 255.0
+
+    def provider(now):
+        distance = np.abs(((x - now * speed) + 0.5) % 1.0 - 0.5)
+        level = np.clip(1.0 - distance / size, 0.0, 1.0)
+        return level[:, :, None] * color
+    return provider
+
+
+EFFECTS = {'rainbow': rainbow, 'plasma': plasma, 'chase': chase}
+
+
+def _hue_to_rgb(hue):
+    # Fully saturated HSV to RGB, vectorized over any hue array
+    h = hue * 6.0
+    r = np.clip(np.abs(h - 3.0) - 1.0, 0.0, 1.0)
+    g = np.clip(2.0 - np.abs(h - 2.0), 0.0, 1.0)
+    b = np.clip(2.0 - np.abs(h - 4.0), 0.0, 1.0)
+    return np.stack((r, g, b), axis=-1)
+
+
+def benchmark(universes=32, seconds=3.0, sampling='nearest'):
+    """Render a plasma onto an RGB matrix filling the given number of universes"""
+    layout = PixelLayout()
+    pixels = universes * 170
+    width = 170
+    layout.add_matrix(width, pixels // width, universe=1)
+    pixel_map = PixelMap(layout, sampling=sampling)
+    provider = plasma(128, 128)
+
+    frames = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pixel_map.render(provider(frames / 40.0))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, len(layout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pixel map render benchmark")
+    parser.add_argument('--universes', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--sampling', choices=('nearest', 'bilinear'), default='nearest')
+    args = parser.parse_args()
+    fps, pixels = benchmark(args.universes, args.seconds, args.sampling)
+    print(f"{pixels} pixels in {args.universes} universes ({args.sampling}): {fps:.0f} frames/s "
+          f"({1000.0 / fps:.2f} ms per frame)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+"""
+DMX RDM
+Remote Device Management over Enttec DMX USB Pro-compatible serial widgets: discovery,
+DEVICE_INFO readback and start address setting, interleaved with the DMX frames
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+from collections import deque
+
+try:
+    import serial
+    from serial.tools import list_ports
+except ImportError:
+    serial = None
+
+from dmx_patch import FIXTURE_TYPES
+
+RDM_START_CODE = 0xCC
+RDM_SUB_START_CODE = 0x01
+
+# Command classes
+DISCOVERY_COMMAND = 0x10
+DISCOVERY_COMMAND_RESPONSE = 0x11
+GET_COMMAND = 0x20
+GET_COMMAND_RESPONSE = 0x21
+SET_COMMAND = 0x30
+SET_COMMAND_RESPONSE = 0x31
+
+# Parameter IDs
+PID_DISC_UNIQUE_BRANCH = 0x0001
+PID_DISC_MUTE = 0x0002
+PID_DISC_UN_MUTE = 0x0003
+PID_DEVICE_INFO = 0x0060
+PID_DEVICE_LABEL = 0x0082
+PID_DMX_START_ADDRESS = 0x00F0
+PID_IDENTIFY_DEVICE = 0x1000
+
+# Response types
+RESPONSE_ACK = 0x00
+RESPONSE_ACK_TIMER = 0x01
+RESPONSE_NACK = 0x02
+RESPONSE_ACK_OVERFLOW = 0x03
+
+BROADCAST_UID = 0xFFFFFFFFFFFF
+MAX_UID = 0xFFFFFFFFFFFE
+CONTROLLER_UID = 0x7FF0_00000001  # Manufacturer 0x7FF0 is reserved for prototypes
+
+# DEVICE_INFO: protocol, model, category, software, footprint, personality, personalities,
+# start address, sub-devices, sensors
+DEVICE_INFO = struct.Struct('>HHHIHBBHHB')
+NO_ADDRESS = 0xFFFF  # Start address of devices without a footprint
+
+RDM_CACHE_FILE = 'rdm_devices.json'
+RDM_TIMEOUT = 0.02     # Seconds to wait for a reply; responders answer within 2.8 ms plus USB latency
+RDM_SLACK = RDM_TIMEOUT + 0.002  # Frame slack one transaction needs before the scheduler lets it run
+
+# Enttec DMX USB Pro message labels
+PRO_START = 0x7E
+PRO_END = 0xE7
+PRO_MAX_DATA = 600  # Longest message the widget sends; anything longer is a false start byte
+LABEL_RECEIVED = 5
+LABEL_SEND_DMX = 6
+LABEL_SEND_RDM = 7
+LABEL_RDM_DISCOVERY = 11
+LABEL_RDM_TIMEOUT = 12
+PRO_USB_IDS = [(0x0403, 0x6001)]  # FTDI FT245R / FT232R as used by the Pro and its clones
+
+# Outcomes of a DISC_UNIQUE_BRANCH
+BRANCH_EMPTY = 'empty'
+BRANCH_UID = 'uid'
+BRANCH_COLLISION = 'collision'
+
+
+class RDMError(Exception):
+    """An RDM transaction failed or the interface cannot do RDM"""
+
+
+def format_uid(uid):
+    return f"{uid >> 32:04X}:{uid & 0xFFFFFFFF:08X}"
+
+
+def parse_uid(text):
+    manufacturer, device = text.split(':')
+    return (int(manufacturer, 16) << 32) | int(device, 16)
+
+
+def checksum(data):
+    return sum(data) & 0xFFFF
+
+
+def encode_request(destination, source, transaction, command_class, pid, data=b'', port=1, sub_device=0):
+    """RDM request packet, start code to checksum"""
+    packet = struct.pack('>BBB6s6sBBBHBHB', RDM_START_CODE, RDM_SUB_START_CODE, 24 + len(data),
+                         destination.to_bytes(6, 'big'), source.to_bytes(6, 'big'), transaction & 0xFF,
+                         port, 0, sub_device, command_class, pid, len(data)) + bytes(data)
+    return packet + struct.pack('>H', checksum(packet))
+
+
+class RDMResponse:
+    """A decoded RDM response packet"""
+
+    def __init__(self, source, destination, transaction, response_type, command_class, pid, data):
+        self.source = source
+        self.destination = destination
+        self.transaction = transaction
+        self.response_type = response_type
+        self.command_class = command_class
+        self.pid = pid
+        self.data = data
+
+
+def decode_response(packet):
+    """RDMResponse from a packet starting at the start code, RDMError if it is malformed"""
+    packet = bytes(packet)
+    if len(packet) < 26 or packet[0] != RDM_START_CODE or packet[1] != RDM_SUB_START_CODE:
+        raise RDMError(f"Not an RDM packet ({len(packet)} bytes)")
+    length = packet[2]
+    if length < 24 or len(packet) < length + 2:
+        raise RDMError(f"Truncated RDM packet ({len(packet)} of {length + 2} bytes)")
+    if checksum(packet[:length]) != struct.unpack_from('>H', packet, length)[0]:
+        raise RDMError("RDM checksum mismatch")
+    destination = int.from_bytes(packet[3:9], 'big')
+    source = int.from_bytes(packet[9:15], 'big')
+    transaction, response_type = packet[15], packet[16]
+    command_class, pid, data_length = struct.unpack_from('>BHB', packet, 20)
+    return RDMResponse(source, destination, transaction, response_type, command_class, pid,
+                       packet[24:24 + data_length])
+
+
+def encode_discovery_response(uid):
+    """What a responder sends to a DISC_UNIQUE_BRANCH it falls into"""
+    encoded = bytearray()
+    for byte in uid.to_bytes(6, 'big'):
+        encoded += bytes((byte | 0xAA, byte | 0x55))
+    total = checksum(encoded)
+    return (b'\xFE' * 7 + b'\xAA' + bytes(encoded) +
+            bytes(((total >> 8) | 0xAA, (total >> 8) | 0x55, (total & 0xFF) | 0xAA, (total & 0xFF) | 0x55)))
+
+
+def decode_discovery_response(data):
+    """UID from a discovery response, None if several responders collided"""
+    data = bytes(data)
+    start = data.find(0xAA)
+    if start < 0 or start > 8 or len(data) < start + 17:
+        return None
+    encoded = data[start + 1:start + 17]
+    uid = 0
+    for i in range(6):
+        uid = (uid << 8) | (encoded[2 * i] & encoded[2 * i + 1])
+    total = ((encoded[12] & encoded[13]) << 8) | (encoded[14] & encoded[15])
+    if total != checksum(encoded[:12]):
+        return None
+    return uid
+
+
+class RDMDevice:
+    """A discovered responder and what its DEVICE_INFO said"""
+
+    def __init__(self, uid, model=0, category=0, software=0, footprint=0, personality=0, personalities=0,
+                 start_address=NO_ADDRESS, label=''):
+        self.uid = uid
+        self.model = model
+        self.category = category
+        self.software = software
+        self.footprint = footprint
+        self.personality = personality
+        self.personalities = personalities
+        self.start_address = start_address
+        self.label = label
+
+    @classmethod
+    def from_device_info(cls, uid, data):
+        if len(data) < DEVICE_INFO.size:
+            raise RDMError(f"DEVICE_INFO from {format_uid(uid)} is {len(data)} bytes")
+        (_, model, category, software, footprint, personality, personalities,
+         start_address, _, _) = DEVICE_INFO.unpack_from(data)
+        return cls(uid, model, category, software, footprint, personality, personalities, start_address)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(parse_uid(data['uid']), data.get('model', 0), data.get('category', 0),
+                   data.get('software', 0), data.get('footprint', 0), data.get('personality', 0),
+                   data.get('personalities', 0), data.get('start_address', NO_ADDRESS), data.get('label', ''))
+
+    def to_dict(self):
+        return {'uid': format_uid(self.uid), 'model': self.model, 'category': self.category,
+                'software': self.software, 'footprint': self.footprint, 'personality': self.personality,
+                'personalities': self.personalities, 'start_address': self.start_address, 'label': self.label}
+
+    @property
+    def name(self):
+        return self.label or f"RDM {format_uid(self.uid)}"
+
+
+def patch_entries(devices, universe=1):
+    """Patch entries for devices whose footprint matches a known fixture type"""
+    types_by_footprint = {}
+    for type_name, personality in FIXTURE_TYPES.items():
+        types_by_footprint.setdefault(len(personality['attributes']), type_name)
+    entries = []
+    for device in devices:
+        fixture_type = types_by_footprint.get(device.footprint)
+        if fixture_type is None or device.start_address == NO_ADDRESS:
+            continue
+        entries.append({'name': device.name, 'type': fixture_type, 'universe': universe,
+                        'address': device.start_address})
+    return entries
+
+
+class EnttecProPort:
+    """Enttec DMX USB Pro-compatible widget: DMX output plus RDM through the widget's API"""
+
+    rdm_supported = True
+
+    def __init__(self, port, baudrate=57600, timeout=RDM_TIMEOUT, logger=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.serial = None
+
+    @staticmethod
+    def find_ports():
+        """Serial widgets that look like an Enttec Pro, in the same form as find_udmx_devices"""
+        if serial is None:
+            return []
+        devices = []
+        for info in list_ports.comports():
+            if (info.vid, info.pid) in PRO_USB_IDS:
+                name = info.product or 'DMX USB Pro'
+                devices.append({
+                    'port': info.device,
+                    'name': name,
+                    'vendor': info.vid,
+                    'product': info.pid,
+                    'description': f"{name} ({info.device}, RDM)",
+                })
+        return devices
+
+    def open(self):
+        if serial is None:
+            raise RDMError("Serial DMX widgets need the 'pyserial' package")
+        self.serial = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+        self.serial.reset_input_buffer()
+        self.logger.info(f"Opened DMX widget on {self.port}")
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def write_message(self, label, data):
+        self.serial.write(bytes((PRO_START, label, len(data) & 0xFF, len(data) >> 8)) + bytes(data) +
+                          bytes((PRO_END,)))
+
+    def _read(self, size, deadline):
+        # Each read waits at most until the deadline, not a whole port timeout per call
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return b''
+        self.serial.timeout = remaining
+        return self.serial.read(size)
+
+    def read_message(self, timeout):
+        """(label, data) of the next widget message, None on timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            byte = self._read(1, deadline)
+            if not byte or byte[0] != PRO_START:
+                continue
+            header = self._read(3, deadline)
+            if len(header) < 3:
+                return None
+            length = header[1] | (header[2] << 8)
+            if length > PRO_MAX_DATA:
+                continue  # Not a real header, look for the next start byte
+            data = self._read(length + 1, deadline)
+            if len(data) < length + 1 or data[-1] != PRO_END:
+                continue  # Lost sync, look for the next start byte
+            return header[0], data[:-1]
+        return None
+
+    def _reply(self):
+        # A received-packet message (status byte first) or the widget's RDM timeout message
+        deadline = time.monotonic() + self.timeout
+        while True:
+            message = self.read_message(max(0.0, deadline - time.monotonic()))
+            if message is None or message[0] == LABEL_RDM_TIMEOUT:
+                return None
+            label, data = message
+            if label == LABEL_RECEIVED:
+                if not data or data[0]:
+                    return None  # Framing error or overrun while receiving
+                return data[1:]
+
+    def send_dmx(self, frame):
+        self.write_message(LABEL_SEND_DMX, b'\x00' + bytes(frame))
+
+    def send_rdm(self, packet, expect_reply=True):
+        """Send an RDM request and return the reply packet, None if nobody answered"""
+        self.serial.reset_input_buffer()
+        self.write_message(LABEL_SEND_RDM, packet)
+        return self._reply() if expect_reply else None
+
+    def send_discovery(self, packet):
+        """Send a DISC_UNIQUE_BRANCH and return the raw responses, None if nobody answered"""
+        self.serial.reset_input_buffer()
+        self.write_message(LABEL_RDM_DISCOVERY, packet)
+        return self._reply()
+
+
+class RDMController:
+    """Discovery and parameter jobs run one transaction at a time in the slack between frames"""
+
+    def __init__(self, port=None, scheduler=None, cache_path=RDM_CACHE_FILE, uid=CONTROLLER_UID, logger=None):
+        self.port = port            # EnttecProPort, None while no RDM-capable interface is open
+        self.scheduler = scheduler
+        self.clock = scheduler.clock if scheduler is not None else time.monotonic
+        self.cache_path = cache_path
+        self.uid = uid
+        self.logger = logger or logging.getLogger(__name__)
+        self.devices = {}           # uid -> RDMDevice
+        self.jobs = deque()         # (generator, callback)
+        self.transaction = 0
+        self.transactions = 0
+        self.timeouts = 0
+        self.load_cache()
+
+    # Cache
+
+    def load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                devices = [RDMDevice.from_dict(data) for data in json.load(f).get('devices', [])]
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"Could not read the RDM device cache: {e}")
+            return
+        self.devices = {device.uid: device for device in devices}
+        self.logger.info(f"RDM cache: {len(self.devices)} devices")
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump({'devices': [device.to_dict() for device in self.devices.values()]}, f, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Could not write the RDM device cache: {e}")
+
+    # Transactions
+
+    def _transport(self):
+        if self.port is None or not getattr(self.port, 'rdm_supported', False):
+            raise RDMError("The connected interface cannot send RDM; uDMX interfaces are transmit-only")
+        return self.port
+
+    def _packet(self, destination, command_class, pid, data=b''):
+        self.transaction = (self.transaction + 1) & 0xFF
+        self.transactions += 1
+        return encode_request(destination, self.uid, self.transaction, command_class, pid, data)
+
+    def request(self, destination, command_class, pid, data=b''):
+        """One request/response transaction; None if the responder did not answer"""
+        port = self._transport()
+        packet = self._packet(destination, command_class, pid, data)
+        if destination == BROADCAST_UID:
+            port.send_rdm(packet, expect_reply=False)
+            return None
+        reply = port.send_rdm(packet)
+        if reply is None:
+            self.timeouts += 1
+            return None
+        response = decode_response(reply)
+        if response.transaction != self.transaction or response.source != destination or response.pid != pid:
+            raise RDMError(f"Unexpected RDM reply from {format_uid(response.source)}")
+        if response.response_type == RESPONSE_NACK:
+            reason = struct.unpack('>H', response.data[:2])[0] if len(response.data) >= 2 else 0
+            raise RDMError(f"{format_uid(destination)} refused PID 0x{pid:04X} (NACK reason 0x{reason:04X})")
+        if response.response_type != RESPONSE_ACK:
+            raise RDMError(f"{format_uid(destination)} deferred PID 0x{pid:04X} (response type {response.response_type})")
+        return response
+
+    def get(self, uid, pid, data=b''):
+        response = self.request(uid, GET_COMMAND, pid, data)
+        if response is None:
+            raise RDMError(f"No reply from {format_uid(uid)}")
+        return response.data
+
+    def set(self, uid, pid, data=b''):
+        if uid == BROADCAST_UID:
+            self.request(uid, SET_COMMAND, pid, data)
+            return
+        if self.request(uid, SET_COMMAND, pid, data) is None:
+            raise RDMError(f"No reply from {format_uid(uid)}")
+
+    def branch(self, lower, upper):
+        """(BRANCH_EMPTY | BRANCH_UID | BRANCH_COLLISION, uid) for the responders in [lower, upper]"""
+        port = self._transport()
+        packet = self._packet(BROADCAST_UID, DISCOVERY_COMMAND, PID_DISC_UNIQUE_BRANCH,
+                              lower.to_bytes(6, 'big') + upper.to_bytes(6, 'big'))
+        reply = port.send_discovery(packet)
+        if not reply:
+            return BRANCH_EMPTY, None
+        uid = decode_discovery_response(reply)
+        if uid is None or not lower <= uid <= upper:
+            return BRANCH_COLLISION, None
+        return BRANCH_UID, uid
+
+    def mute(self, uid):
+        return self.request(uid, DISCOVERY_COMMAND, PID_DISC_MUTE) is not None
+
+    def unmute_all(self):
+        self.request(BROADCAST_UID, DISCOVERY_COMMAND, PID_DISC_UN_MUTE)
+
+    # Jobs: generators that yield after every transaction
+
+    def discover(self, full=False):
+        """Find the responders on the line; cached devices are confirmed with one mute each"""
+        self.unmute_all()
+        yield
+        found = set()
+        if not full:
+            for uid in list(self.devices):
+                if self.mute(uid):
+                    found.add(uid)
+                yield
+
+        # Binary search; with the known devices muted, an unchanged line answers the first branch empty
+        stack = [(0, MAX_UID)]
+        while stack:
+            lower, upper = stack.pop()
+            result, uid = self.branch(lower, upper)
+            yield
+            if result == BRANCH_UID:
+                muted = self.mute(uid)
+                yield
+                if muted:
+                    found.add(uid)
+                    stack.append((lower, upper))  # More responders may share the range
+                    continue
+            if result != BRANCH_EMPTY and lower < upper:
+                middle = (lower + upper) // 2
+                stack.append((middle + 1, upper))
+                stack.append((lower, middle))
+
+        for uid in sorted(found):
+            if full or uid not in self.devices:
+                device = yield from self.read_device(uid)
+                self.devices[uid] = device
+        for uid in set(self.devices) - found:
+            self.logger.info(f"RDM device {format_uid(uid)} no longer answers")
+            del self.devices[uid]
+        self.save_cache()
+        self.logger.info(f"RDM discovery: {len(self.devices)} devices, {self.transactions} transactions")
+        return list(self.devices.values())
+
+    def read_device(self, uid):
+        """DEVICE_INFO and label of one responder"""
+        device = RDMDevice.from_device_info(uid, self.get(uid, PID_DEVICE_INFO))
+        yield
+        try:
+            device.label = self.get(uid, PID_DEVICE_LABEL).decode('ascii', 'replace').strip('\x00 ')
+        except RDMError:
+            pass  # DEVICE_LABEL is optional
+        yield
+        return device
+
+    def set_start_address(self, uid, address):
+        """Readdress a responder and record the new address"""
+        if not 1 <= address <= 512:
+            raise RDMError(f"Start address {address} is outside 1-512")
+        device = self.devices.get(uid)
+        if device is not None and device.footprint and address + device.footprint - 1 > 512:
+            raise RDMError(f"A {device.footprint}-channel footprint does not fit at address {address}")
+        self.set(uid, PID_DMX_START_ADDRESS, struct.pack('>H', address))
+        yield
+        if uid == BROADCAST_UID:
+            for device in self.devices.values():
+                device.start_address = address
+        elif device is not None:
+            device.start_address = address
+        self.save_cache()
+        self.logger.info(f"RDM: {format_uid(uid)} set to address {address}")
+        return device
+
+    def identify(self, uid, on=True):
+        self.set(uid, PID_IDENTIFY_DEVICE, bytes((1 if on else 0,)))
+        yield
+
+    def submit(self, job, callback=None):
+        """Queue a job; callback(result or RDMError) runs on the output thread when it ends"""
+        self.jobs.append((job, callback))
+
+    @property
+    def busy(self):
+        return bool(self.jobs)
+
+    def step(self):
+        """Run one transaction of the current job"""
+        job, callback = self.jobs[0]
+        try:
+            next(job)
+            return
+        except StopIteration as done:
+            result = done.value
+        except (RDMError, OSError, ValueError) as e:
+            self.logger.error(f"RDM: {e}")
+            result = e if isinstance(e, RDMError) else RDMError(str(e))
+        self.jobs.popleft()
+        if callback is not None:
+            callback(result)
+
+    def on_frame(self, now, frames):
+        """Run queued transactions while the next frame is far enough away (scheduler listener)"""
+        if not self.jobs:
+            return
+        deadline = self.scheduler.next_deadline or now + self.scheduler.interval
+        while self.jobs and self.clock() + RDM_SLACK < deadline:
+            self.step()
+
+    def run(self, job):
+        """Run a job to completion without a scheduler (command line use)"""
+        result = None
+
+        def done(value):
+            nonlocal result
+            result = value
+        self.submit(job, done)
+        while self.jobs:
+            self.step()
+        if isinstance(result, RDMError):
+            raise result
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RDM discovery and addressing through a DMX USB Pro widget")
+    parser.add_argument('--port', help="Serial port of the widget (default: first one found)")
+    parser.add_argument('--full', action='store_true', help="Ignore the device cache and rediscover the line")
+    parser.add_argument('--set-address', nargs=2, metavar=('UID', 'ADDRESS'),
+                        help="Set the start address of a device (UID as MMMM:DDDDDDDD)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    port_name = args.port
+    if port_name is None:
+        ports = EnttecProPort.find_ports()
+        if not ports:
+            parser.error("No DMX USB Pro-compatible widget found (needs pyserial)")
+        port_name = ports[0]['port']
+    port = EnttecProPort(port_name)
+    port.open()
+    rdm = RDMController(port)
+    try:
+        if args.set_address:
+            rdm.run(rdm.set_start_address(parse_uid(args.set_address[0]), int(args.set_address[1])))
+        for device in rdm.run(rdm.discover(full=args.full)):
+            print(f"{format_uid(device.uid)}  address {device.start_address:>3}  "
+                  f"footprint {device.footprint:>3}  {device.label}")
+    finally:
+        port.close()
+
+
+if __name__ == "__main__":
+    main()
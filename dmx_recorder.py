@@ -0,0 +1,396 @@
+"""
+DMX Show Recorder
+Records output frames as timestamped deltas and plays them back
+"""
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+# File layout:
+#   header  - magic, version, wall-clock start time
+#   chunks  - chunk header followed by its records, appended one after another
+#   records - record header followed by a run list
+# Every chunk starts with a keyframe of each known universe, so playback can
+# seek to any chunk without reading what came before it.
+FILE_MAGIC = b'DMXR'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHd')       # magic, version, created
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sIIdd')    # magic, payload size, records, first ts, last ts
+RECORD_HEADER = struct.Struct('<IHB')      # offset from chunk start (us), universe, kind
+RUN_COUNT = struct.Struct('<H')
+RUN_HEADER = struct.Struct('<HH')          # first channel index, length
+
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+
+UNIVERSE_SIZE = 512
+CHUNK_BYTES = 64 * 1024       # Flush a chunk once it grows past this size
+CHUNK_SECONDS = 5.0           # ...or once it spans this much show time
+MAX_OFFSET_US = 0xFFFFFFFF
+RUN_GAP = 4                   # Merge runs separated by fewer unchanged channels
+
+RECORDINGS_DIR = 'recordings'
+RECORDING_EXTENSION = '.dmxr'
+
+
+def diff_runs(old, new, gap=RUN_GAP):
+    """Return (start, data) runs where new differs from old"""
+    runs = []
+    start = end = None
+    for i in range(len(new)):
+        if old[i] != new[i]:
+            if start is None:
+                start = i
+            elif i - end > gap:
+                runs.append((start, bytes(new[start:end])))
+                start = i
+            end = i + 1
+    if start is not None:
+        runs.append((start, bytes(new[start:end])))
+    return runs
+
+
+def encode_runs(runs):
+    """Pack a run list into its binary form"""
+    parts = [RUN_COUNT.pack(len(runs))]
+    for start, data in runs:
+        parts.append(RUN_HEADER.pack(start, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def apply_runs(buffer, payload, offset=0):
+    """Write a packed run list into buffer, returns the offset after it"""
+    count, = RUN_COUNT.unpack_from(payload, offset)
+    offset += RUN_COUNT.size
+    for _ in range(count):
+        start, length = RUN_HEADER.unpack_from(payload, offset)
+        offset += RUN_HEADER.size
+        buffer[start:start + length] = payload[offset:offset + length]
+        offset += length
+    return offset
+
+
+def runs_size(payload, offset=0):
+    """Size in bytes of the packed run list starting at offset"""
+    count, = RUN_COUNT.unpack_from(payload, offset)
+    end = offset + RUN_COUNT.size
+    for _ in range(count):
+        _, length = RUN_HEADER.unpack_from(payload, end)
+        end += RUN_HEADER.size + length
+    return end - offset
+
+
+def new_recording_path():
+    """Timestamped path for a new recording"""
+    return os.path.join(RECORDINGS_DIR, f"show_{time.strftime('%Y%m%d_%H%M%S')}{RECORDING_EXTENSION}")
+
+
+class ShowRecorder:
+    """Append-only recorder for DMX output frames"""
+
+    def __init__(self, path, logger=None, clock=time.monotonic):
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+        self.file = None
+        self.scheduler = None
+        self.start_time = None
+        self.last_frames = {}  # universe -> last recorded frame
+        self.lock = threading.Lock()
+        self.records = 0
+        self.bytes_written = 0
+
+        self.chunk = bytearray()
+        self.chunk_records = 0
+        self.chunk_first = 0.0
+        self.chunk_last = 0.0
+
+    @property
+    def recording(self):
+        return self.file is not None
+
+    def start(self):
+        """Open the file and start accepting frames"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.file = open(self.path, 'wb')
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, time.time()))
+        self.bytes_written = FILE_HEADER.size
+        self.start_time = self.clock()
+        self.logger.info(f"Recording started: {self.path}")
+
+    def stop(self):
+        """Flush the last chunk, ending at the stop time, and close the file"""
+        with self.lock:
+            if self.file is None:
+                return
+            # The last chunk's end time is the recording's duration, so a look that held
+            # until the stop is played for as long as it was recorded
+            t = self.clock() - self.start_time
+            self._begin_chunk(t)
+            self.chunk_last = max(self.chunk_last, t)
+            self._flush_chunk()
+            self.file.close()
+            self.file = None
+        self.logger.info(f"Recording stopped: {self.records} records, {self.bytes_written} bytes")
+
+    def attach(self, scheduler):
+        """Record every frame the scheduler sends"""
+        self.scheduler = scheduler
+        scheduler.add_listener(self.on_frame)
+
+    def detach(self):
+        if self.scheduler is not None:
+            self.scheduler.remove_listener(self.on_frame)
+            self.scheduler = None
+
+    def on_frame(self, now, frames):
+        """Record the frame the scheduler just sent (scheduler listener)"""
+        # Universes are recorded before the output stage, so playback goes
+        # through the live curves and masters instead of applying them twice
+        self.record(now, self.scheduler.source_frames)
+
+    def record(self, now, frames):
+        """Record one frame per universe"""
+        with self.lock:
+            if self.file is None:
+                return
+            t = now - self.start_time
+
+            if self.chunk_records and ((t - self.chunk_first) * 1e6 >= MAX_OFFSET_US or
+                                       len(self.chunk) >= CHUNK_BYTES or
+                                       t - self.chunk_first >= CHUNK_SECONDS):
+                self._flush_chunk()
+
+            for universe, frame in frames.items():
+                last = self.last_frames.get(universe)
+                if last is None:
+                    self._begin_chunk(t)
+                    self._append(t, universe, KIND_KEYFRAME, encode_runs([(0, bytes(frame))]))
+                elif frame != last:
+                    self._begin_chunk(t)
+                    self._append(t, universe, KIND_DELTA, encode_runs(diff_runs(last, frame)))
+                else:
+                    continue
+                self.last_frames[universe] = bytes(frame)
+
+    def _begin_chunk(self, t):
+        """Start a chunk with keyframes of every known universe"""
+        if self.chunk_records:
+            return
+        self.chunk_first = t
+        for universe, frame in self.last_frames.items():
+            self._append(t, universe, KIND_KEYFRAME, encode_runs([(0, frame)]))
+
+    def _append(self, t, universe, kind, payload):
+        offset = round((t - self.chunk_first) * 1e6)
+        self.chunk += RECORD_HEADER.pack(offset, universe, kind)
+        self.chunk += payload
+        self.chunk_records += 1
+        self.chunk_last = t
+        self.records += 1
+
+    def _flush_chunk(self):
+        if not self.chunk_records:
+            return
+        header = CHUNK_HEADER.pack(CHUNK_MAGIC, len(self.chunk), self.chunk_records,
+                                   self.chunk_first, self.chunk_last)
+        self.file.write(header)
+        self.file.write(self.chunk)
+        self.file.flush()
+        self.bytes_written += len(header) + len(self.chunk)
+        self.chunk = bytearray()
+        self.chunk_records = 0
+
+
+class ShowReader:
+    """Memory-mapped reader for recorded shows"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            if os.fstat(self.file.fileno()).st_size < FILE_HEADER.size:
+                raise ValueError(f"Not a DMX recording: {path}")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+
+        magic, version, self.created = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != FILE_MAGIC:
+            self.close()
+            raise ValueError(f"Not a DMX recording: {path}")
+        if version != FILE_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported recording version {version}")
+
+        self.chunks = []  # (first ts, last ts, payload offset, payload size)
+        self._index_chunks()
+        self.chunk_starts = [chunk[0] for chunk in self.chunks]
+
+    def _index_chunks(self):
+        offset = FILE_HEADER.size
+        size = len(self.map)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, length, _, first, last = CHUNK_HEADER.unpack_from(self.map, offset)
+            payload = offset + CHUNK_HEADER.size
+            if magic != CHUNK_MAGIC or payload + length > size:
+                break  # Truncated tail from an interrupted recording
+            self.chunks.append((first, last, payload, length))
+            offset = payload + length
+
+    @property
+    def duration(self):
+        return self.chunks[-1][1] if self.chunks else 0.0
+
+    def chunk_at(self, position):
+        """Index of the chunk that covers a show position"""
+        return max(0, bisect.bisect_right(self.chunk_starts, position) - 1)
+
+    def records(self, index):
+        """Yield (time, universe, kind, payload) for one chunk"""
+        first, _, offset, length = self.chunks[index]
+        end = offset + length
+        while offset < end:
+            dt, universe, kind = RECORD_HEADER.unpack_from(self.map, offset)
+            offset += RECORD_HEADER.size
+            size = runs_size(self.map, offset)
+            yield first + dt / 1e6, universe, kind, self.map[offset:offset + size]
+            offset += size
+
+    def close(self):
+        try:
+            self.map.close()
+        except Exception:
+            pass
+        self.file.close()
+
+
+class ShowPlayer:
+    """Plays a recording back through the output scheduler"""
+
+    def __init__(self, reader, scheduler, speed=1.0, loop=False, logger=None):
+        self.reader = reader
+        self.scheduler = scheduler
+        self.speed = speed
+        self.loop = loop
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.playing = False
+        self.position = 0.0
+        self.frames = {}  # universe -> reconstructed frame
+        self._anchor = None  # (clock time, position) playback is measured from
+        self._chunk = 0
+        self._records = iter(())
+        self._pending = None
+        self._warned = set()
+        self._rewind(0.0)
+
+    def play(self):
+        """Start or resume playback"""
+        with self.lock:
+            self.playing = True
+            self._anchor = None
+            # Universes that do not change later would otherwise keep whatever was on before
+            self._output(self.frames)
+        if self.on_frame not in self.scheduler.sources:
+            self.scheduler.add_source(self.on_frame)
+        self.logger.info(f"Playback started at {self.position:.2f}s ({self.speed}x)")
+
+    def pause(self):
+        """Pause playback, keeping the current look"""
+        with self.lock:
+            self.playing = False
+            self._anchor = None
+
+    def stop(self):
+        """Stop playback and detach from the scheduler"""
+        self.pause()
+        self.scheduler.remove_source(self.on_frame)
+        self.logger.info("Playback stopped")
+
+    def set_speed(self, speed):
+        """Change playback speed without jumping"""
+        with self.lock:
+            self.speed = speed
+            self._anchor = None
+
+    def seek(self, position):
+        """Jump to a show position in seconds"""
+        with self.lock:
+            self._rewind(position)
+            self._output(self.frames)
+
+    def on_frame(self, now):
+        """Apply everything recorded up to the current show time (scheduler source)"""
+        with self.lock:
+            if not self.playing:
+                return
+            if self._anchor is None:
+                self._anchor = (now, self.position)
+            position = self._anchor[1] + (now - self._anchor[0]) * self.speed
+            changed, finished = self._advance(position)
+            self.position = min(position, self.reader.duration)
+            self._output(changed)
+
+            if finished and position >= self.reader.duration:
+                if self.loop:
+                    self._rewind(0.0)
+                    self._output(self.frames)
+                else:
+                    self.playing = False
+                    self.logger.info("Playback finished")
+
+    def _rewind(self, position):
+        """Rebuild the frames at position from the start of its chunk"""
+        position = max(0.0, min(position, self.reader.duration))
+        self._chunk = self.reader.chunk_at(position)
+        self._records = self.reader.records(self._chunk) if self.reader.chunks else iter(())
+        self._pending = None
+        self.frames = {}
+        self._advance(position)
+        self.position = position
+        self._anchor = None
+
+    def _advance(self, position):
+        """Apply pending records up to position, returns (changed universes, finished)"""
+        changed = set()
+        while True:
+            if self._pending is None:
+                self._pending = next(self._records, None)
+                if self._pending is None:
+                    if self._chunk + 1 >= len(self.reader.chunks):
+                        return changed, True
+                    self._chunk += 1
+                    self._records = self.reader.records(self._chunk)
+                    continue
+
+            t, universe, kind, payload = self._pending
+            if t > position:
+                return changed, False
+
+            frame = self.frames.get(universe)
+            if frame is None or kind == KIND_KEYFRAME:
+                frame = self.frames[universe] = bytearray(UNIVERSE_SIZE)
+            apply_runs(frame, payload)
+            changed.add(universe)
+            self._pending = None
+
+    def _output(self, universes):
+        for universe in universes:
+            controller = self.scheduler.controllers.get(universe)
+            if controller is None:
+                if universe not in self._warned:
+                    self._warned.add(universe)
+                    self.logger.warning(f"Recording contains universe {universe} with no output, skipping")
+                continue
+            controller.apply_frame(self.frames[universe])
@@ -0,0 +1,260 @@
+"""
+DMX Offline Render
+Runs the frame pipeline (timecode triggers, cues, scripts, output stage) against a virtual clock
+as fast as the CPU allows and exports the frames as a recording or as CSV channel changes
+"""
+import argparse
+import bisect
+import csv
+import math
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from dmx_controller import DMXController, OutputScheduler, FRAME_RATE
+from dmx_cues import CueList
+from dmx_output import OutputTransforms
+from dmx_patch import Patch
+from dmx_pixelmap import PixelMapSource
+from dmx_recorder import ShowRecorder, RECORDING_EXTENSION
+from dmx_script import ScriptEngine
+from dmx_timecode import CueTriggers, parse_timecode
+
+TAIL_SECONDS = 1.0          # Rendered after the last cue's fade when no duration is given
+PROGRESS_SECONDS = 600.0    # Show time between progress lines
+STAGE_SOURCE = 'source'     # Universes as written by the sources, what recordings hold
+STAGE_OUTPUT = 'output'     # After curves, limits and masters, what goes on the wire
+
+
+class VirtualClock:
+    """Clock for the scheduler and everything timed by it, moved on by the renderer only
+
+    Also stands in for the show clock of the timecode triggers: show time is the virtual time,
+    as if a perfect timecode were being chased.
+    """
+
+    running = True
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def time(self, now=None):
+        return self.now if now is None else now
+
+
+class RecordingExport:
+    """Frames as a show recording, playable in the GUI or on a playback node"""
+
+    def __init__(self, path, clock):
+        self.recorder = ShowRecorder(path, clock=clock)
+
+    def open(self):
+        self.recorder.start()
+
+    def write(self, now, number, frames):
+        self.recorder.record(now, frames)
+
+    def close(self):
+        self.recorder.stop()
+
+    def summary(self):
+        return f"{self.recorder.records} records, {self.recorder.bytes_written} bytes"
+
+
+class CSVExport:
+    """Channel changes as rows of time, frame, universe, channel (1-512) and value; diff-friendly"""
+
+    def __init__(self, path, start=0.0):
+        self.path = path
+        self.start = start
+        self.file = None
+        self.writer = None
+        self.last = {}  # universe -> last frame written
+        self.rows = 0
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file = open(self.path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['time', 'frame', 'universe', 'channel', 'value'])
+
+    def write(self, now, number, frames):
+        t = f"{now - self.start:.3f}"
+        for universe, frame in sorted(frames.items()):
+            last = self.last.get(universe)
+            if last == frame:
+                continue
+            values = np.frombuffer(frame, dtype=np.uint8)
+            if last is None:
+                changed = np.flatnonzero(values)
+            else:
+                changed = np.flatnonzero(values != np.frombuffer(last, dtype=np.uint8))
+            self.writer.writerows([t, number, universe, channel + 1, value]
+                                  for channel, value in zip(changed.tolist(), values[changed].tolist()))
+            self.rows += len(changed)
+            self.last[universe] = bytes(frame)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def summary(self):
+        return f"{self.rows} channel changes"
+
+
+class OfflineRenderer:
+    """The live pipeline without a device or a GUI, one scheduler frame per virtual frame interval
+
+    Show time starts at start (seconds, as on the timecode). Scripts are timed on the virtual
+    clock too, so CPU budgets never skip or suspend them and every render of a show is identical.
+    """
+
+    def __init__(self, config, fps=FRAME_RATE, start=0.0, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.config = config
+        self.fps = fps
+        self.start = start
+        self.clock = VirtualClock(start)
+        self.patch = Patch.from_config(config)
+
+        universes = sorted(set(self.patch.universes()) | {1})
+        controllers = {universe: DMXController(logger=self.logger) for universe in universes}
+        # Pixels can wrap into universes nothing else is patched in
+        self.pixel_source = PixelMapSource.from_config(config, controllers, logger=self.logger)
+        if self.pixel_source is not None:
+            for universe in self.pixel_source.pixel_map.universes:
+                controllers.setdefault(universe, DMXController(logger=self.logger))
+        controllers[1].transforms = OutputTransforms.from_config(config, logger=self.logger)
+        for universe, controller in controllers.items():
+            controller.masters.configure(self.patch, universe)
+        self.controllers = controllers
+        self.scheduler = OutputScheduler(controllers, rate=fps, logger=self.logger, clock=self.clock)
+
+        # Same order as the GUI: triggers, cues, the pixel map, then scripts layered on top
+        self.cue_list = CueList.from_config(controllers[1], config, logger=self.logger)
+        self.cue_list.timebase = self.clock.time
+        self.cue_triggers = CueTriggers.from_config(self.clock, self.cue_list, config, logger=self.logger)
+        self.scripts = ScriptEngine.from_config(config, controllers, self.patch, clock=self.clock,
+                                                timer=self.clock, logger=self.logger)
+        self.scheduler.add_source(self.cue_triggers.on_frame)
+        self.scheduler.add_source(self.cue_list.on_frame)
+        if self.pixel_source is not None:
+            self.scheduler.add_source(self.pixel_source.on_frame)
+        self.scheduler.add_source(self.scripts.on_frame)
+        self.scheduler.add_listener(self.on_frame)
+        self.frames = {}
+
+    def add_go(self, position):
+        """Fire the next cue at a show time, like pressing GO"""
+        self.cue_triggers.add(position, lambda at: self.cue_list.go(at))
+
+    def end_time(self):
+        """Show time the render runs to by default: the last trigger's fade plus a short tail"""
+        end = self.start
+        if self.cue_triggers.times:
+            longest = max((cue.fade for cue in self.cue_list.cues), default=0.0)
+            end = max(end, self.cue_triggers.times[-1] + longest)
+        return end + TAIL_SECONDS
+
+    def on_frame(self, now, frames):
+        self.frames = frames
+
+    def next_change(self, number):
+        """First frame after number that can differ from it; frames in between repeat it"""
+        if self.scripts.scripts or self.cue_list.fading or self.pixel_source is not None:
+            return number + 1
+        times = self.cue_triggers.times
+        index = bisect.bisect_right(times, self.start + number / self.fps)
+        if index == len(times):
+            return None
+        return max(number + 1, math.ceil(round((times[index] - self.start) * self.fps, 6)))
+
+    def render(self, end, exports=(), stage=STAGE_OUTPUT, progress=None):
+        """Render from the start to show time end into the exports, returns the number of frames
+
+        Frames that would repeat the previous one are not run: the exports only store changes,
+        so jumping to the next trigger gives the same files in a fraction of the time.
+        """
+        count = int(round((end - self.start) * self.fps)) + 1
+        reported = self.start
+        self.rendered = 0
+        for export in exports:
+            export.open()
+        try:
+            number = 0
+            while number is not None and number < count:
+                now = self.start + number / self.fps
+                self.clock.now = now
+                self.scheduler.run_frame(now)
+                self.rendered += 1
+                frames = self.frames if stage == STAGE_OUTPUT else self.scheduler.source_frames
+                for export in exports:
+                    export.write(now, number, frames)
+                if progress is not None and now - reported >= PROGRESS_SECONDS:
+                    reported = now
+                    progress(now)
+                number = self.next_change(number)
+            # Frames skipped at the end still count: a recording's duration runs to its stop time
+            self.clock.now = self.start + (count - 1) / self.fps
+        finally:
+            for export in exports:
+                export.close()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the show in config.json offline, faster than real time")
+    parser.add_argument('output', help=f"Export file: {RECORDING_EXTENSION} for a recording, .csv for channel changes")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--start', default='0', help="Show time to start at, seconds or HH:MM:SS:FF")
+    parser.add_argument('--duration', help="Seconds or HH:MM:SS:FF to render (default: to the last cue's fade)")
+    parser.add_argument('--go', action='append', default=[], metavar='TIME',
+                        help="Fire the next cue at this show time; repeat for several cues")
+    parser.add_argument('--fps', type=float, default=FRAME_RATE, help="Frames per second of show time")
+    parser.add_argument('--stage', choices=(STAGE_SOURCE, STAGE_OUTPUT),
+                        help="Export the universes before or after the output stage "
+                             "(default: source for recordings, which playback runs through the output stage "
+                             "again, output for CSV)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    def show_time(text):
+        return parse_timecode(text) if ':' in text else float(text)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    renderer = OfflineRenderer(config, fps=args.fps, start=show_time(args.start))
+    for position in args.go:
+        renderer.add_go(show_time(position))
+    end = renderer.start + show_time(args.duration) if args.duration else renderer.end_time()
+
+    if args.output.endswith('.csv'):
+        export = CSVExport(args.output, renderer.start)
+        stage = args.stage or STAGE_OUTPUT
+    else:
+        export = RecordingExport(args.output, renderer.clock)
+        stage = args.stage or STAGE_SOURCE
+
+    began = time.perf_counter()
+    frames = renderer.render(end, [export], stage,
+                             progress=lambda now: print(f"  {now - renderer.start:.0f} s rendered", flush=True))
+    elapsed = time.perf_counter() - began
+    show_seconds = end - renderer.start
+    print(f"{frames} frames ({show_seconds:.1f} s of show, {renderer.rendered} run) in {elapsed:.2f} s, "
+          f"{show_seconds / max(elapsed, 1e-9):.0f}x real time; {export.summary()} ({stage}) -> {args.output}")
+    for script in renderer.scripts.scripts:
+        if script.errors:
+            print(f"  {script.name}: {script.errors} errors, last: {script.last_error}")
+
+
+if __name__ == "__main__":
+    main()
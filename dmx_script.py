@@ -0,0 +1,356 @@
+"""
+DMX Scripts
+User expressions and Python snippets attached to channels, fixtures and groups, compiled once and
+run every frame by the output scheduler within CPU time budgets
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+
+SCRIPT_BUDGET = 0.001      # Default seconds per script per frame
+FRAME_RESERVE = 0.004      # Slack left before the frame deadline for rendering and sending
+HARD_LIMIT = 5.0           # A Python loop running this many times over budget is stopped mid-run
+PROBE_AFTER = 20           # Frames a script is skipped in a row before it runs anyway to re-measure its cost
+OVERRUN_LIMIT = 10         # Overruns in a row before a script is suspended...
+SUSPEND_SECONDS = 2.0      # ...for this long, doubling on every further suspension
+MAX_SUSPEND = 60.0
+COST_SMOOTHING = 0.1       # Weight of the latest run in the running cost estimate
+REPORT_EVERY = 100         # Log one in this many overruns and errors per script
+
+SCRIPT_FILENAME = '<script:'  # Prefix of the compiled code's filename; the trace guard only watches these
+
+# What scripts see besides the builtins and their inputs: NumPy ufuncs work on fixture
+# arrays and plain numbers alike. Scripts come from the operator's own config.json and
+# are not sandboxed; NumPy needs the full builtins for its lazy imports anyway.
+SCRIPT_MATH = {
+    'np': np, 'pi': math.pi, 'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'exp': np.exp, 'log': np.log,
+    'sqrt': np.sqrt, 'floor': np.floor, 'ceil': np.ceil, 'clip': np.clip, 'where': np.where,
+    'minimum': np.minimum, 'maximum': np.maximum, 'fmod': np.fmod,
+}
+
+
+class ScriptTimeout(Exception):
+    """Raised inside a script that ran past its hard limit"""
+
+
+def _targets(data, patch):
+    """[(universe, channel)] a script writes, in fixture order"""
+    if 'channel' in data:
+        channels = data['channel'] if isinstance(data['channel'], list) else [data['channel']]
+        return [(int(data.get('universe', 1)), int(channel)) for channel in channels]
+    if patch is None:
+        raise ValueError("Fixture and group targets need a patch")
+    if 'fixture' in data:
+        fixtures = [patch.fixture(data['fixture'])]
+    elif 'group' in data:
+        fixtures = patch.group_fixtures(data['group'])
+    else:
+        raise ValueError("Script needs a 'channel', 'fixture' or 'group' target")
+    attribute = data.get('attribute', 'dimmer')
+    targets = [(f.universe, f.channel(attribute)) for f in fixtures if attribute in f.attributes]
+    if not targets:
+        raise ValueError(f"No fixture in the target has a '{attribute}' attribute")
+    return targets
+
+
+class Script:
+    """One compiled expression ('expr') or snippet ('code', sets value) and its run statistics"""
+
+    def __init__(self, name, source, targets, mode='eval', budget=SCRIPT_BUDGET, enabled=True):
+        if not 1 <= len(targets) <= 512 or any(not 1 <= channel <= 512 for _, channel in targets):
+            raise ValueError(f"Script '{name}' targets channels outside 1-512")
+        self.name = name
+        self.source = source
+        self.mode = mode
+        self.code = compile(source, f"{SCRIPT_FILENAME}{name}>", mode)
+        self.budget = budget
+        self.enabled = enabled
+        # Universes and channel arrays, and the fixture index every value lines up with
+        self.count = len(targets)
+        self.universes = {}
+        for index, (universe, channel) in enumerate(targets):
+            self.universes.setdefault(universe, ([], []))
+            self.universes[universe][0].append(index)
+            self.universes[universe][1].append(channel)
+        self.index = np.arange(self.count, dtype=np.float64)
+        self.state = {}  # Kept between frames, for scripts that count or latch
+        self.namespace = None  # Globals the code runs in, made from the engine's on the first run
+
+        self.runs = 0
+        self.cost = 0.0          # Running estimate of the seconds one run takes
+        self.worst = 0.0
+        self.overruns = 0
+        self.overrun_streak = 0
+        self.errors = 0
+        self.skipped = 0
+        self.skip_streak = 0
+        self.suspensions = 0
+        self.suspended_until = None
+        self.last_error = None
+
+    @classmethod
+    def from_dict(cls, data, patch=None):
+        name = data['name']
+        if 'expr' in data:
+            source, mode = data['expr'], 'eval'
+        elif 'code' in data:
+            code = data['code']
+            source, mode = ('\n'.join(code) if isinstance(code, list) else code), 'exec'
+        else:
+            raise ValueError(f"Script '{name}' needs 'expr' or 'code'")
+        return cls(name, source, _targets(data, patch), mode, data.get('budget_ms', SCRIPT_BUDGET * 1000) / 1000.0,
+                   data.get('enabled', True))
+
+    def values(self, result):
+        """Script result as one DMX value per target, None to leave the channels alone"""
+        if result is None:
+            return None
+        values = np.asarray(result, dtype=np.float64)
+        if values.ndim == 0:
+            values = np.full(self.count, float(values))
+        elif values.shape != (self.count,):
+            raise ValueError(f"returned {values.shape[0]} values for {self.count} channels")
+        if not np.isfinite(values).all():
+            values = np.nan_to_num(values)
+        return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+    def describe(self):
+        state = "suspended" if self.suspended_until is not None else "off" if not self.enabled else "on"
+        return (f"{self.name}: {state}, {self.cost * 1e6:.0f} us/frame (worst {self.worst * 1e6:.0f}), "
+                f"{self.overruns} overruns, {self.errors} errors, {self.skipped} skipped")
+
+
+class ScriptEngine:
+    """Runs the scripts once per frame (scheduler source) and writes their values in one batch per universe"""
+
+    def __init__(self, controllers, scripts=None, scheduler=None, gamepads=None, audio=None,
+                 clock=time.monotonic, timer=time.perf_counter, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.scripts = list(scripts or [])
+        self.scheduler = scheduler  # For the frame deadline; without one only the per-script budgets apply
+        self.gamepads = gamepads
+        self.audio = audio
+        self.clock = clock
+        self.timer = timer
+        self.logger = logger or logging.getLogger(__name__)
+        self.inputs = {}  # Named values from OSC /input/<name> or other code
+        self.start_time = clock()
+        self.last_now = None
+        self.frame = 0
+        self.frame_cost = 0.0
+        self.audio_values = {}
+        self.deadline = None  # Hard limit of the script running now, checked by the trace guard
+        self.globals = dict(SCRIPT_MATH, inp=self.input, button=self.button,
+                            axis=self.axis, audio=self.audio_level, ch=self.channel_value)
+
+    @classmethod
+    def from_config(cls, config, controllers, patch=None, **kwargs):
+        """Engine with the 'scripts' list; scripts that do not compile are skipped and logged"""
+        engine = cls(controllers, **kwargs)
+        engine.load(config.get('scripts', []), patch)
+        return engine
+
+    def load(self, entries, patch=None):
+        """Compile a list of script dicts (replacing the running ones), returns the number that compiled"""
+        scripts = []
+        for data in entries:
+            try:
+                scripts.append(Script.from_dict(data, patch))
+            except (KeyError, ValueError, SyntaxError) as e:
+                self.logger.warning(f"Skipping script '{data.get('name')}': {e}")
+        self.scripts = scripts
+        return len(scripts)
+
+    # Functions scripts call
+    def input(self, name, default=0.0):
+        return self.inputs.get(name, default)
+
+    def button(self, number, pad=0):
+        return self.gamepads.control('button', number, pad) if self.gamepads is not None else 0
+
+    def axis(self, number, pad=0):
+        return self.gamepads.control('axis', number, pad) if self.gamepads is not None else 0.0
+
+    def audio_level(self, name):
+        return self.audio_values.get(name, 0.0)
+
+    def channel_value(self, channel, universe=1):
+        controller = self.controllers.get(universe)
+        return controller.dmx_data[channel - 1] if controller is not None else 0
+
+    def on_frame(self, now):
+        """Run the due scripts and write their values, one set_channels per universe"""
+        scripts = self.scripts  # load() replaces the list whole, from the GUI thread
+        if not scripts:
+            return
+        frame_start = self.timer()
+        t = now - self.start_time
+        dt = 0.0 if self.last_now is None else now - self.last_now
+        self.last_now = now
+        self.frame += 1
+        if self.audio is not None:
+            result = self.audio.values(now)
+            self.audio_values = result[0] if result is not None else {}
+        # Scripts get the time that is left before the next frame is due, minus what output needs
+        frame_deadline = None
+        if self.scheduler is not None and self.scheduler.next_deadline is not None:
+            frame_deadline = frame_start + (self.scheduler.next_deadline - self.scheduler.clock()) - FRAME_RESERVE
+
+        writes = {}
+        for script in scripts:
+            if not script.enabled:
+                continue
+            if script.suspended_until is not None:
+                if now < script.suspended_until:
+                    continue
+                script.suspended_until = None
+                self.logger.info(f"Script '{script.name}' resumed")
+            start = self.timer()
+            if frame_deadline is not None and start + script.cost > frame_deadline:
+                script.skipped += 1  # Would make the frame late; try again next frame
+                script.skip_streak += 1
+                if script.skip_streak < PROBE_AFTER:
+                    continue
+                # The estimate may be one slow run (an import, a GC pause): count the stretch as an
+                # overrun and run once more under the hard limit to measure the cost again
+                self._overrun(script, f"Script '{script.name}' skipped for {script.skip_streak} frames "
+                                      f"(cost {script.cost * 1000:.2f} ms)", now)
+                if script.suspended_until is not None:
+                    continue
+            probe = script.skip_streak >= PROBE_AFTER
+            script.skip_streak = 0
+            limit = start + script.budget * HARD_LIMIT
+            if frame_deadline is not None:
+                limit = min(limit, max(frame_deadline, start + script.budget))
+            values = self._run(script, t, dt, start, limit)
+            elapsed = self.timer() - start
+            # A probe that still does not fit before the deadline keeps the overrun streak going
+            fits = frame_deadline is None or start + elapsed <= frame_deadline
+            self._account(script, elapsed, now, probe, fits)
+            if values is not None:
+                for universe, (indexes, channels) in script.universes.items():
+                    target = writes.setdefault(universe, {})
+                    target.update(zip(channels, values[indexes].tolist()))
+
+        for universe, values in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None:
+                controller.set_channels(values)
+        self.frame_cost = self.timer() - frame_start
+
+    def _run(self, script, t, dt, start, limit):
+        namespace = script.namespace
+        if namespace is None:
+            namespace = script.namespace = dict(self.globals, i=script.index, n=script.count, state=script.state)
+        namespace.update(t=t, dt=dt, frame=self.frame)
+        self.deadline = limit
+        previous = sys.gettrace()
+        sys.settrace(self._trace_call)
+        try:
+            if script.mode == 'eval':
+                result = eval(script.code, namespace)
+            else:
+                namespace['value'] = None
+                exec(script.code, namespace)
+                result = namespace['value']
+            return script.values(result)
+        except ScriptTimeout:
+            script.errors += 1
+            script.last_error = "stopped at its hard time limit"
+            self._report(script, f"Script '{script.name}' stopped after {(self.timer() - start) * 1000:.1f} ms")
+        except Exception as e:
+            script.errors += 1
+            script.last_error = f"{type(e).__name__}: {e}"
+            self._report(script, f"Script '{script.name}' failed: {script.last_error}")
+        finally:
+            sys.settrace(previous)
+        return None
+
+    def _trace_call(self, frame, event, arg):
+        # Only the scripts' own frames are traced, line by line, so library code runs at full speed
+        if frame.f_code.co_filename.startswith(SCRIPT_FILENAME):
+            return self._trace_line
+        return None
+
+    def _trace_line(self, frame, event, arg):
+        if self.timer() > self.deadline:
+            raise ScriptTimeout()
+        return self._trace_line
+
+    def _account(self, script, elapsed, now, probe=False, fits=True):
+        script.runs += 1
+        if script.runs == 1 or probe:
+            script.cost = elapsed  # A probe run replaces the estimate that kept the script skipped
+        else:
+            script.cost += COST_SMOOTHING * (elapsed - script.cost)
+        script.worst = max(script.worst, elapsed)
+        if elapsed <= script.budget:
+            if fits or not probe:
+                script.overrun_streak = 0
+            return
+        self._overrun(script, f"Script '{script.name}' over budget: {elapsed * 1000:.2f} ms "
+                              f"of {script.budget * 1000:.2f} ms", now)
+
+    def _overrun(self, script, message, now):
+        """Count an overrun, suspending the script after OVERRUN_LIMIT in a row"""
+        script.overruns += 1
+        script.overrun_streak += 1
+        self._report(script, f"{message} ({script.overruns} overruns)", script.overruns)
+        if script.overrun_streak >= OVERRUN_LIMIT:
+            pause = min(MAX_SUSPEND, SUSPEND_SECONDS * 2 ** script.suspensions)
+            script.suspensions += 1
+            script.overrun_streak = 0
+            script.suspended_until = now + pause
+            self.logger.warning(f"Script '{script.name}' suspended for {pause:.0f} s after "
+                                f"{OVERRUN_LIMIT} overruns in a row")
+
+    def _report(self, script, message, count=None):
+        count = script.errors if count is None else count
+        if count % REPORT_EVERY == 1:
+            self.logger.warning(message)
+
+    def status(self):
+        if not self.scripts:
+            return "No scripts"
+        suspended = [s.name for s in self.scripts if s.suspended_until is not None]
+        text = (f"{len(self.scripts)} scripts, {self.frame_cost * 1000:.2f} ms/frame, "
+                f"{sum(s.overruns for s in self.scripts)} overruns, {sum(s.errors for s in self.scripts)} errors")
+        if suspended:
+            text += f", suspended: {', '.join(suspended)}"
+        return text
+
+
+def main():
+    from dmx_controller import DMXController
+    from dmx_patch import Patch
+
+    parser = argparse.ArgumentParser(description="Run the scripts from config.json without output and "
+                                                 "report what they cost")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--frames', type=int, default=400, help="Frames to run (40 per second of show time)")
+    parser.add_argument('--show', type=int, default=16, help="Channels of universe 1 to print at the end")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    patch = Patch.from_config(config)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    controllers = {universe: DMXController() for universe in set(patch.universes()) | {1}}
+    now = [0.0]
+    engine = ScriptEngine.from_config(config, controllers, patch, clock=lambda: now[0])
+    for frame in range(args.frames):
+        now[0] = frame / 40.0
+        engine.on_frame(now[0])
+    for script in engine.scripts:
+        print(script.describe())
+    print(engine.status())
+    print(' '.join(f"{value:3d}" for value in controllers[1].dmx_data[:args.show]))
+
+
+if __name__ == "__main__":
+    main()
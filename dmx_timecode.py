@@ -0,0 +1,370 @@
+"""
+DMX Show Clock
+Follows external timecode (MIDI timecode or UDP) and fires cues against it
+"""
+import argparse
+import bisect
+import logging
+import re
+import socket
+import threading
+import time
+
+try:
+    import mido
+except ImportError:
+    mido = None
+
+# Clock states
+STATE_STOPPED = 'stopped'      # No timecode, show time is held
+STATE_LOCKING = 'locking'      # Receiving timecode, not yet stable
+STATE_LOCKED = 'locked'        # Following timecode
+STATE_FREEWHEEL = 'freewheel'  # Timecode dropped out, extrapolating
+
+# MTC frame rate codes (bits 5-6 of the hours byte)
+MTC_RATES = {0: 24.0, 1: 25.0, 2: 29.97, 3: 30.0}
+
+DEFAULT_TIMECODE_PORT = 6677
+TIMECODE_PATTERN = re.compile(r'^(\d{1,2}):(\d{2}):(\d{2})([:;.])(\d{2})(?:/([\d.]+))?$')
+
+
+def timecode_to_seconds(hours, minutes, seconds, frames, fps):
+    """Convert a timecode to seconds, handling 29.97 drop-frame"""
+    if abs(fps - 29.97) < 0.01:
+        total_minutes = hours * 60 + minutes
+        dropped = 2 * (total_minutes - total_minutes // 10)
+        frame_number = (hours * 3600 + minutes * 60 + seconds) * 30 + frames - dropped
+        return frame_number / (30000.0 / 1001.0)
+    return hours * 3600 + minutes * 60 + seconds + frames / fps
+
+
+def seconds_to_timecode(position, fps=25.0):
+    """Format seconds as HH:MM:SS:FF (non-drop)"""
+    nominal = int(round(fps))
+    total_frames = int(max(0.0, position) * fps + 1e-6)
+    frames = total_frames % nominal
+    total_seconds = total_frames // nominal
+    return f"{total_seconds // 3600:02d}:{total_seconds // 60 % 60:02d}:{total_seconds % 60:02d}:{frames:02d}"
+
+
+def parse_timecode(text, fps=25.0):
+    """Parse 'HH:MM:SS:FF[/fps]' (';' marks drop-frame) to seconds"""
+    match = TIMECODE_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Invalid timecode: {text!r}")
+    hours, minutes, seconds, separator, frames, rate = match.groups()
+    if rate:
+        fps = float(rate)
+    elif separator == ';':
+        fps = 29.97
+    return timecode_to_seconds(int(hours), int(minutes), int(seconds), int(frames), fps)
+
+
+class ShowClock:
+    """Show time locked to an external timecode, with jitter filtering"""
+
+    def __init__(self, window=16, lock_samples=4, jump_threshold=0.25, dropout=0.25,
+                 freewheel=2.0, logger=None, clock=time.monotonic):
+        self.window = window                  # Samples used for the jitter filter
+        self.lock_samples = lock_samples      # Consistent samples needed to lock
+        self.jump_threshold = jump_threshold  # Errors above this are a relocate, not jitter
+        self.dropout = dropout                # Silence before freewheeling
+        self.freewheel = freewheel            # How long to freewheel before stopping
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.state = STATE_STOPPED
+        self.fps = 25.0
+        self.samples = []        # (local time, timecode position)
+        self.anchor = (0.0, 0.0)  # (local time, position) of the fitted line
+        self.rate = 1.0
+        self.good_samples = 0
+        self.last_received = None
+        self.held_position = 0.0
+        self.last_output = 0.0
+        self.jumps = 0
+
+    def on_timecode(self, position, received_at=None, fps=None):
+        """Feed a decoded timecode position (seconds)"""
+        local = self.clock() if received_at is None else received_at
+        with self.lock:
+            if fps:
+                self.fps = fps
+            if self.samples and self.state != STATE_STOPPED:
+                error = position - self._extrapolate(local)
+                if abs(error) > self.jump_threshold:
+                    self.jumps += 1
+                    self.logger.info(f"Timecode jump of {error:+.3f}s, relocking")
+                    self.samples = []
+                    self.good_samples = 0
+                    self.last_output = position
+                    self._set_state(STATE_LOCKING)
+
+            self.samples.append((local, position))
+            del self.samples[:-self.window]
+            self._fit()
+            self.last_received = local
+
+            self.good_samples += 1
+            if self.state in (STATE_STOPPED, STATE_FREEWHEEL):
+                self._set_state(STATE_LOCKING if self.good_samples < self.lock_samples else STATE_LOCKED)
+            elif self.state == STATE_LOCKING and self.good_samples >= self.lock_samples:
+                self._set_state(STATE_LOCKED)
+
+    def time(self, now=None):
+        """Show time in seconds at local time now"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            if self.state == STATE_STOPPED:
+                return self.held_position
+
+            silence = now - self.last_received
+            if silence > self.dropout + self.freewheel:
+                self.held_position = self._extrapolate(self.last_received + self.dropout + self.freewheel)
+                self.samples = []
+                self.good_samples = 0
+                self._set_state(STATE_STOPPED)
+                return self.held_position
+            if silence > self.dropout and self.state != STATE_FREEWHEEL:
+                self._set_state(STATE_FREEWHEEL)
+
+            # Never step backwards on filter corrections, only on real jumps
+            position = self._extrapolate(now)
+            if self.last_output - self.jump_threshold < position < self.last_output:
+                position = self.last_output
+            self.last_output = position
+            return position
+
+    @property
+    def running(self):
+        return self.state != STATE_STOPPED
+
+    def timecode(self, now=None):
+        """Current show time as HH:MM:SS:FF"""
+        return seconds_to_timecode(self.time(now), self.fps)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.logger.info(f"Timecode {self.state} -> {state}")
+            self.state = state
+
+    def _extrapolate(self, local):
+        anchor_local, anchor_position = self.anchor
+        return anchor_position + (local - anchor_local) * self.rate
+
+    def _fit(self):
+        # Least-squares line through the recent samples: arrival jitter
+        # averages out and the slope tracks the source's clock rate
+        count = len(self.samples)
+        mean_local = sum(s[0] for s in self.samples) / count
+        mean_position = sum(s[1] for s in self.samples) / count
+        rate = 1.0
+        if count >= 3:
+            var = sum((s[0] - mean_local) ** 2 for s in self.samples)
+            if var > 0:
+                cov = sum((s[0] - mean_local) * (s[1] - mean_position) for s in self.samples)
+                rate = max(0.9, min(1.1, cov / var))
+        self.rate = rate
+        self.anchor = (mean_local, mean_position)
+
+
+class MTCDecoder:
+    """Assembles MIDI timecode quarter-frame and full-frame messages"""
+
+    def __init__(self, clock_target, clock=time.monotonic):
+        self.target = clock_target
+        self.clock = clock
+        self.pieces = [0] * 8
+        self.received = 0  # Bitmask of pieces seen since the last full time
+
+    def feed(self, data):
+        """Feed one raw MIDI message"""
+        if len(data) >= 2 and data[0] == 0xF1:
+            self._quarter_frame(data[1])
+        elif len(data) >= 10 and data[0] == 0xF0 and data[1] == 0x7F and data[3] == 0x01 and data[4] == 0x01:
+            hours, minutes, seconds, frames = data[5], data[6], data[7], data[8]
+            fps = MTC_RATES[(hours >> 5) & 0x03]
+            position = timecode_to_seconds(hours & 0x1F, minutes, seconds, frames, fps)
+            self.received = 0
+            self.target.on_timecode(position, self.clock(), fps)
+
+    def _quarter_frame(self, value):
+        piece = (value >> 4) & 0x07
+        self.pieces[piece] = value & 0x0F
+        self.received |= 1 << piece
+        if piece != 7 or self.received != 0xFF:
+            return
+        self.received = 0
+
+        p = self.pieces
+        frames = p[0] | (p[1] & 0x01) << 4
+        seconds = p[2] | (p[3] & 0x03) << 4
+        minutes = p[4] | (p[5] & 0x03) << 4
+        hours = p[6] | (p[7] & 0x01) << 4
+        fps = MTC_RATES[(p[7] >> 1) & 0x03]
+        # The sequence describes the frame at piece 0, piece 7 arrives 1.75 frames later
+        position = timecode_to_seconds(hours, minutes, seconds, frames, fps) + 1.75 / fps
+        self.target.on_timecode(position, self.clock(), fps)
+
+
+class MTCSource:
+    """MIDI timecode input from a MIDI port (needs mido)"""
+
+    def __init__(self, show_clock, port_name=None, virtual=False, logger=None):
+        self.show_clock = show_clock
+        self.port_name = port_name
+        self.virtual = virtual
+        self.logger = logger or logging.getLogger(__name__)
+        self.decoder = MTCDecoder(show_clock, clock=show_clock.clock)
+        self.port = None
+
+    def start(self):
+        if mido is None:
+            raise RuntimeError("MIDI timecode needs the 'mido' and 'python-rtmidi' packages")
+        self.port = mido.open_input(self.port_name, virtual=self.virtual,
+                                    callback=lambda msg: self.decoder.feed(msg.bytes()))
+        self.logger.info(f"MIDI timecode input: {self.port.name}")
+
+    def stop(self):
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+
+class UDPTimecodeSource:
+    """Timecode from UDP datagrams containing 'HH:MM:SS:FF[/fps]' text"""
+
+    def __init__(self, show_clock, host='0.0.0.0', port=DEFAULT_TIMECODE_PORT, fps=25.0, logger=None):
+        self.show_clock = show_clock
+        self.address = (host, port)
+        self.fps = fps
+        self.logger = logger or logging.getLogger(__name__)
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self.bad_packets = 0
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.settimeout(0.2)
+        self.running = True
+        self.thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self.thread.start()
+        self.logger.info(f"UDP timecode input on {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, _ = self.sock.recvfrom(256)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            received_at = self.show_clock.clock()
+            try:
+                text = data.decode('ascii')
+                match = TIMECODE_PATTERN.match(text.strip())
+                fps = float(match.group(6)) if match and match.group(6) else self.fps
+                self.show_clock.on_timecode(parse_timecode(text, fps), received_at, fps)
+            except (ValueError, UnicodeDecodeError):
+                self.bad_packets += 1
+                if self.bad_packets % 100 == 1:
+                    self.logger.warning(f"Bad timecode packet: {data[:32]!r}")
+
+
+class CueTriggers:
+    """Fires actions at show times, chasing when the timecode jumps"""
+
+    def __init__(self, show_clock, logger=None):
+        self.show_clock = show_clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.times = []
+        self.actions = []
+        self.last_time = None
+
+    def add(self, position, action):
+        """Call action(position) when show time passes position"""
+        index = bisect.bisect_right(self.times, position)
+        self.times.insert(index, position)
+        self.actions.insert(index, action)
+
+    def add_cue(self, position, cue_list, cue_index):
+        """Fire a cue at a show time, its fade runs against the show clock"""
+        self.add(position, lambda at: cue_list.goto(cue_index, at))
+
+    @classmethod
+    def from_config(cls, show_clock, cue_list, config, logger=None):
+        triggers = cls(show_clock, logger=logger)
+        for trigger in config.get('timecode_triggers', []):
+            triggers.add_cue(parse_timecode(trigger['time']), cue_list, int(trigger['cue']))
+        return triggers
+
+    def on_frame(self, now):
+        """Fire the triggers crossed since the last frame (scheduler source)"""
+        if not self.show_clock.running:
+            self.last_time = None
+            return
+        position = self.show_clock.time(now)
+        last = self.last_time
+        self.last_time = position
+
+        if last is None or position < last or position - last > 1.0:
+            # Started, rewound or relocated: chase to the last trigger before position
+            index = bisect.bisect_right(self.times, position) - 1
+            if index >= 0:
+                self._fire(index)
+            return
+
+        first = bisect.bisect_right(self.times, last)
+        last_index = bisect.bisect_right(self.times, position)
+        for index in range(first, last_index):
+            self._fire(index)
+
+    def _fire(self, index):
+        try:
+            self.actions[index](self.times[index])
+        except Exception as e:
+            self.logger.error(f"Timecode trigger error at {self.times[index]:.2f}s: {e}")
+
+
+def send_udp_timecode(host, port, fps=25.0, start=0.0):
+    """Stand-in timecode generator: sends one datagram per frame"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    origin = time.monotonic() - start
+    print(f"Sending timecode to {host}:{port} at {fps} fps (Ctrl+C to stop)")
+    try:
+        while True:
+            position = time.monotonic() - origin
+            sock.sendto(f"{seconds_to_timecode(position, fps)}/{fps:g}".encode('ascii'), (host, port))
+            time.sleep(1.0 / fps)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP timecode generator for testing timecode chase")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_TIMECODE_PORT)
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--start', default='00:00:00:00', help="Start timecode HH:MM:SS:FF")
+    args = parser.parse_args()
+    send_udp_timecode(args.host, args.port, args.fps, parse_timecode(args.start, args.fps))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+DMX Frame Tracing
+Low-overhead spans around the output pipeline, exported as Chrome trace / Perfetto JSON,
+and a sampling profiler for the output thread
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+TRACE_CAPACITY = 65536          # Spans kept; about 25 seconds at 40 fps with every stage traced
+SAMPLE_INTERVAL = 0.005         # Sampling profiler period in seconds
+
+# Stage names used by the output pipeline
+SPAN_FRAME = 'frame'
+SPAN_SOURCES = 'sources'
+SPAN_SNAPSHOT = 'snapshot'
+SPAN_TRANSFORMS = 'output transforms'
+SPAN_MASTERS = 'masters'
+SPAN_SEND = 'send'
+SPAN_TRANSFER = 'ctrl_transfer'
+SPAN_LISTENERS = 'listeners'
+SPAN_WATCHDOG = 'watchdog'
+
+
+class Tracer:
+    """Ring buffer of (name, start, end, value) spans; disabled tracers cost one attribute check"""
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.capacity = capacity
+        self.enabled = False
+        self.names = []         # name id -> name
+        self.name_ids = {}
+        self.threads = {}       # thread ident -> small id
+        self.thread_names = {}
+        self._allocated = False
+        self._counter = itertools.count()
+        self.written = 0
+
+    now = staticmethod(time.perf_counter_ns)
+
+    def _allocate(self):
+        self.name_column = np.zeros(self.capacity, dtype=np.int32)
+        self.start_column = np.zeros(self.capacity, dtype=np.int64)
+        self.end_column = np.zeros(self.capacity, dtype=np.int64)
+        self.thread_column = np.zeros(self.capacity, dtype=np.int32)
+        self.value_column = np.zeros(self.capacity, dtype=np.int64)
+        self._allocated = True
+
+    def enable(self):
+        if not self._allocated:
+            self._allocate()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._counter = itertools.count()
+        self.written = 0
+
+    def add(self, name, start, end, value=0):
+        """Record a span (perf_counter_ns timestamps)"""
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids.setdefault(name, len(self.names))
+            if name_id == len(self.names):
+                self.names.append(name)
+        ident = threading.get_ident()
+        thread_id = self.threads.get(ident)
+        if thread_id is None:
+            thread_id = self.threads.setdefault(ident, len(self.threads) + 1)
+            self.thread_names[thread_id] = threading.current_thread().name
+        # next() on itertools.count is atomic, so concurrent writers get distinct slots
+        n = next(self._counter)
+        i = n % self.capacity
+        self.name_column[i] = name_id
+        self.start_column[i] = start
+        self.end_column[i] = end
+        self.thread_column[i] = thread_id
+        self.value_column[i] = value
+        self.written = n + 1
+
+    def spans(self):
+        """Recorded spans, oldest first: (names, start, end, thread, value) arrays"""
+        if not self._allocated:
+            empty = np.zeros(0, dtype=np.int64)
+            return [], empty, empty, empty, empty
+        count = self.written
+        if count <= self.capacity:
+            order = np.arange(count)
+        else:
+            first = count % self.capacity
+            order = np.concatenate((np.arange(first, self.capacity), np.arange(first)))
+        starts = self.start_column[order]
+        order = order[np.argsort(starts, kind='stable')]
+        names = [self.names[i] for i in self.name_column[order]]
+        return (names, self.start_column[order], self.end_column[order],
+                self.thread_column[order], self.value_column[order])
+
+    def summary(self):
+        """{name: (count, mean ms, p99 ms, max ms)}"""
+        names, starts, ends, _, _ = self.spans()
+        return summarize(names, (ends - starts) / 1e6)
+
+    def to_chrome(self):
+        """Chrome trace event format, loadable in chrome://tracing and ui.perfetto.dev"""
+        names, starts, ends, threads, values = self.spans()
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self.thread_names.items()]
+        for name, start, end, tid, value in zip(names, starts.tolist(), ends.tolist(),
+                                               threads.tolist(), values.tolist()):
+            event = {'name': name, 'cat': 'dmx', 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': start / 1000.0, 'dur': (end - start) / 1000.0}
+            if value:
+                event['args'] = {'value': value}
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """Write the trace as Chrome trace JSON, returns the number of spans"""
+        trace = self.to_chrome()
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+        return sum(1 for event in trace['traceEvents'] if event['ph'] == 'X')
+
+
+def summarize(names, durations):
+    """{name: (count, mean, p99, max)} from parallel name and duration sequences"""
+    durations = np.asarray(durations, dtype=np.float64)
+    by_name = {}
+    for i, name in enumerate(names):
+        by_name.setdefault(name, []).append(i)
+    stats = {}
+    for name, indexes in by_name.items():
+        values = durations[indexes]
+        stats[name] = (len(values), float(values.mean()), float(np.percentile(values, 99)), float(values.max()))
+    return stats
+
+
+def format_summary(stats, budget_ms=25.0):
+    lines = [f"{'stage':<24}{'count':>8}{'mean ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for name, (count, mean, p99, peak) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{name:<24}{count:>8}{mean:>10.3f}{p99:>10.3f}{peak:>10.3f}")
+    if SPAN_FRAME in stats:
+        lines.append(f"frame p99 uses {stats[SPAN_FRAME][2] / budget_ms * 100:.1f}% of the {budget_ms:.0f} ms budget")
+    return '\n'.join(lines)
+
+
+class SamplingProfiler:
+    """Samples the stacks of the traced threads on a timer, collapsed-stack output for flame graphs"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, threads=None):
+        self.interval = interval
+        self.thread_filter = threads    # thread idents to sample, None for all but our own
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_filter is not None and ident not in self.thread_filter):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def top(self, count=10):
+        """Leaf functions with the most samples"""
+        leaves = Counter()
+        for stack, samples in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        return leaves.most_common(count)
+
+    def export(self, path):
+        """Collapsed stacks ('a;b;c count' lines) for flamegraph.pl or speedscope"""
+        with open(path, 'w') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        return len(self.stacks)
+
+
+class StartupTimer:
+    """Startup milestones in ms since a reference taken before the heavy imports"""
+
+    def __init__(self, begin):
+        self.begin = begin
+        self.marks = {}  # milestone -> ms, first mark wins; written from worker threads too
+        self.reported = False
+
+    def mark(self, name):
+        self.marks.setdefault(name, (time.perf_counter() - self.begin) * 1000)
+
+    def complete(self, names):
+        return all(name in self.marks for name in names)
+
+    def summary(self):
+        return ', '.join(f"{name} {ms:.0f} ms" for name, ms in sorted(self.marks.items(), key=lambda item: item[1]))
+
+    def record(self, path, version=None):
+        """Append this startup as a JSON line, so runs can be compared over time"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'version': version,
+                                'marks': {name: round(ms, 1) for name, ms in self.marks.items()}}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a DMX frame trace")
+    parser.add_argument('trace', help="Chrome trace JSON exported from the controller")
+    parser.add_argument('--budget', type=float, default=25.0, help="Frame budget in ms")
+    args = parser.parse_args()
+    with open(args.trace) as f:
+        events = [e for e in json.load(f)['traceEvents'] if e.get('ph') == 'X']
+    print(format_summary(summarize([e['name'] for e in events], [e['dur'] / 1000.0 for e in events]),
+                         args.budget))
+
+
+if __name__ == "__main__":
+    main()
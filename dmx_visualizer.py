@@ -0,0 +1,255 @@
+"""
+DMX Stage Visualizer
+Top-down stage plan drawn from the patch and the output frames: fixture positions, beam color,
+intensity and pan/tilt, redrawn on the Tk thread at its own capped rate
+"""
+import logging
+import math
+import time
+
+VISUALIZER_RATE = 20        # Redraws per second at most
+MAX_RATE = 40               # No point going faster than the output frame rate
+FIXTURE_SPACING = 1.0       # Metres between fixtures without a position, laid out in a row
+BEAM_REACH = 1.5            # Metres a beam tilted fully sideways reaches on the plan
+STAGE_MARGIN = 30           # Pixels around the plan
+FIXTURE_RADIUS = 10         # Pixels
+BEAM_WIDTH = 4
+BEAM_MIN = 0.02             # Beams dimmer than this are hidden
+STROBE_MIN = 8              # Strobe values from here on flash the shutter...
+STROBE_HZ = (1.0, 20.0)     # ...from the slowest to the fastest rate; aliased at the redraw rate
+WHEEL_SPIN = 1.0            # Wheel slots per second in auto color mode
+BACKGROUND = '#101010'
+OUTLINE = '#606060'
+LABEL_COLOR = '#a0a0a0'
+
+
+def hex_color(red, green, blue):
+    return f"#{min(255, int(red)):02x}{min(255, int(green)):02x}{min(255, int(blue)):02x}"
+
+
+def parse_color(color):
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+class StageModel:
+    """Channel offsets of every patched fixture, turned into colors and beams for a set of frames"""
+
+    def __init__(self, patch):
+        self.fixtures = patch.fixtures
+        self.positions = self._layout(patch.fixtures)
+        self.slots = []  # per fixture: {attribute: 0-based channel index}
+        for fixture in self.fixtures:
+            self.slots.append({attribute: fixture.channel(attribute) - 1 for attribute in fixture.attributes})
+        self.wheels = [[(first, parse_color(color)) for first, color in fixture.personality.get('wheel', [])]
+                       for fixture in self.fixtures]
+
+    @staticmethod
+    def _layout(fixtures):
+        """(x, y) of every fixture; fixtures without a position go in a row upstage of the others"""
+        placed = [fixture.position for fixture in fixtures if fixture.position is not None]
+        row = max(y for _, y in placed) + FIXTURE_SPACING if placed else 0.0
+        positions = []
+        column = 0
+        for fixture in fixtures:
+            if fixture.position is not None:
+                positions.append(fixture.position)
+            else:
+                positions.append((column * FIXTURE_SPACING, row))
+                column += 1
+        return positions
+
+    def bounds(self):
+        """(min x, min y, max x, max y) of the plan, with room for the beams"""
+        if not self.positions:
+            return -BEAM_REACH, -BEAM_REACH, BEAM_REACH, BEAM_REACH
+        xs = [x for x, _ in self.positions]
+        ys = [y for _, y in self.positions]
+        return min(xs) - BEAM_REACH, min(ys) - BEAM_REACH, max(xs) + BEAM_REACH, max(ys) + BEAM_REACH
+
+    def looks(self, frames, t):
+        """([(color, brightness 0-1, beam (dx, dy) in metres or None)] per fixture, animated)
+
+        animated is True while a strobe or a spinning wheel changes the look without the frames changing
+        """
+        looks = []
+        animated = False
+        for fixture, slots, wheel in zip(self.fixtures, self.slots, self.wheels):
+            frame = frames.get(fixture.universe)
+            if frame is None:
+                looks.append((BACKGROUND, 0.0, None))
+                continue
+            if 'red' in slots:
+                red, green, blue = frame[slots['red']], frame[slots['green']], frame[slots['blue']]
+                if 'white' in slots:
+                    white = frame[slots['white']]
+                    red, green, blue = red + white, green + white, blue + white
+            elif wheel and 'color' in slots:
+                value = frame[slots['color']]
+                if value >= fixture.personality.get('wheel_auto', 256):
+                    animated = True
+                    red, green, blue = wheel[int(t * WHEEL_SPIN) % len(wheel)][1]
+                else:
+                    red, green, blue = next(color for first, color in reversed(wheel) if value >= first)
+            else:
+                red = green = blue = 255
+
+            level = frame[slots['dimmer']] / 255.0 if 'dimmer' in slots else 1.0
+            if 'strobe' in slots and frame[slots['strobe']] >= STROBE_MIN:
+                animated = True
+                low, high = STROBE_HZ
+                hz = low + (frame[slots['strobe']] - STROBE_MIN) / (255 - STROBE_MIN) * (high - low)
+                if (t * hz) % 1.0 >= 0.5:
+                    level = 0.0
+            red, green, blue = red * level, green * level, blue * level
+            brightness = min(255, max(red, green, blue)) / 255.0
+
+            beam = None
+            if 'pan' in slots and 'tilt' in slots:
+                personality = fixture.personality
+                pan = math.radians(frame[slots['pan']] / 255.0 * personality.get('pan_range', 540))
+                tilt = math.radians((frame[slots['tilt']] / 255.0 - 0.5) * personality.get('tilt_range', 270))
+                # Hung above the stage: straight down at mid tilt, reaching out as the head tilts
+                reach = math.sin(tilt) * BEAM_REACH
+                beam = (reach * math.cos(pan), reach * math.sin(pan))
+            looks.append((hex_color(red, green, blue), brightness, beam))
+        return looks, animated
+
+
+class StageVisualizer:
+    """Stage plan on a Tk canvas; items are created once per patch and only what changed is updated
+
+    The output thread only hands over a reference to its frames. Drawing happens on the Tk thread
+    at most rate times per second, and not at all while the canvas is hidden or nothing changed.
+    """
+
+    def __init__(self, canvas, patch, scheduler, rate=VISUALIZER_RATE, logger=None):
+        self.canvas = canvas
+        self.scheduler = scheduler
+        self.controllers = scheduler.controllers
+        self.logger = logger or logging.getLogger(__name__)
+        self.rate = VISUALIZER_RATE
+        self.set_rate(rate)
+        self.frames = None       # Output frames of the last scheduler frame
+        self.last_frames = None  # Frames the canvas shows
+        self.animated = False
+        self.after_id = None
+        self.model = None
+        self.items = []          # per fixture: (beam, body, label) canvas item ids
+        self.drawn = []          # per fixture: (color, beam coordinates) last sent to Tk
+        self.centers = []        # per fixture: canvas (x, y)
+        self.scale = 1.0
+
+        self.draws = 0
+        self.skipped = 0
+        self.item_updates = 0
+        self.draw_time = 0.0     # Seconds the last redraw took
+
+        canvas.configure(background=BACKGROUND)
+        canvas.bind('<Configure>', lambda event: self.layout())
+        self.set_patch(patch)
+
+    def set_rate(self, rate):
+        self.rate = max(1, min(MAX_RATE, int(rate)))
+
+    def set_patch(self, patch):
+        """Recreate the canvas items for a new patch"""
+        self.model = StageModel(patch)
+        canvas = self.canvas
+        canvas.delete('all')
+        self.items = []
+        for fixture in self.model.fixtures:
+            beam = canvas.create_line(0, 0, 0, 0, width=BEAM_WIDTH, capstyle='round', state='hidden')
+            body = canvas.create_oval(0, 0, 0, 0, fill=BACKGROUND, outline=OUTLINE)
+            label = canvas.create_text(0, 0, text=fixture.name, fill=LABEL_COLOR, font=("Arial", 8), anchor='n')
+            self.items.append((beam, body, label))
+        self.layout()
+
+    def layout(self):
+        """Fit the plan to the canvas; moves the items, the next redraw refreshes the beams"""
+        width = max(self.canvas.winfo_width(), 2 * STAGE_MARGIN + 1)
+        height = max(self.canvas.winfo_height(), 2 * STAGE_MARGIN + 1)
+        min_x, min_y, max_x, max_y = self.model.bounds()
+        self.scale = min((width - 2 * STAGE_MARGIN) / (max_x - min_x), (height - 2 * STAGE_MARGIN) / (max_y - min_y))
+        # Downstage (y = 0) at the bottom, as seen from the audience
+        self.centers = [(STAGE_MARGIN + (x - min_x) * self.scale, height - STAGE_MARGIN - (y - min_y) * self.scale)
+                        for x, y in self.model.positions]
+        for (beam, body, label), (x, y) in zip(self.items, self.centers):
+            self.canvas.coords(body, x - FIXTURE_RADIUS, y - FIXTURE_RADIUS, x + FIXTURE_RADIUS, y + FIXTURE_RADIUS)
+            self.canvas.coords(label, x, y + FIXTURE_RADIUS + 2)
+        self.drawn = [None] * len(self.items)
+        self.last_frames = None
+
+    def on_frame(self, now, frames):
+        """Scheduler listener: keep a reference to the frames, the drawing happens on the Tk thread"""
+        self.frames = frames
+
+    def current_frames(self):
+        if self.scheduler.running and self.frames is not None:
+            return self.frames  # Replaced whole every frame, never modified
+        # Nothing is sending: render what would go out
+        return {universe: controller.render_frame(bytes(controller.dmx_data))
+                for universe, controller in self.controllers.items()}
+
+    def start(self):
+        if self.after_id is not None:
+            return
+        self.scheduler.add_listener(self.on_frame)
+        self.after_id = self.canvas.after(0, self._tick)
+
+    def stop(self):
+        self.scheduler.remove_listener(self.on_frame)
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+        self.frames = None
+
+    def _tick(self):
+        self.after_id = self.canvas.after(int(1000 / self.rate), self._tick)
+        if not self.canvas.winfo_ismapped():
+            return  # Tab not shown
+        frames = self.current_frames()
+        if not self.animated and frames == self.last_frames:
+            self.skipped += 1
+            return
+        try:
+            self.draw(frames, time.monotonic())
+        except Exception as e:
+            self.logger.error(f"Visualizer redraw failed: {e}")
+
+    def draw(self, frames, t):
+        """Update the items whose color or beam changed"""
+        start = time.perf_counter()
+        looks, self.animated = self.model.looks(frames, t)
+        canvas = self.canvas
+        scale = self.scale
+        updates = 0
+        for i, (color, brightness, beam) in enumerate(looks):
+            x, y = self.centers[i]
+            coords = None
+            if beam is not None and brightness >= BEAM_MIN:
+                coords = (x, y, x + beam[0] * scale, y - beam[1] * scale)
+            state = (color, coords)
+            if state == self.drawn[i]:
+                continue
+            beam_item, body_item, _ = self.items[i]
+            previous = self.drawn[i]
+            if previous is None or previous[0] != color:
+                canvas.itemconfigure(body_item, fill=color)
+                updates += 1
+            if coords is None:
+                if previous is None or previous[1] is not None:
+                    canvas.itemconfigure(beam_item, state='hidden')
+                    updates += 1
+            else:
+                canvas.coords(beam_item, *coords)
+                canvas.itemconfigure(beam_item, fill=color, state='normal')
+                updates += 2
+            self.drawn[i] = state
+        self.last_frames = frames
+        self.item_updates += updates
+        self.draws += 1
+        self.draw_time = time.perf_counter() - start
+
+    def status(self):
+        return (f"{len(self.items)} fixtures, {self.rate} fps cap, {self.draws} redraws "
+                f"({self.draw_time * 1000:.1f} ms last), {self.skipped} unchanged, {self.item_updates} item updates")
@@ -0,0 +1,162 @@
+"""
+DMX Watchdog
+Heartbeats from input sources, checked every output frame; stalled sources trigger a
+failsafe policy: hold the last look, fade to a safe scene, or black out
+"""
+import logging
+import threading
+
+POLICY_HOLD = 'hold'
+POLICY_SAFE_SCENE = 'safe_scene'
+POLICY_BLACKOUT = 'blackout'
+POLICIES = (POLICY_HOLD, POLICY_SAFE_SCENE, POLICY_BLACKOUT)
+
+# Used when config.json has no 'watchdog' section: report stalls, change nothing
+DEFAULT_WATCHDOG = {
+    'sources': {
+        'gui': {'timeout': 2.0, 'policy': POLICY_HOLD},
+        'gamepads': {'timeout': 1.0, 'policy': POLICY_HOLD},
+    },
+}
+
+
+class WatchedSource:
+    """One input source's heartbeat, timeout and failsafe policy"""
+
+    def __init__(self, name, timeout, policy=POLICY_HOLD, scene=None, fade=2.0, universe=1):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown watchdog policy: {policy}")
+        if policy == POLICY_SAFE_SCENE and not scene:
+            raise ValueError(f"Watchdog source '{name}' needs a safe scene")
+        self.name = name
+        self.timeout = float(timeout)
+        self.policy = policy
+        self.scene = {int(channel): int(value) for channel, value in (scene or {}).items()}
+        self.fade = float(fade)
+        self.universe = int(universe)
+        self.last_beat = None     # None until the first heartbeat
+        self.tripped_at = None
+        self.fade_from = {}
+        self.trips = 0
+
+    @property
+    def tripped(self):
+        return self.tripped_at is not None
+
+
+class Watchdog:
+    """Checks heartbeats inside the frame scheduler and enforces failsafe policies"""
+
+    def __init__(self, controllers, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.watched = {}          # name -> WatchedSource
+        self.by_source = {}        # scheduler source callable -> name
+        self.blackout_universes = set()  # Blackouts the watchdog set, released on recovery
+
+    @classmethod
+    def from_config(cls, config, controllers, logger=None):
+        settings = config.get('watchdog', DEFAULT_WATCHDOG)
+        watchdog = cls(controllers, logger)
+        scene = settings.get('safe_scene', {})
+        for name, options in settings.get('sources', {}).items():
+            try:
+                watchdog.watch(name, options.get('timeout', 1.0), options.get('policy', POLICY_HOLD),
+                               options.get('scene', scene), options.get('fade', settings.get('fade', 2.0)),
+                               options.get('universe', 1))
+            except ValueError as e:
+                watchdog.logger.warning(f"Watchdog: {e}")
+        return watchdog
+
+    def watch(self, name, timeout, policy=POLICY_HOLD, scene=None, fade=2.0, universe=1, source=None):
+        """Start watching a source; scheduler sources also get a heartbeat each time they run cleanly"""
+        watched = WatchedSource(name, timeout, policy, scene, fade, universe)
+        with self.lock:
+            self.watched[name] = watched
+            if source is not None:
+                self.by_source[source] = name
+
+    def attach_source(self, name, source):
+        """Heartbeat name whenever the scheduler source runs without raising"""
+        with self.lock:
+            if name in self.watched:
+                self.by_source[source] = name
+
+    def beat(self, name, now):
+        """Heartbeat from any thread (a single attribute store)"""
+        watched = self.watched.get(name)
+        if watched is not None:
+            watched.last_beat = now
+
+    def rest(self, name):
+        """Stop supervising name until its next heartbeat, for a source the operator switched off"""
+        watched = self.watched.get(name)
+        if watched is None:
+            return
+        watched.last_beat = None
+        if watched.tripped:
+            self._recover(watched)
+
+    def beat_source(self, source, now):
+        name = self.by_source.get(source)
+        if name is not None:
+            self.watched[name].last_beat = now
+
+    def enforce(self, now):
+        """Trip or recover sources and apply the failsafe policies (called once per frame)"""
+        for watched in list(self.watched.values()):
+            if watched.last_beat is None:
+                continue  # Never started, nothing to supervise yet
+            stalled = now - watched.last_beat > watched.timeout
+            if stalled and not watched.tripped:
+                self._trip(watched, now)
+            elif not stalled and watched.tripped:
+                self._recover(watched)
+            if watched.tripped and watched.policy == POLICY_SAFE_SCENE:
+                self._fade_scene(watched, now)
+
+    def _trip(self, watched, now):
+        watched.tripped_at = now
+        watched.trips += 1
+        self.logger.error(f"Watchdog: '{watched.name}' stalled for {now - watched.last_beat:.1f}s, "
+                          f"policy: {watched.policy}")
+        if watched.policy == POLICY_BLACKOUT:
+            for universe, controller in self.controllers.items():
+                if not controller.masters.blackout:
+                    controller.masters.set_blackout(True)
+                    self.blackout_universes.add(universe)
+        elif watched.policy == POLICY_SAFE_SCENE:
+            controller = self.controllers.get(watched.universe)
+            if controller is not None:
+                watched.fade_from = {channel: controller.dmx_data[channel - 1] for channel in watched.scene}
+
+    def _recover(self, watched):
+        watched.tripped_at = None
+        self.logger.info(f"Watchdog: '{watched.name}' recovered")
+        if watched.policy == POLICY_BLACKOUT:
+            still_tripped = any(w.tripped and w.policy == POLICY_BLACKOUT for w in self.watched.values())
+            if not still_tripped:
+                for universe in self.blackout_universes:
+                    controller = self.controllers.get(universe)
+                    if controller is not None:
+                        controller.masters.set_blackout(False)
+                self.blackout_universes.clear()
+
+    def _fade_scene(self, watched, now):
+        controller = self.controllers.get(watched.universe)
+        if controller is None:
+            return
+        elapsed = now - watched.tripped_at
+        progress = 1.0 if watched.fade <= 0 else min(1.0, elapsed / watched.fade)
+        values = {}
+        for channel, target in watched.scene.items():
+            start = watched.fade_from.get(channel, target)
+            values[channel] = int(round(start + (target - start) * progress))
+        # Written every frame so the safe scene wins over whatever else is still running
+        controller.set_channels(values)
+
+    def status(self, now):
+        """[(name, seconds since last heartbeat or None, tripped)]"""
+        return [(w.name, None if w.last_beat is None else now - w.last_beat, w.tripped)
+                for w in self.watched.values()]
@@ -0,0 +1,481 @@
+"""
+DMX Web Remote
+Embedded HTTP/WebSocket server: browsers get the universes as binary deltas at their own rate
+and send batched channel writes back
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+
+import numpy as np
+
+from dmx_recorder import encode_runs, RUN_COUNT, RUN_HEADER, RUN_GAP
+
+DEFAULT_WEB_PORT = 8080
+DEFAULT_RATE = 20           # Updates per second per client
+MAX_RATE = 40               # No point going faster than the output frame rate
+MAX_CLIENTS = 64
+MAX_MESSAGE = 64 * 1024     # Largest incoming WebSocket message
+MAX_BUFFERED = 256 * 1024   # A client with this much unsent data skips updates until it catches up
+WRITE_RATE = 100            # Incoming write messages per second per client...
+WRITE_BURST = 50            # ...with bursts up to this many
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Binary messages: header, then per universe '<H' universe + a run list (as in recordings)
+MESSAGE_HEADER = struct.Struct('<BIH')  # kind, frame number, universe count
+MESSAGE_KEYFRAME = 0
+MESSAGE_DELTA = 1
+MESSAGE_WRITE = 2                        # Client -> server, frame number ignored
+UNIVERSE_ENTRY = struct.Struct('<H')
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def frame_runs(old, new, gap=RUN_GAP):
+    """diff_runs with NumPy: (start, data) runs where new differs from old"""
+    changed = np.flatnonzero(np.frombuffer(old, dtype=np.uint8) != np.frombuffer(new, dtype=np.uint8))
+    if not len(changed):
+        return []
+    breaks = np.flatnonzero(np.diff(changed) > gap + 1)
+    starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+    ends = np.concatenate((changed[breaks], [changed[-1]])) + 1
+    return [(int(start), bytes(new[start:end])) for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def encode_ws_frame(opcode, payload):
+    """Server-to-client WebSocket frame (unmasked, unfragmented)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 0x10000:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def unmask(payload, mask):
+    data = np.frombuffer(payload, dtype=np.uint8)
+    key = np.resize(np.frombuffer(mask, dtype=np.uint8), len(data))
+    return (data ^ key).tobytes()
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + WEBSOCKET_GUID).digest()).decode('ascii')
+
+
+class WebClient:
+    """One WebSocket connection: its update rate, what it was last sent and its write allowance"""
+
+    def __init__(self, reader, writer, rate):
+        self.reader = reader
+        self.writer = writer
+        self.rate = rate
+        self.sent = {}             # universe -> frame (bytes) the client has
+        self.tokens = WRITE_BURST
+        self.refilled = time.monotonic()
+        self.deferred = {}         # universe -> {channel: value} held back by the rate limit
+        self.address = writer.get_extra_info('peername')
+
+    def allow_write(self):
+        now = time.monotonic()
+        self.tokens = min(WRITE_BURST, self.tokens + (now - self.refilled) * WRITE_RATE)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class WebServer:
+    """Streams universe state to browsers and applies their writes, all on its own event loop thread"""
+
+    def __init__(self, controllers, scheduler, host='0.0.0.0', port=DEFAULT_WEB_PORT, rate=DEFAULT_RATE,
+                 allow_writes=True, logger=None):
+        self.controllers = controllers  # universe -> DMXController
+        self.scheduler = scheduler
+        self.address = (host, port)
+        self.rate = min(MAX_RATE, rate)
+        self.allow_writes = allow_writes
+        self.logger = logger or logging.getLogger(__name__)
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.running = False
+        self.clients = set()
+        self.delta_cache = {}      # (old frame id, new frame id) -> encoded runs, for the current frame
+        self.cache_frames = None
+        self.messages = 0
+        self.writes_deferred = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_config(cls, config, controllers, scheduler, logger=None):
+        options = config.get('web', {})
+        return cls(controllers, scheduler, options.get('host', '0.0.0.0'), options.get('port', DEFAULT_WEB_PORT),
+                   options.get('rate', DEFAULT_RATE), options.get('allow_writes', True), logger)
+
+    def start(self, timeout=2.0):
+        """Run the server on its own event loop thread"""
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(asyncio.start_server(
+                    self._handle_connection, self.address[0], self.address[1]))
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                self.loop.close()
+                return
+            started.set()
+            try:
+                self.loop.run_forever()
+            finally:
+                self.server.close()
+                for client in list(self.clients):
+                    client.writer.close()
+                self.loop.run_until_complete(asyncio.sleep(0))
+                self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="web-server", daemon=True)
+        self.thread.start()
+        started.wait(timeout)
+        if errors:
+            self.thread = None
+            raise errors[0]
+        self.running = True
+        self.logger.info(f"Web remote on http://{self.address[0]}:{self.address[1]}/")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    # HTTP
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5.0)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        path = parts[1] if len(parts) > 1 else '/'
+
+        if path.startswith('/ws') and headers.get('upgrade', '').lower() == 'websocket':
+            await self._websocket(reader, writer, headers, path)
+        elif path == '/' or path.startswith('/?'):
+            self._respond(writer, '200 OK', 'text/html; charset=utf-8', INDEX_HTML.encode('utf-8'))
+        else:
+            self._respond(writer, '404 Not Found', 'text/plain', b'Not found')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    @staticmethod
+    def _respond(writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + body)
+
+    # WebSocket
+
+    async def _websocket(self, reader, writer, headers, path):
+        if len(self.clients) >= MAX_CLIENTS or 'sec-websocket-key' not in headers:
+            self._respond(writer, '503 Service Unavailable', 'text/plain', b'Too many clients')
+            return
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept_key(headers['sec-websocket-key']).encode('ascii') +
+                     b"\r\n\r\n")
+        rate = self.rate
+        if 'rate=' in path:
+            try:
+                rate = min(MAX_RATE, max(1, int(path.split('rate=')[1].split('&')[0])))
+            except ValueError:
+                pass
+        client = WebClient(reader, writer, rate)
+        self.clients.add(client)
+        self.logger.info(f"Web client connected: {client.address}, {client.rate} updates/s")
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            await self._receive_loop(client)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            self.logger.debug(f"Web client {client.address}: {e}")
+        finally:
+            sender.cancel()
+            self.clients.discard(client)
+            self.logger.info(f"Web client disconnected: {client.address}")
+
+    async def _read_message(self, reader):
+        """(opcode, payload) of the next whole message, control frames included"""
+        message = bytearray()
+        message_opcode = None
+        while True:
+            first, second = await reader.readexactly(2)
+            fin, opcode = first & 0x80, first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await reader.readexactly(8))
+            if length > MAX_MESSAGE or len(message) + length > MAX_MESSAGE:
+                raise ValueError(f"message over {MAX_MESSAGE} bytes")
+            mask = await reader.readexactly(4) if second & 0x80 else None
+            payload = await reader.readexactly(length)
+            if mask is not None:
+                payload = unmask(payload, mask)
+            if opcode >= OP_CLOSE:
+                return opcode, payload  # Control frames may arrive between fragments
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message += payload
+            if fin:
+                return message_opcode, bytes(message)
+
+    async def _receive_loop(self, client):
+        while True:
+            opcode, payload = await self._read_message(client.reader)
+            if opcode == OP_CLOSE:
+                client.writer.write(encode_ws_frame(OP_CLOSE, payload[:2]))
+                return
+            if opcode == OP_PING:
+                client.writer.write(encode_ws_frame(OP_PONG, payload))
+                continue
+            if opcode == OP_PONG:
+                continue
+            self.messages += 1
+            if opcode == OP_TEXT:
+                self._handle_text(client, payload)
+            elif opcode == OP_BINARY:
+                self._handle_write(client, payload)
+
+    def _handle_text(self, client, payload):
+        # {"rate": 10} changes the update rate, {"set": {"1": {"5": 255}}} writes channels
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        if 'rate' in message:
+            try:
+                client.rate = min(MAX_RATE, max(1, int(message['rate'])))
+            except (TypeError, ValueError, OverflowError):
+                pass
+        if 'set' in message:
+            writes = {}
+            try:
+                for universe, channels in message['set'].items():
+                    writes[int(universe)] = {int(channel): int(value) for channel, value in channels.items()}
+            except (AttributeError, TypeError, ValueError, OverflowError):
+                return
+            self._apply(client, writes)
+
+    def _handle_write(self, client, payload):
+        # Binary write: MESSAGE_WRITE header then universes with run lists
+        try:
+            kind, _, count = MESSAGE_HEADER.unpack_from(payload)
+            if kind != MESSAGE_WRITE:
+                return
+            offset = MESSAGE_HEADER.size
+            writes = {}
+            for _ in range(count):
+                universe, = UNIVERSE_ENTRY.unpack_from(payload, offset)
+                offset += UNIVERSE_ENTRY.size
+                channels = writes.setdefault(universe, {})
+                run_count, = RUN_COUNT.unpack_from(payload, offset)
+                offset += RUN_COUNT.size
+                for _ in range(run_count):
+                    start, length = RUN_HEADER.unpack_from(payload, offset)
+                    offset += RUN_HEADER.size
+                    channels.update(zip(range(start + 1, start + length + 1), payload[offset:offset + length]))
+                    offset += length
+        except struct.error:
+            return
+        self._apply(client, writes)
+
+    def _apply(self, client, writes):
+        """One set_channels per universe, so a client's batch lands in a single frame"""
+        if not self.allow_writes:
+            return
+        if client.deferred or not client.allow_write():
+            # Over the limit: merge into the held-back batch so the latest values still land
+            if not client.deferred:
+                self.loop.call_later(1.0 / WRITE_RATE, self._flush_deferred, client)
+            for universe, channels in writes.items():
+                client.deferred.setdefault(universe, {}).update(channels)
+            self.writes_deferred += 1
+            return
+        for universe, channels in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None and channels:
+                controller.set_channels(channels)
+
+    def _flush_deferred(self, client):
+        if client not in self.clients:
+            return
+        if not client.allow_write():
+            self.loop.call_later(1.0 / WRITE_RATE, self._flush_deferred, client)
+            return
+        writes, client.deferred = client.deferred, {}
+        for universe, channels in writes.items():
+            controller = self.controllers.get(universe)
+            if controller is not None and channels:
+                controller.set_channels(channels)
+
+    async def _send_loop(self, client):
+        loop = asyncio.get_event_loop()
+        next_update = loop.time()
+        while True:
+            if client.writer.transport.get_write_buffer_size() < MAX_BUFFERED:
+                message = self._update_for(client)
+                if message is not None:
+                    client.writer.write(encode_ws_frame(OP_BINARY, message))
+                    self.bytes_sent += len(message)
+            # A slow client skips updates; it gets the latest state as one delta when it catches up
+            next_update += 1.0 / client.rate
+            delay = next_update - loop.time()
+            if delay < 0:
+                next_update = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def _update_for(self, client):
+        """Binary keyframe or delta bringing a client up to the current universes, None if it has them"""
+        if self.scheduler.running:
+            frames = self.scheduler.source_frames  # Replaced whole every frame, never modified
+        else:
+            frames = {universe: bytes(controller.dmx_data) for universe, controller in self.controllers.items()}
+        if frames is not self.cache_frames:
+            self.cache_frames = frames
+            self.delta_cache = {}
+        kind = MESSAGE_DELTA if client.sent else MESSAGE_KEYFRAME
+        parts = []
+        for universe, frame in frames.items():
+            old = client.sent.get(universe)
+            if old is frame:
+                continue
+            if old is None:
+                runs = encode_runs([(0, bytes(frame))])
+            else:
+                key = (id(old), id(frame))
+                runs = self.delta_cache.get(key)
+                if runs is None:
+                    runs = self.delta_cache[key] = encode_runs(frame_runs(old, frame))
+            client.sent[universe] = frame
+            if runs != b'\x00\x00':
+                parts.append(UNIVERSE_ENTRY.pack(universe) + runs)
+        if not parts:
+            return None
+        return MESSAGE_HEADER.pack(kind, self.scheduler.frame_number & 0xFFFFFFFF, len(parts)) + b''.join(parts)
+
+    def status(self):
+        return (f"{len(self.clients)} clients, {self.messages} messages in, "
+                f"{self.bytes_sent // 1024} KB out")
+
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>DMX Controller</title>
+<style>
+body { font-family: sans-serif; margin: 10px; background: #222; color: #ddd; }
+#grid { display: grid; grid-template-columns: repeat(16, 1fr); gap: 2px; }
+.cell { background: #333; padding: 3px; font-size: 11px; text-align: center; cursor: pointer; }
+.cell.sel { outline: 2px solid #4af; }
+.cell b { display: block; color: #888; font-weight: normal; }
+#bar { margin-bottom: 10px; }
+input[type=range] { width: 60%; vertical-align: middle; }
+</style>
+</head>
+<body>
+<div id="bar">
+  Universe <select id="universe"></select>
+  Channel <span id="channel">1</span>
+  <input id="level" type="range" min="0" max="255" value="0"> <span id="value">0</span>
+  <span id="status">connecting...</span>
+</div>
+<div id="grid"></div>
+<script>
+const universes = {};
+let universe = null, channel = 1;
+const grid = document.getElementById('grid'), select = document.getElementById('universe');
+const level = document.getElementById('level');
+for (let i = 1; i <= 512; i++) {
+  const cell = document.createElement('div');
+  cell.className = 'cell'; cell.innerHTML = '<b>' + i + '</b><span>0</span>';
+  cell.onclick = () => { channel = i; render(); };
+  grid.appendChild(cell);
+}
+function render() {
+  const data = universes[universe] || new Uint8Array(512);
+  const cells = grid.children;
+  for (let i = 0; i < 512; i++) {
+    cells[i].lastChild.textContent = data[i];
+    cells[i].style.background = 'rgb(' + [51 + data[i] / 2, 51 + data[i] / 3, 51].join(',') + ')';
+    cells[i].className = i + 1 === channel ? 'cell sel' : 'cell';
+  }
+  document.getElementById('channel').textContent = channel;
+  if (document.activeElement !== level) level.value = data[channel - 1];
+  document.getElementById('value').textContent = data[channel - 1];
+}
+function connect() {
+  const ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+  ws.binaryType = 'arraybuffer';
+  ws.onopen = () => { document.getElementById('status').textContent = 'live'; };
+  ws.onclose = () => { document.getElementById('status').textContent = 'reconnecting...'; setTimeout(connect, 1000); };
+  ws.onmessage = (event) => {
+    const view = new DataView(event.data);
+    let offset = 7;
+    for (let n = view.getUint16(5, true); n > 0; n--) {
+      const u = view.getUint16(offset, true); offset += 2;
+      if (!universes[u]) {
+        universes[u] = new Uint8Array(512);
+        const option = document.createElement('option'); option.value = option.textContent = u;
+        select.appendChild(option);
+        if (universe === null) universe = u;
+      }
+      const runs = view.getUint16(offset, true); offset += 2;
+      for (let i = 0; i < runs; i++) {
+        const start = view.getUint16(offset, true), length = view.getUint16(offset + 2, true);
+        universes[u].set(new Uint8Array(event.data, offset + 4, length), start);
+        offset += 4 + length;
+      }
+    }
+    render();
+  };
+  level.oninput = () => {
+    if (universe === null || ws.readyState !== 1) return;
+    const set = {}; set[universe] = {}; set[universe][channel] = Number(level.value);
+    ws.send(JSON.stringify({set: set}));
+  };
+}
+select.onchange = () => { universe = Number(select.value); render(); };
+connect();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,97 @@
+"""
+Show Recorder Round-Trip Test
+Records looks through ShowRecorder and plays them back with ShowPlayer through an output scheduler
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from dmx_controller import DMXController, OutputScheduler
+from dmx_recorder import ShowRecorder, ShowReader, ShowPlayer
+
+FRAME = 1.0 / 40
+
+
+class Clock:
+    """Manually advanced clock for the recorder and the scheduler"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def look(**channels):
+    frame = bytearray(512)
+    for name, value in channels.items():
+        frame[int(name[2:]) - 1] = value
+    return bytes(frame)
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'show.dmxr')
+        self.clock = Clock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, takes, end):
+        """Record {time: {universe: frame}} and stop at end"""
+        recorder = ShowRecorder(self.path, clock=self.clock)
+        recorder.start()
+        for t, frames in sorted(takes.items()):
+            self.clock.now = t
+            recorder.record(t, frames)
+        self.clock.now = end
+        recorder.stop()
+
+    def play(self, universes, frames, loop=False):
+        controllers = {universe: DMXController() for universe in universes}
+        scheduler = OutputScheduler(controllers, clock=self.clock)
+        reader = ShowReader(self.path)
+        self.addCleanup(reader.close)
+        player = ShowPlayer(reader, scheduler, loop=loop)
+        player.play()
+        self.clock.now = 0.0
+        for number in range(frames):
+            scheduler.run_frame(number * FRAME)
+        return controllers, player
+
+    def test_static_look_is_sent(self):
+        self.record({0.0: {1: look(ch1=200, ch6=255)}}, end=10.0)
+        self.assertAlmostEqual(ShowReader(self.path).duration, 10.0)
+        controllers, player = self.play([1], 200)
+        self.assertEqual(controllers[1].dmx_data[0], 200)
+        self.assertEqual(controllers[1].dmx_data[5], 255)
+        self.assertTrue(player.playing)  # 5 s into a 10 s take
+
+    def test_every_universe_gets_its_opening_look(self):
+        self.record({0.0: {1: look(ch1=10), 2: look(ch3=30)},
+                     1.0: {1: look(ch1=11), 2: look(ch3=30)}}, end=2.0)
+        controllers, _ = self.play([1, 2], 1)
+        self.assertEqual(controllers[1].dmx_data[0], 10)
+        self.assertEqual(controllers[2].dmx_data[2], 30)
+
+    def test_loop_sends_the_opening_look_again(self):
+        self.record({0.0: {1: look(ch1=10, ch2=20)},
+                     1.0: {1: look(ch1=99, ch2=20)}}, end=1.5)
+        controllers, player = self.play([1], int(1.6 / FRAME) + 1, loop=True)
+        self.assertTrue(player.playing)
+        self.assertEqual(controllers[1].dmx_data[0], 10)
+        self.assertEqual(controllers[1].dmx_data[1], 20)
+
+    def test_finishes_at_the_stop_time(self):
+        self.record({0.0: {1: look(ch1=1)}}, end=1.0)
+        _, player = self.play([1], int(0.5 / FRAME))
+        self.assertTrue(player.playing)
+        _, player = self.play([1], int(1.1 / FRAME))
+        self.assertFalse(player.playing)
+
+
+if __name__ == '__main__':
+    unittest.main()